@@ -1 +1,392 @@
-# 知识推理 (如路径推理)
\ No newline at end of file
+# 知识推理 (如路径推理)
+# Datalog 风格的前向链推理: 规则是声明式的, 在内存中按谓词建索引的三元组表上做半朴素 (semi-naive) 求值,
+# 推出的事实批量写回图中; 增量加载之后用 DRed (删除-重新推导) 只重新计算受影响的事实
+import hashlib
+import re
+import time
+from collections import defaultdict
+from kg_course_project.graph_db import data_loader
+from kg_course_project.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 规则格式: "规则名: 头(变量, 变量) :- 体1(变量, 变量), 体2(变量, 变量), ..."
+# 谓词即关系类型; 所有项都是变量, 头中的变量必须出现在规则体中
+RULES = [
+    # 传递性 (REQUIRES_PRE 的传递闭包单独物化为 REQUIRES_PRE_CLOSURE, 见 data_loader)
+    "is_a_transitive: IS_A(x, z) :- IS_A(x, y), IS_A(y, z)",
+    "part_of_transitive: PART_OF(x, z) :- PART_OF(x, y), PART_OF(y, z)",
+    "based_on_transitive: BASED_ON(x, z) :- BASED_ON(x, y), BASED_ON(y, z)",
+    # "A 的子概念是 B" 即 B IS_A A
+    "subconcept_is_a: IS_A(y, x) :- SUBCONCEPT(x, y)",
+    # 继承: 下位概念继承上位概念的归属和前置知识, 部分继承整体的归属
+    "belongs_to_inherited: BELONGS_TO(x, z) :- IS_A(x, y), BELONGS_TO(y, z)",
+    "belongs_to_part_of: BELONGS_TO(x, z) :- PART_OF(x, y), BELONGS_TO(y, z)",
+    "requires_pre_inherited: REQUIRES_PRE(x, z) :- IS_A(x, y), REQUIRES_PRE(y, z)",
+]
+
+_ATOM = re.compile(r"(\w+)\(\s*(\w+)\s*,\s*(\w+)\s*\)")
+_RULE = re.compile(r"\s*(\w+)\s*:\s*(.+?)\s*:-\s*(.+?)\s*")
+
+# 推出的事实写回时设置的关系属性
+DERIVED_PROPERTIES = ["inferred", "source", "ruleset"]
+
+# 图中已有的推理结果 (没有 content_hash, 因此不会被 data_loader.compute_delta 当作已删除的抽取结果)
+INFERRED_RELATIONS_QUERY = """
+MATCH (h)-[r]->(t) WHERE r.inferred = true AND r.content_hash IS NULL
+RETURN labels(h)[0] AS head_label, h.name AS head, type(r) AS type,
+       labels(t)[0] AS tail_label, t.name AS tail, r.source AS source, r.ruleset AS ruleset
+"""
+
+# 图中推理结果对应的规则集, 记在 GraphMeta 节点上; 写回推理结果期间清空, 写完后再设置,
+# 因此只有完整写回过的推理结果才会被增量推理信任
+INFERENCE_RULESET_QUERY = """
+MATCH (m:GraphMeta {key: 'graph'})
+RETURN m.inference_ruleset AS ruleset
+"""
+
+SET_INFERENCE_RULESET_QUERY = """
+MERGE (m:GraphMeta {key: 'graph'})
+SET m.inference_ruleset = $ruleset
+"""
+
+
+def neighborhood_query(label):
+    """以 label 节点为端点 (不分方向) 的指定类型的关系, 带上区分基础事实和推理结果所需的属性"""
+    return f"""
+UNWIND $batch AS row
+MATCH (n:{label} {{name: row.name}})-[r]-()
+WHERE type(r) IN $types
+WITH DISTINCT r, startNode(r) AS h, endNode(r) AS t
+RETURN labels(h)[0] AS head_label, h.name AS head, type(r) AS type,
+       labels(t)[0] AS tail_label, t.name AS tail, r.content_hash AS content_hash,
+       r.inferred AS inferred, r.source AS source, r.ruleset AS ruleset
+"""
+
+
+class Rule:
+    """一条规则: head = (主语变量, 谓词, 宾语变量), body = [(主语变量, 谓词, 宾语变量), ...]"""
+
+    def __init__(self, name, head, body):
+        self.name = name
+        self.head = head
+        self.body = body
+        bound = {var for s, _, o in body for var in (s, o)}
+        if not {head[0], head[2]} <= bound:
+            raise ValueError(f"规则 {name} 的头部变量必须出现在规则体中")
+
+    @classmethod
+    def parse(cls, text):
+        match = _RULE.fullmatch(text)
+        if not match:
+            raise ValueError(f"无法解析规则: {text}")
+        name, head, body = match.groups()
+        head_atoms, body_atoms = _ATOM.findall(head), _ATOM.findall(body)
+        if len(head_atoms) != 1 or not body_atoms:
+            raise ValueError(f"规则 {name} 必须有一个头部和至少一个规则体原子: {text}")
+        as_triple = lambda atom: (atom[1], atom[0], atom[2])
+        return cls(name, as_triple(head_atoms[0]), [as_triple(atom) for atom in body_atoms])
+
+    def __repr__(self):
+        fmt = lambda atom: f"{atom[1]}({atom[0]}, {atom[2]})"
+        return f"{self.name}: {fmt(self.head)} :- {', '.join(fmt(atom) for atom in self.body)}"
+
+
+class TripleStore:
+    """按谓词建索引的三元组表: spo[谓词][主语] = {宾语}, pos[谓词][宾语] = {主语}"""
+
+    def __init__(self):
+        self.spo = defaultdict(lambda: defaultdict(set))
+        self.pos = defaultdict(lambda: defaultdict(set))
+        self.size = 0
+
+    def __contains__(self, fact):
+        s, p, o = fact
+        return p in self.spo and o in self.spo[p].get(s, ())
+
+    def __len__(self):
+        return self.size
+
+    def add(self, fact):
+        if fact in self:
+            return False
+        s, p, o = fact
+        self.spo[p][s].add(o)
+        self.pos[p][o].add(s)
+        self.size += 1
+        return True
+
+    def remove(self, fact):
+        if fact not in self:
+            return False
+        s, p, o = fact
+        self.spo[p][s].discard(o)
+        self.pos[p][o].discard(s)
+        self.size -= 1
+        return True
+
+    def match(self, s, p, o):
+        """主语/宾语为 None 表示不限; 生成 (主语, 宾语)"""
+        if s is not None:
+            objects = self.spo[p].get(s, ()) if p in self.spo else ()
+            if o is not None:
+                if o in objects:
+                    yield s, o
+            else:
+                for obj in objects:
+                    yield s, obj
+        elif o is not None:
+            for subj in (self.pos[p].get(o, ()) if p in self.pos else ()):
+                yield subj, o
+        elif p in self.spo:
+            for subj, objects in self.spo[p].items():
+                for obj in objects:
+                    yield subj, obj
+
+
+class InferenceEngine:
+    """
+    前向链推理引擎。事实是 (主语, 谓词, 宾语), 主语和宾语是 (标签, 名称)。
+
+    - materialize(): 半朴素求值, 每一轮只用上一轮新推出的事实 (delta) 去匹配规则体中的一个原子,
+      其余原子在全部事实上匹配, 不会重复做上一轮已经做过的连接
+    - insert(facts) / delete(facts): 基础事实的增量变化; 删除使用 DRed:
+      1. 过度删除: 沿规则传播, 删除所有 (可能) 依赖被删事实的派生事实
+      2. 重新推导: 被过度删除的事实如果还能由剩余事实一步推出, 就恢复它, 再从恢复的事实继续半朴素求值
+    """
+
+    def __init__(self, rules=None):
+        self.rules = [Rule.parse(rule) for rule in (rules or RULES)]
+        self.rules_by_head = defaultdict(list)
+        for rule in self.rules:
+            self.rules_by_head[rule.head[1]].append(rule)
+        self.predicates = {atom[1] for rule in self.rules for atom in [rule.head] + rule.body}
+        self.ruleset = hashlib.sha1("\n".join(map(repr, self.rules)).encode('utf-8')).hexdigest()[:12]
+        self.base = set()
+        self.store = TripleStore()
+        self.derived_by = {}  # 派生事实 -> 规则名
+
+    def load(self, base_facts, derived_facts=None):
+        """
+        :param base_facts: 抽取得到的基础事实
+        :param derived_facts: (可选) 之前推出的事实 {事实: 规则名}, 必须是 base_facts 的完整推理结果
+        """
+        for fact in base_facts:
+            if fact[1] in self.predicates:
+                self.base.add(fact)
+                self.store.add(fact)
+        for fact, rule in (derived_facts or {}).items():
+            if fact not in self.base and self.store.add(fact):
+                self.derived_by[fact] = rule
+
+    # --- 连接 ---
+    def _join(self, atoms, bindings):
+        if not atoms:
+            yield bindings
+            return
+        (s, p, o), rest = atoms[0], atoms[1:]
+        for subj, obj in self.store.match(bindings.get(s), p, bindings.get(o)):
+            if s == o and subj != obj:
+                continue
+            extended = dict(bindings)
+            extended[s], extended[o] = subj, obj
+            yield from self._join(rest, extended)
+
+    def _consequences(self, delta):
+        """以 delta 中的事实匹配规则体中的某一个原子, 生成 (派生事实, 规则名)"""
+        delta_by_predicate = defaultdict(list)
+        for s, p, o in delta:
+            delta_by_predicate[p].append((s, o))
+        for rule in self.rules:
+            hs, hp, ho = rule.head
+            for i, (s, p, o) in enumerate(rule.body):
+                rest = rule.body[:i] + rule.body[i + 1:]
+                for subj, obj in delta_by_predicate.get(p, ()):
+                    if s == o and subj != obj:
+                        continue
+                    for bindings in self._join(rest, {s: subj, o: obj}):
+                        if bindings[hs] != bindings[ho]:  # 不推出自反事实 (环上的传递性)
+                            yield (bindings[hs], hp, bindings[ho]), rule.name
+
+    def _fixpoint(self, delta):
+        """半朴素求值到不动点; delta 中的事实必须已经在 store 中。返回推理轮数"""
+        rounds = 0
+        while delta:
+            rounds += 1
+            produced = {}
+            for fact, rule in self._consequences(delta):
+                if fact not in self.store and fact not in produced:
+                    produced[fact] = rule
+            for fact, rule in produced.items():
+                self.store.add(fact)
+                self.derived_by[fact] = rule
+            delta = list(produced)
+        return rounds
+
+    def _derivation(self, fact):
+        """fact 能否由当前事实一步推出: 返回规则名或 None"""
+        s, p, o = fact
+        for rule in self.rules_by_head.get(p, ()):
+            hs, _, ho = rule.head
+            for bindings in self._join(rule.body, {hs: s, ho: o}):
+                if bindings[hs] != bindings[ho]:  # 与 _consequences 一致, 自反事实不算推导
+                    return rule.name
+        return None
+
+    def materialize(self):
+        """从基础事实全量推理"""
+        return self._fixpoint(list(self.base))
+
+    def insert(self, facts):
+        """新增基础事实并推出它们的后果; 返回新增的派生事实数"""
+        before = len(self.derived_by)
+        delta = []
+        for fact in facts:
+            if fact[1] not in self.predicates or fact in self.base:
+                continue
+            self.base.add(fact)
+            if self.derived_by.pop(fact, None) is None and self.store.add(fact):
+                delta.append(fact)
+        self._fixpoint(delta)
+        return len(self.derived_by) - before
+
+    def delete(self, facts):
+        """删除基础事实 (DRed); 返回最终删除的派生事实数"""
+        removed = [fact for fact in facts if fact in self.base]
+        if not removed:
+            return 0
+        self.base.difference_update(removed)
+        before = set(self.derived_by)
+
+        # 1. 过度删除: 依赖被删事实的派生事实 (传播时 store 中仍保留所有事实)
+        overdeleted, frontier = set(removed), removed
+        while frontier:
+            frontier = [fact for fact, _ in self._consequences(frontier)
+                        if fact in self.derived_by and fact not in overdeleted]
+            overdeleted.update(frontier)
+        for fact in overdeleted:
+            self.store.remove(fact)
+            self.derived_by.pop(fact, None)
+
+        # 2. 重新推导: 仍有其他推导方式的事实恢复, 再从它们继续推理
+        rederived = []
+        for fact in overdeleted:
+            if fact in self.base:
+                continue
+            rule = self._derivation(fact)
+            if rule is not None:
+                rederived.append(fact)
+                self.derived_by[fact] = rule
+        for fact in rederived:
+            self.store.add(fact)
+        self._fixpoint(rederived)
+        return len(before.difference(self.derived_by))
+
+    def derived(self):
+        """{派生事实: 规则名} (不含同时也是基础事实的事实)"""
+        return dict(self.derived_by)
+
+
+def _fact(record):
+    return (record["head_label"], record["head"]), record["type"], (record["tail_label"], record["tail"])
+
+
+def _relation(fact, rule, ruleset):
+    (head_label, head), rel_type, (tail_label, tail) = fact
+    return {"head": head, "head_label": head_label, "type": rel_type, "tail": tail, "tail_label": tail_label,
+            "inferred": True, "source": f"inference:{rule}", "ruleset": ruleset}
+
+
+def infer_relations(relations, rules=None):
+    """由关系列表离线推理 (导出 neo4j-admin CSV 时使用), 返回推出的关系"""
+    engine = InferenceEngine(rules)
+    engine.load(_fact(r) for r in relations)
+    engine.materialize()
+    return [_relation(fact, rule, engine.ruleset) for fact, rule in engine.derived().items()]
+
+
+def _stored_ruleset(conn):
+    records = conn.run_query(INFERENCE_RULESET_QUERY)
+    return records[0]["ruleset"] if records else None
+
+
+def _neighborhood(conn, facts, predicates, batch_size):
+    """
+    读出 facts 的端点所在的连通分量 (只沿 predicates 中的关系, 不分方向) 中的关系。
+    规则体的原子通过共享变量连在一起, 推出的事实与推出它的事实总在同一个连通分量中,
+    因此变化只影响这些分量中的推理结果, 图的其余部分不需要读出。
+
+    :return: (基础事实集合, {推理事实: (source, ruleset)})
+    """
+    base, previous = set(), {}
+    types = sorted(predicates)
+    seen, frontier = set(), {node for s, _, o in facts for node in (s, o)}
+    while frontier:
+        seen |= frontier
+        rows_by_label = defaultdict(list)
+        for label, name in frontier:
+            rows_by_label[label].append({"name": name})
+        frontier = set()
+        for label, rows in rows_by_label.items():
+            query = neighborhood_query(label)
+            for i in range(0, len(rows), batch_size):
+                for record in conn.iter_query(query, {"batch": rows[i:i + batch_size], "types": types}):
+                    fact = _fact(record)
+                    if record["content_hash"] is not None:
+                        base.add(fact)
+                    elif record["inferred"]:
+                        previous[fact] = (record["source"], record["ruleset"])
+                    frontier.update(node for node in (fact[0], fact[2]) if node not in seen)
+    return base, previous
+
+
+def materialize(conn, added_relations=None, removed_relations=None, rules=None, **loader_options):
+    """
+    推理并把结果写回图中 (只写变化的部分)。
+
+    - 传入 added_relations / removed_relations (data_loader.compute_delta 的结果, 图中已经应用了该变化) 时
+      增量推理: 只读出变化涉及的连通分量, 把引擎恢复到变化之前的状态
+      (分量中旧的基础事实 + 已有的推理结果), 再用 DRed 应用变化
+    - 否则, 或者图中的推理结果不是由当前规则集完整写回的, 全量推理
+
+    :param loader_options: 写回时的分批参数 (见 data_loader.loader_options_from_config)
+    :return: {"mode", "derived", "added", "removed"}
+    """
+    start = time.perf_counter()
+    engine = InferenceEngine(rules)
+    incremental = (added_relations is not None and removed_relations is not None
+                   and _stored_ruleset(conn) == engine.ruleset)
+    if incremental:
+        added = {_fact(r) for r in added_relations if r["type"] in engine.predicates}
+        removed = {_fact(r) for r in removed_relations if r["type"] in engine.predicates}
+        batch_size = loader_options.get("batch_size", data_loader.DEFAULT_BATCH_SIZE)
+        base, previous = _neighborhood(conn, added | removed, engine.predicates, batch_size)
+        engine.load((base - added) | removed,
+                    {fact: source.split(":", 1)[-1] for fact, (source, _) in previous.items()})
+        engine.delete(removed)
+        engine.insert(added)
+    else:
+        base = {_fact(r) for r in conn.iter_query(data_loader.LOADED_RELATIONS_QUERY)
+                if r["type"] in engine.predicates}
+        previous = {_fact(r): (r["source"], r["ruleset"]) for r in conn.iter_query(INFERRED_RELATIONS_QUERY)}
+        engine.load(base)
+        engine.materialize()
+
+    derived = engine.derived()
+    upserts = [_relation(fact, rule, engine.ruleset) for fact, rule in derived.items()
+               if previous.get(fact) != (f"inference:{rule}", engine.ruleset)]
+    # 已经成为基础事实的推理结果由抽取结果接管, 不删除
+    removals = [_relation(fact, "", engine.ruleset) for fact in previous
+                if fact not in derived and fact not in base]
+    if upserts or removals:
+        conn.write(SET_INFERENCE_RULESET_QUERY, {"ruleset": None})
+        data_loader.load_derived_relations(conn, upserts, removals, DERIVED_PROPERTIES, **loader_options)
+    if upserts or removals or not incremental:
+        conn.write(SET_INFERENCE_RULESET_QUERY, {"ruleset": engine.ruleset})
+
+    summary = {"mode": "incremental" if incremental else "full", "derived": len(derived),
+               "added": len(upserts), "removed": len(removals)}
+    logger.info(f"[Inference] {'增量' if incremental else '全量'}推理: {len(engine.base)} 个基础事实 -> "
+                f"{summary['derived']} 个推理事实, 写入 {summary['added']}, 删除 {summary['removed']} "
+                f"(用时 {time.perf_counter() - start:.2f}s)")
+    return summary
@@ -0,0 +1,328 @@
+# 知识补全: TransE / DistMult 链接预测 (纯 NumPy, CPU)
+# 在图中抽取得到的三元组上训练实体/关系向量, 为缺失的 REQUIRES_PRE 关系给出候选, 写入文件供人工审核
+import time
+from kg_course_project.graph_db import data_loader
+from kg_course_project.utils.checkpoint import write_jsonl
+from kg_course_project.utils.logger import get_logger
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = get_logger(__name__)
+
+MODELS = ("transe", "distmult")
+SUGGESTED_TYPE = "REQUIRES_PRE"
+
+
+def _require_numpy():
+    if not NUMPY_AVAILABLE:
+        raise ImportError("链接预测需要 numpy: pip install numpy")
+
+
+class TripleIndex:
+    """实体 ((标签, 名称)) 和关系类型的编号, 以及编号后的三元组数组 (m x 3: 头, 关系, 尾)"""
+
+    def __init__(self, relations):
+        """:param relations: 可迭代的 {head_label, head, type, tail_label, tail}"""
+        _require_numpy()
+        self.entities, self.entity_index = [], {}
+        self.relations, self.relation_index = [], {}
+        triples = set()
+        for r in relations:
+            triples.add((self._id(self.entities, self.entity_index, (r["head_label"], r["head"])),
+                         self._id(self.relations, self.relation_index, r["type"]),
+                         self._id(self.entities, self.entity_index, (r["tail_label"], r["tail"]))))
+        self.triples = np.array(sorted(triples), dtype=np.int64).reshape(-1, 3)
+
+    @staticmethod
+    def _id(names, index, key):
+        i = index.get(key)
+        if i is None:
+            i = index[key] = len(names)
+            names.append(key)
+        return i
+
+    @classmethod
+    def from_connection(cls, conn):
+        """只使用抽取得到的关系 (有 content_hash), 推理结果和闭包会泄露训练目标, 不参与训练"""
+        return cls(conn.iter_query(data_loader.LOADED_RELATIONS_QUERY))
+
+    def split(self, test_ratio=0.1, seed=0):
+        """随机划分训练/测试三元组; 只在测试集中出现的实体无法评估, 放回训练集"""
+        rng = np.random.default_rng(seed)
+        order = rng.permutation(len(self.triples))
+        n_test = int(len(order) * test_ratio)
+        test, train = self.triples[order[:n_test]], self.triples[order[n_test:]]
+        seen = np.zeros(len(self.entities), dtype=bool)
+        seen[train[:, 0]] = seen[train[:, 2]] = True
+        evaluable = seen[test[:, 0]] & seen[test[:, 2]]
+        return np.concatenate([train, test[~evaluable]]), test[evaluable]
+
+
+class KGEmbedding:
+    """
+    TransE: score(h, r, t) = -||h + r - t||
+    DistMult: score(h, r, t) = sum(h * r * t)
+
+    训练: 间隔排序损失 max(0, margin - score(正例) + score(负例)), 小批量 SGD (Adagrad 步长);
+    每个正例随机替换头或尾生成 negatives 个负例, 整批的采样、打分和梯度都是数组运算,
+    同一实体在一批中出现多次时, 梯度先按行合并再更新。
+    """
+
+    def __init__(self, num_entities, num_relations, dim=64, model="transe", margin=1.0, learning_rate=0.05,
+                 seed=0):
+        _require_numpy()
+        if model not in MODELS:
+            raise ValueError(f"未知的模型 '{model}', 可选: {MODELS}")
+        self.model = model
+        self.margin = margin
+        self.learning_rate = learning_rate
+        self.rng = np.random.default_rng(seed)
+        bound = 6.0 / np.sqrt(dim)
+        self.entity = self.rng.uniform(-bound, bound, (num_entities, dim)).astype(np.float32)
+        self.relation = self.rng.uniform(-bound, bound, (num_relations, dim)).astype(np.float32)
+        self.relation /= np.linalg.norm(self.relation, axis=1, keepdims=True)
+        self._normalize_entities()
+        self._entity_g2 = np.zeros_like(self.entity)
+        self._relation_g2 = np.zeros_like(self.relation)
+
+    def _normalize_entities(self):
+        self.entity /= np.maximum(np.linalg.norm(self.entity, axis=1, keepdims=True), 1e-12)
+
+    # --- 打分 ---
+    def score(self, heads, rels, tails):
+        h, r, t = self.entity[heads], self.relation[rels], self.entity[tails]
+        if self.model == "transe":
+            return -np.linalg.norm(h + r - t, axis=-1)
+        return np.sum(h * r * t, axis=-1)
+
+    def _score_grads(self, h, r, t):
+        """score 对 h, r, t 的梯度"""
+        if self.model == "transe":
+            diff = h + r - t
+            unit = diff / np.maximum(np.linalg.norm(diff, axis=-1, keepdims=True), 1e-12)
+            return -unit, -unit, unit
+        return r * t, h * t, h * r
+
+    def score_tails(self, heads, rels):
+        """对所有候选尾实体打分: (batch x 实体数), 一次矩阵乘法"""
+        query = self.entity[heads] + self.relation[rels] if self.model == "transe" \
+            else self.entity[heads] * self.relation[rels]
+        return self._score_all(query)
+
+    def score_heads(self, rels, tails):
+        query = self.entity[tails] - self.relation[rels] if self.model == "transe" \
+            else self.relation[rels] * self.entity[tails]
+        return self._score_all(query)
+
+    def _score_all(self, query):
+        products = query @ self.entity.T
+        if self.model == "distmult":
+            return products
+        # ||q - e||^2 = ||q||^2 - 2 q·e + ||e||^2 (与 -||q - e|| 排序相同)
+        squared = (np.sum(query * query, axis=1, keepdims=True) - 2 * products
+                   + np.sum(self.entity * self.entity, axis=1)[None, :])
+        return -np.sqrt(np.maximum(squared, 0.0))
+
+    # --- 训练 ---
+    def _negatives(self, batch, negatives):
+        """整批向量化负采样: 每个正例复制 negatives 份, 随机一半替换头、一半替换尾"""
+        corrupted = np.repeat(batch, negatives, axis=0)
+        replace_head = self.rng.random(len(corrupted)) < 0.5
+        random_entities = self.rng.integers(0, len(self.entity), len(corrupted))
+        corrupted[replace_head, 0] = random_entities[replace_head]
+        corrupted[~replace_head, 2] = random_entities[~replace_head]
+        return corrupted
+
+    def _adagrad(self, table, g2, index, grad):
+        """先按行合并梯度 (排序 + reduceat, 比 np.add.at 快得多), 再对涉及的行做一次 Adagrad 更新"""
+        order = np.argsort(index, kind="stable")
+        rows, starts = np.unique(index[order], return_index=True)
+        summed = np.add.reduceat(grad[order], starts, axis=0)
+        g2[rows] += summed * summed
+        table[rows] -= self.learning_rate * summed / np.sqrt(g2[rows] + 1e-8)
+
+    def train_batch(self, batch, negatives=8):
+        """:return: 该批的平均损失"""
+        positives = np.repeat(batch, negatives, axis=0)
+        corrupted = self._negatives(batch, negatives)
+        pos_h, pos_r, pos_t = (self.entity[positives[:, 0]], self.relation[positives[:, 1]],
+                               self.entity[positives[:, 2]])
+        neg_h, neg_r, neg_t = (self.entity[corrupted[:, 0]], self.relation[corrupted[:, 1]],
+                               self.entity[corrupted[:, 2]])
+        if self.model == "transe":
+            pos_score = -np.linalg.norm(pos_h + pos_r - pos_t, axis=1)
+            neg_score = -np.linalg.norm(neg_h + neg_r - neg_t, axis=1)
+        else:
+            pos_score = np.sum(pos_h * pos_r * pos_t, axis=1)
+            neg_score = np.sum(neg_h * neg_r * neg_t, axis=1)
+        loss = np.maximum(self.margin - pos_score + neg_score, 0.0)
+        active = loss > 0
+        if not active.any():
+            return 0.0
+
+        # dL/d(score 正例) = -1, dL/d(score 负例) = +1 (只对损失 > 0 的样本)
+        sign = active[:, None].astype(np.float32)
+        ph, pr, pt = self._score_grads(pos_h, pos_r, pos_t)
+        nh, nr, nt = self._score_grads(neg_h, neg_r, neg_t)
+        entity_index = np.concatenate([positives[:, 0], positives[:, 2], corrupted[:, 0], corrupted[:, 2]])
+        entity_grad = np.concatenate([-ph * sign, -pt * sign, nh * sign, nt * sign])
+        relation_index = np.concatenate([positives[:, 1], corrupted[:, 1]])
+        relation_grad = np.concatenate([-pr * sign, nr * sign])
+        self._adagrad(self.entity, self._entity_g2, entity_index, entity_grad)
+        self._adagrad(self.relation, self._relation_g2, relation_index, relation_grad)
+        return float(loss.mean())
+
+    def fit(self, triples, epochs=100, batch_size=256, negatives=8, log_every=20):
+        start = time.perf_counter()
+        for epoch in range(1, epochs + 1):
+            order = self.rng.permutation(len(triples))
+            losses = [self.train_batch(triples[order[i:i + batch_size]], negatives)
+                      for i in range(0, len(order), batch_size)]
+            self._normalize_entities()
+            if log_every and (epoch % log_every == 0 or epoch == epochs):
+                logger.info(f"[LinkPrediction] epoch {epoch}/{epochs}, loss {np.mean(losses):.4f}")
+        seconds = time.perf_counter() - start
+        logger.info(f"[LinkPrediction] {self.model} 训练完成: {len(triples)} 个三元组 x {epochs} 轮, "
+                    f"用时 {seconds:.1f}s ({len(triples) * epochs / max(seconds, 1e-9):.0f} triples/s)")
+        return self
+
+
+def _known_answers(triples):
+    """{(h, r): [t, ...]} 和 {(r, t): [h, ...]}, 用于过滤式评估"""
+    tails, heads = {}, {}
+    for h, r, t in triples.tolist():
+        tails.setdefault((h, r), []).append(t)
+        heads.setdefault((r, t), []).append(h)
+    return tails, heads
+
+
+def _filtered_ranks(scores, targets, known_lists):
+    """过滤式排名: 其他已知的正确答案不参与排名"""
+    target_scores = scores[np.arange(len(targets)), targets]
+    rows = np.repeat(np.arange(len(targets)), [len(k) for k in known_lists])
+    cols = np.fromiter((c for k in known_lists for c in k), dtype=np.int64, count=len(rows))
+    scores[rows, cols] = -np.inf
+    return 1 + np.sum(scores > target_scores[:, None], axis=1)
+
+
+def evaluate(model, test, all_triples, batch_size=512, hits_at=10):
+    """
+    过滤式 MRR 和 Hits@k, 头/尾预测各算一次后取平均。
+    :param all_triples: 全部已知三元组 (训练 + 测试), 用于过滤
+    """
+    if len(test) == 0:
+        return {"mrr": None, f"hits@{hits_at}": None, "triples": 0}
+    known_tails, known_heads = _known_answers(all_triples)
+    ranks = []
+    for i in range(0, len(test), batch_size):
+        batch = test[i:i + batch_size]
+        h, r, t = batch[:, 0], batch[:, 1], batch[:, 2]
+        tail_known = [known_tails[key] for key in zip(h.tolist(), r.tolist())]
+        head_known = [known_heads[key] for key in zip(r.tolist(), t.tolist())]
+        ranks.append(_filtered_ranks(model.score_tails(h, r), t, tail_known))
+        ranks.append(_filtered_ranks(model.score_heads(r, t), h, head_known))
+    ranks = np.concatenate(ranks).astype(np.float64)
+    return {"mrr": float(np.mean(1.0 / ranks)), f"hits@{hits_at}": float(np.mean(ranks <= hits_at)),
+            "triples": int(len(test))}
+
+
+def suggest_relations(model, index, rel_type=SUGGESTED_TYPE, label="Concept", top_k=5, batch_size=512,
+                      exclude=()):
+    """
+    为每个 label 实体预测 rel_type 的尾实体 (只在 label 实体中选), 去掉已有的关系、反向关系和自环。
+    confidence: 候选得分在所有已知 rel_type 三元组得分中的分位数 (0~1, 越高越像真实关系)。
+    :param exclude: 额外排除的 (头名称, 尾名称), 例如已经物化的闭包
+    :return: [{head, tail, score, confidence, ...}, ...], 按得分降序
+    """
+    rel = index.relation_index.get(rel_type)
+    if rel is None:
+        return []
+    candidates = np.array([i for i, (l, _) in enumerate(index.entities) if l == label], dtype=np.int64)
+    if len(candidates) < 2:
+        return []
+    known = index.triples[index.triples[:, 1] == rel]
+    reference = np.sort(model.score(known[:, 0], known[:, 1], known[:, 2]))
+
+    # 不作为候选的 (头列, 尾列): 自环、已有的关系、反向已存在 (会形成前置环) 的关系、exclude
+    column = {entity: c for c, entity in enumerate(candidates.tolist())}
+    name_column = {index.entities[entity][1]: c for entity, c in column.items()}
+    blocked = [(c, c) for c in range(len(candidates))]
+    for h, _, t in known.tolist():
+        if h in column and t in column:
+            blocked += [(column[h], column[t]), (column[t], column[h])]
+    for head_name, tail_name in exclude:
+        if head_name in name_column and tail_name in name_column:
+            blocked += [(name_column[head_name], name_column[tail_name]),
+                        (name_column[tail_name], name_column[head_name])]
+    blocked = np.array(blocked, dtype=np.int64)
+
+    suggestions = []
+    k = min(top_k, len(candidates) - 1)
+    for i in range(0, len(candidates), batch_size):
+        heads = candidates[i:i + batch_size]
+        scores = model.score_tails(heads, np.full(len(heads), rel))[:, candidates]
+        in_batch = (blocked[:, 0] >= i) & (blocked[:, 0] < i + len(heads))
+        scores[blocked[in_batch, 0] - i, blocked[in_batch, 1]] = -np.inf
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        for row, head in enumerate(heads.tolist()):
+            for c in top[row].tolist():
+                score = float(scores[row, c])
+                if not np.isfinite(score):
+                    continue
+                suggestions.append({
+                    "head": index.entities[head][1], "head_label": label, "type": rel_type,
+                    "tail": index.entities[int(candidates[c])][1], "tail_label": label,
+                    "score": score,
+                    "confidence": float(np.searchsorted(reference, score, side="right") / max(len(reference), 1)),
+                    "source": f"link_prediction:{model.model}",
+                })
+    suggestions.sort(key=lambda s: -s["score"])
+    return suggestions
+
+
+def run_link_prediction(conn, config):
+    """训练、评估并把 REQUIRES_PRE 候选写入 [LINK_PREDICTION] SUGGESTIONS_FILE (JSONL) 供审核"""
+    section = 'LINK_PREDICTION'
+    index = TripleIndex.from_connection(conn)
+    if len(index.triples) == 0:
+        logger.warning("[LinkPrediction] 图中没有可训练的三元组, 请先运行 run_pipeline.py")
+        return None
+    train, test = index.split(config.getfloat(section, 'TEST_RATIO', fallback=0.1))
+    model = KGEmbedding(len(index.entities), len(index.relations),
+                        dim=config.getint(section, 'DIM', fallback=64),
+                        model=config.get(section, 'MODEL', fallback='transe'),
+                        margin=config.getfloat(section, 'MARGIN', fallback=1.0),
+                        learning_rate=config.getfloat(section, 'LEARNING_RATE', fallback=0.05))
+    model.fit(train, epochs=config.getint(section, 'EPOCHS', fallback=100),
+              batch_size=config.getint(section, 'BATCH_SIZE', fallback=256),
+              negatives=config.getint(section, 'NEGATIVES', fallback=8))
+    metrics = evaluate(model, test, index.triples)
+    logger.info(f"[LinkPrediction] 过滤式评估 ({metrics['triples']} 个测试三元组): "
+                f"MRR {metrics['mrr']}, Hits@10 {metrics['hits@10']}")
+
+    # 已有的关系 (包括测试集) 和已物化的闭包 (间接前置) 不再作为候选
+    closure = {(r["head"], r["tail"]) for r in conn.iter_query(data_loader.CLOSURE_EDGES_QUERY)}
+    suggestions = suggest_relations(model, index, top_k=config.getint(section, 'TOP_K', fallback=5),
+                                    exclude=closure)
+    path = config.get(section, 'SUGGESTIONS_FILE', fallback='./data/processed/suggested_requires_pre.jsonl')
+    write_jsonl(path, suggestions, {"model": model.model, "metrics": metrics, "created_at": int(time.time() * 1000)})
+    logger.info(f"[LinkPrediction] {len(suggestions)} 条 {SUGGESTED_TYPE} 候选已写入 {path}, 请人工审核")
+    return {"metrics": metrics, "suggestions": len(suggestions), "path": path}
+
+
+if __name__ == "__main__":
+    # 在项目根目录运行: python -m kg_course_project.applications.link_prediction
+    import configparser
+    from kg_course_project.graph_db.connection import create_connection
+
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    conn = create_connection(config)
+    try:
+        run_link_prediction(conn, config)
+    finally:
+        conn.close()
@@ -0,0 +1,209 @@
+# 进程内的前置知识 DAG: 拓扑序 + 祖先位集, 在应用进程中直接回答前置知识查询
+import threading
+import time
+from collections import deque
+from kg_course_project.graph_db import graph_version
+from kg_course_project.graph_db.data_loader import PREREQUISITE_EDGES_QUERY
+from kg_course_project.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class PrerequisiteDAG:
+    """
+    REQUIRES_PRE 子图的只读索引。
+
+    - 节点编号为 0..n-1, prereqs[i] 是 i 的直接前置知识
+    - topo_order: 前置知识总是排在依赖它的知识点之前 (即推荐的学习顺序)
+    - ancestors[i]: 用 Python 整数表示的位集, 第 j 位为 1 表示 j 是 i 的 (直接或间接) 前置知识;
+      按拓扑序一次遍历即可算出: ancestors[i] = OR(1 << p | ancestors[p])
+    环上的节点 (数据错误) 无法排进拓扑序, 对它们单独做 BFS。
+    """
+
+    def __init__(self, edges, version=None):
+        """
+        :param edges: 可迭代的 (head, tail), 表示 head REQUIRES_PRE tail
+        :param version: 构建时的图版本号
+        """
+        self.version = version
+        self.names = []
+        self.index = {}
+        self.prereqs = []
+        for head, tail in edges:
+            h, t = self._node(head), self._node(tail)
+            if t not in self.prereqs[h]:
+                self.prereqs[h].append(t)
+
+        n = len(self.names)
+        # Kahn 算法: 入度 = 尚未处理的前置知识数
+        dependents = [[] for _ in range(n)]
+        remaining = [len(p) for p in self.prereqs]
+        for i, prereqs in enumerate(self.prereqs):
+            for p in prereqs:
+                dependents[p].append(i)
+        queue = deque(i for i in range(n) if remaining[i] == 0)
+        self.topo_order = []
+        while queue:
+            i = queue.popleft()
+            self.topo_order.append(i)
+            for d in dependents[i]:
+                remaining[d] -= 1
+                if remaining[d] == 0:
+                    queue.append(d)
+
+        self.ancestors = [0] * n
+        for i in self.topo_order:
+            bits = 0
+            for p in self.prereqs[i]:
+                bits |= (1 << p) | self.ancestors[p]
+            self.ancestors[i] = bits
+
+        cyclic = [i for i in range(n) if remaining[i] > 0]
+        if cyclic:
+            logger.warning(f"[PrerequisiteDAG] {len(cyclic)} 个知识点处于 REQUIRES_PRE 环中或依赖环, "
+                           f"例如 {self.names[cyclic[0]]}")
+            for i in cyclic:
+                self.ancestors[i] = sum(1 << j for j in self._bfs(i))
+            self.topo_order.extend(cyclic)
+        self.position = [0] * n
+        for pos, i in enumerate(self.topo_order):
+            self.position[i] = pos
+
+    def _node(self, name):
+        i = self.index.get(name)
+        if i is None:
+            i = self.index[name] = len(self.names)
+            self.names.append(name)
+            self.prereqs.append([])
+        return i
+
+    def _bfs(self, start, max_depth=None):
+        """{前置知识编号: 最短距离}, 按距离由近到远"""
+        depths = {start: 0}
+        queue = deque([start])
+        while queue:
+            i = queue.popleft()
+            depth = depths[i] + 1
+            if max_depth is not None and depth > max_depth:
+                continue
+            for p in self.prereqs[i]:
+                if p not in depths:
+                    depths[p] = depth
+                    queue.append(p)
+        del depths[start]
+        return depths
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.names)
+
+    def prerequisites(self, name, max_depth=None, with_depth=False):
+        """
+        与 qa_system.find_prerequisites 的结果相同 (按 (距离, 名称) 排序)。
+        :return: 前置知识列表; 知识点不在 DAG 中时返回 None
+        """
+        i = self.index.get(name)
+        if i is None:
+            return None
+        found = sorted((depth, self.names[j]) for j, depth in self._bfs(i, max_depth).items())
+        return [(n, d) for d, n in found] if with_depth else [n for _, n in found]
+
+    def is_prerequisite(self, name, candidate):
+        """candidate 是否是 name 的 (直接或间接) 前置知识: 一次位运算"""
+        i, j = self.index.get(name), self.index.get(candidate)
+        return i is not None and j is not None and bool(self.ancestors[i] >> j & 1)
+
+    def learning_path(self, name):
+        """学习 name 之前需要依次学习的知识点 (按拓扑序); 知识点不在 DAG 中时返回 None"""
+        i = self.index.get(name)
+        if i is None:
+            return None
+        bits = self.ancestors[i]
+        members = []
+        while bits:
+            low = bits & -bits
+            members.append(low.bit_length() - 1)
+            bits ^= low
+        return [self.names[j] for j in sorted(members, key=self.position.__getitem__)]
+
+    @classmethod
+    def from_connection(cls, conn):
+        version = graph_version.get_graph_version(conn)
+        return cls(((r["head"], r["tail"]) for r in conn.iter_query(PREREQUISITE_EDGES_QUERY)), version)
+
+    @classmethod
+    def from_snapshot(cls, graph):
+        """从 CSR 图快照 (csr_snapshot.CSRGraph) 构建, 不访问数据库"""
+        edges = []
+        for node in range(graph.num_nodes):
+            if graph.label(node) != "Concept":
+                continue
+            for tail in graph.successors(node, "REQUIRES_PRE").tolist():
+                if graph.label(tail) == "Concept":
+                    edges.append((graph.name(node), graph.name(tail)))
+        return cls(edges, graph.graph_version)
+
+
+class PrerequisiteIndex:
+    """
+    持有当前的 PrerequisiteDAG, 并在后台线程中每隔 refresh_interval 秒检查图版本号,
+    版本变化时重新构建 (构建完成后整体替换引用, 请求线程不需要加锁)。
+
+    构建来源: 图版本号一致的 CSR 快照 (无数据库往返), 否则直接从数据库读取 REQUIRES_PRE 关系。
+    """
+
+    def __init__(self, conn, snapshot_reader=None, refresh_interval=30.0):
+        self.conn = conn
+        self.snapshot_reader = snapshot_reader
+        self.refresh_interval = refresh_interval
+        self.dag = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _build(self, version):
+        graph = self.snapshot_reader.get() if self.snapshot_reader is not None else None
+        start = time.perf_counter()
+        if graph is not None and graph.graph_version == version:
+            dag, source = PrerequisiteDAG.from_snapshot(graph), "CSR 快照"
+        else:
+            dag, source = PrerequisiteDAG.from_connection(self.conn), "数据库"
+        logger.info(f"[PrerequisiteDAG] 已从{source}构建: {len(dag)} 个知识点 "
+                    f"(图版本 {dag.version}, 用时 {(time.perf_counter() - start) * 1000:.1f}ms)")
+        return dag
+
+    def refresh(self):
+        """图版本号变化 (或尚未构建) 时重新构建; 返回是否重建"""
+        version = graph_version.get_graph_version(self.conn)
+        if self.dag is not None and self.dag.version == version:
+            return False
+        self.dag = self._build(version)
+        return True
+
+    def start(self):
+        """同步构建一次, 然后启动后台刷新线程"""
+        self.refresh()
+        if self.refresh_interval and self.refresh_interval > 0:
+            self._thread = threading.Thread(target=self._run, name="prerequisite-dag", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"[PrerequisiteDAG] 刷新失败, 继续使用旧版本: {e}")
+
+    def prerequisites(self, name, max_depth=None, with_depth=False):
+        """DAG 中没有该知识点 (或还没有构建) 时返回 None, 调用方回退到数据库"""
+        dag = self.dag
+        return dag.prerequisites(name, max_depth, with_depth) if dag is not None else None
+
+    def learning_path(self, name):
+        dag = self.dag
+        return dag.learning_path(name) if dag is not None else None
@@ -1,20 +1,106 @@
 # 智能问答 (NLU + Cypher)
-def find_prerequisites(conn, concept_name):
+import functools
+from kg_course_project.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 读取加载时预计算的闭包 (data_loader.load_prerequisite_closure), 每个前置知识恰好一行,
+# depth 为最短距离; 不再使用 REQUIRES_PRE* 变长匹配 (路径数指数增长, 还需要在 Python 中去重)
+PREREQUISITES_QUERY = """
+MATCH (c:Concept {name: $name})-[r:REQUIRES_PRE_CLOSURE]->(pre:Concept)
+WHERE $max_depth IS NULL OR r.depth <= $max_depth
+RETURN pre.name AS prerequisite, r.depth AS depth
+ORDER BY depth, prerequisite
+"""
+
+# 批量形式: 一次往返查询多个知识点, 结果按知识点分组 (见 find_prerequisites_batch)
+PREREQUISITES_BATCH_QUERY = """
+UNWIND $names AS name
+MATCH (c:Concept {name: name})-[r:REQUIRES_PRE_CLOSURE]->(pre:Concept)
+WHERE $max_depth IS NULL OR r.depth <= $max_depth
+RETURN name, pre.name AS prerequisite, r.depth AS depth
+ORDER BY name, depth, prerequisite
+"""
+
+
+
+def _prerequisites(results, with_depth):
+    if with_depth:
+        return [(record["prerequisite"], record["depth"]) for record in results]
+    return [record["prerequisite"] for record in results]
+
+
+def find_prerequisites(conn, concept_name, max_depth=None, with_depth=False):
     """
     (应用) 智能问答：查询一个知识点的前置知识
 
-    我们利用图的递归查询能力，查找所有（直接和间接）的前置知识。
+    查找所有（直接和间接）的前置知识，按距离由近到远排序。
+    :param max_depth: 只返回距离不超过 max_depth 的前置知识 (1 表示只要直接前置)
+    :param with_depth: True 时返回 [(前置知识, 距离), ...]
+    """
+    try:
+        results = conn.read(PREREQUISITES_QUERY, parameters={"name": concept_name, "max_depth": max_depth})
+        return _prerequisites(results, with_depth)
+    except Exception as e:
+        logger.warning(f"[QA] 查询错误 ({concept_name}): {e}")
+        return []
+
+
+def find_prerequisites_batch(conn, concept_names, max_depth=None, with_depth=False):
     """
-    # REQUIRES_PRE* 查找 1 层或多层的前置关系
-    query = """
-    MATCH (c:Concept {name: $name})-[r:REQUIRES_PRE*]->(pre:Concept)
-    RETURN pre.name AS prerequisite
+    一次查询多个知识点的前置知识: 所有名称作为列表参数传给 PREREQUISITES_BATCH_QUERY (UNWIND),
+    只有一次数据库往返, 与知识点数量无关。
+    :return: {知识点: [前置知识, ...]}, 每个 (去重后的) 输入名称都有一项, 不存在的知识点为空列表
     """
+    names = list(dict.fromkeys(concept_names))
+    answers = {name: [] for name in names}
+    if not names:
+        return answers
+    try:
+        results = conn.read(PREREQUISITES_BATCH_QUERY, parameters={"names": names, "max_depth": max_depth})
+    except Exception as e:
+        logger.warning(f"[QA] 批量查询错误 ({len(names)} 个知识点): {e}")
+        return answers
+    for record in results:
+        answers[record["name"]].append(
+            (record["prerequisite"], record["depth"]) if with_depth else record["prerequisite"])
+    return answers
+
+
+# --- 意图 -> 参数化 Cypher 计划 (问句解析见 question_parser) ---
+# 意图: (实体在关系中的位置 out=起点 / in=终点, 关系类型, 答案节点的标签)
+INTENT_PLANS = {
+    "dependents": ("in", "REQUIRES_PRE", "Concept"),
+    "chapter_concepts": ("out", "INCLUDES_CONCEPT", "Concept"),
+    "concept_chapter": ("in", "INCLUDES_CONCEPT", "Chapter"),
+    "algorithms": ("out", "APPLIES_ALGO", "Algorithm"),
+    "technologies": ("out", "USES_TECH", "Technology"),
+}
+
+
+@functools.lru_cache(maxsize=256)
+def plan_for(intent, label):
+    """
+    按意图签名 (意图, 实体标签) 生成 Cypher 并缓存。
+    标签和关系类型不能作为参数, 所以每个签名一条查询; 实体名始终是参数 $name,
+    同一签名的所有问题共用同一条查询文本 (数据库端的执行计划缓存也能命中)。
+    """
+    if intent == "prerequisites":
+        return PREREQUISITES_QUERY
+    direction, rel_type, other_label = INTENT_PLANS[intent]
+    if direction == "out":
+        return (f"MATCH (a:{label} {{name: $name}})-[r:{rel_type}]->(b:{other_label}) "
+                f"RETURN b.name AS answer ORDER BY answer")
+    return (f"MATCH (b:{other_label})-[r:{rel_type}]->(a:{label} {{name: $name}}) "
+            f"RETURN b.name AS answer ORDER BY answer")
+
 
+def execute_plan(conn, intent, label, name, max_depth=None):
+    """执行意图对应的计划, 返回答案列表 (前置知识按距离排序, 其他按名称排序)"""
+    if intent == "prerequisites":
+        return find_prerequisites(conn, name, max_depth=max_depth)
     try:
-        results = conn.run_query(query, parameters={"name": concept_name})
-        prereqs = [record["prerequisite"] for record in results]
-        return list(set(prereqs))  # 去重
+        return [record["answer"] for record in conn.read(plan_for(intent, label), parameters={"name": name})]
     except Exception as e:
-        print(f"QA 查询错误: {e}")
-        return []
\ No newline at end of file
+        logger.warning(f"[QA] 查询错误 ({intent}, {name}): {e}")
+        return []
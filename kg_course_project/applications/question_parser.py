@@ -0,0 +1,182 @@
+# 问句理解: 实体链接 (Aho-Corasick 自动机) + 意图识别 (预编译的模板)
+# 解析结果的意图签名 (意图, 实体标签) 对应 qa_system.plan_for 缓存的参数化 Cypher 计划
+import re
+import time
+from collections import deque
+from kg_course_project.graph_db import csr_snapshot
+from kg_course_project.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 实体在问句中的占位符: 意图模板匹配的是替换掉实体之后的问句, 实体名中的字不会误触发意图
+ENTITY_PLACEHOLDER = "#"
+
+# (意图, 触发模板, 实体可以是的标签, 回答模板, 没有答案时的回答), 按优先级排列, 第一个匹配的意图生效
+INTENTS = [
+    ("dependents", r"学完#|#之后|#的后续|哪些\S*(?:需要|依赖|基于)#|依赖#",
+     ("Concept",), "学完 '{entity}' 之后可以学习: {items}", "没有找到依赖 '{entity}' 的知识点。"),
+    ("learning_path", r"学习路径|学习顺序|怎么学|如何学|按什么顺序",
+     ("Concept",), "学习 '{entity}' 的推荐顺序: {items}", "'{entity}' 没有需要先学习的知识点。"),
+    ("prerequisites", r"前置|先修|先学|基础|需要(?:先)?(?:学|掌握|了解|具备)?(?:哪些|什么)|prerequisite",
+     ("Concept",), "学习 '{entity}' 的前置知识包括: {items}", "未找到 '{entity}' 的前置知识，或该概念不存在。"),
+    ("concept_chapter", r"哪一?章|哪个章节|在哪|属于哪",
+     ("Concept",), "'{entity}' 出现在: {items}", "没有找到包含 '{entity}' 的章节。"),
+    ("chapter_concepts", r"包含|包括|讲了|讲什么|讲的|哪些(?:概念|知识点|内容)|内容",
+     ("Chapter",), "'{entity}' 包含的概念有: {items}", "'{entity}' 中没有找到概念。"),
+    ("algorithms", r"算法|algorithm",
+     ("Concept",), "'{entity}' 使用的算法: {items}", "没有找到 '{entity}' 使用的算法。"),
+    ("technologies", r"技术|工具|框架|technolog|tool",
+     ("Concept",), "'{entity}' 使用的技术: {items}", "没有找到 '{entity}' 使用的技术。"),
+]
+# 问句中只有实体、没有匹配到任何模板时, 按实体标签选择默认意图
+DEFAULT_INTENTS = {"Concept": "prerequisites", "Chapter": "chapter_concepts"}
+
+_LATIN = re.compile(r"[a-z0-9]")
+
+
+class AhoCorasick:
+    """
+    多模式串匹配自动机: 一次扫描问句即可找出所有出现的节点名称, 与名称数量无关。
+    goto[状态][字符] -> 状态, fail[状态] 为失配指针, output[状态] 为在此结束的 (模式长度, 值)。
+    """
+
+    def __init__(self, patterns):
+        """:param patterns: 可迭代的 (模式串, 值)"""
+        self.goto, self.fail, self.output = [{}], [0], [[]]
+        for pattern, value in patterns:
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                nxt = self.goto[state].get(char)
+                if nxt is None:
+                    nxt = self.goto[state][char] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = nxt
+            self.output[state].append((len(pattern), value))
+
+        # BFS 计算失配指针, 并把失配状态的输出并入当前状态
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(char, 0)
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def __len__(self):
+        return len(self.goto)
+
+    def iter_matches(self, text):
+        """生成 (起始位置, 结束位置, 值)"""
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, value in output[state]:
+                yield i - length + 1, i + 1, value
+
+
+class QuestionParser:
+    """
+    - 实体链接: 所有节点名称 (小写) 编译成 Aho-Corasick 自动机; 重叠的匹配取最左最长,
+      英文名称要求两侧不是字母/数字 (RDF 不会匹配到 RDFS 里)
+    - 意图识别: 实体替换为占位符后, 按优先级匹配预编译的意图模板
+    随图版本号重建 (见 run_app.get_derived_index)。
+    """
+
+    def __init__(self, nodes, version=None, intents=None):
+        """:param nodes: 可迭代的 (label, name)"""
+        start = time.perf_counter()
+        self.version = version
+        self.intents = [(name, re.compile(pattern, re.IGNORECASE), set(labels), answer, empty)
+                        for name, pattern, labels, answer, empty in (intents or INTENTS)]
+        self.templates = {name: (answer, empty) for name, _, _, answer, empty in self.intents}
+        candidates = {}
+        for label, name in nodes:
+            if name:
+                candidates.setdefault(name.lower(), []).append((label, name))
+        self.automaton = AhoCorasick(candidates.items())
+        logger.info(f"[QA] 实体链接自动机已构建: {len(candidates)} 个名称, {len(self.automaton)} 个状态 "
+                    f"(图版本 {version}, 用时 {(time.perf_counter() - start) * 1000:.1f}ms)")
+
+    @classmethod
+    def from_snapshot(cls, graph):
+        """从 CSR 图快照 (csr_snapshot.CSRGraph) 构建, 不访问数据库"""
+        return cls([(graph.label(i), graph.name(i)) for i in range(graph.num_nodes)], graph.graph_version)
+
+    @classmethod
+    def from_connection(cls, conn, version=None):
+        return cls([(r["label"], r["name"]) for r in conn.iter_query(csr_snapshot.SNAPSHOT_NODES_QUERY)], version)
+
+    def link_entities(self, question):
+        """:return: [(起始位置, 结束位置, [(label, name), ...]), ...], 不重叠, 按位置排序"""
+        text = question.lower()
+        matches = []
+        for start, end, candidates in self.automaton.iter_matches(text):
+            # 英文名称不能是更长单词的一部分
+            if (_LATIN.match(text[start]) and start > 0 and _LATIN.match(text[start - 1])) or \
+                    (_LATIN.match(text[end - 1]) and end < len(text) and _LATIN.match(text[end])):
+                continue
+            matches.append((start, end, candidates))
+        matches.sort(key=lambda m: (m[0], m[0] - m[1]))
+        linked, covered = [], 0
+        for start, end, candidates in matches:
+            if start >= covered:
+                linked.append((start, end, candidates))
+                covered = end
+        return linked
+
+    def parse(self, question):
+        """
+        :return: {"intent", "entity", "label", "mentions", "signature"};
+                 没有识别出实体时 intent 和 entity 为 None
+        """
+        mentions = self.link_entities(question)
+        result = {"intent": None, "entity": None, "label": None,
+                  "mentions": [candidates[0][1] for _, _, candidates in mentions], "signature": None}
+        if not mentions:
+            return result
+
+        # 去掉实体两侧的空白 ("学完 RDF 之后" 与 "学完RDF之后" 匹配同样的模板)
+        masked, last = [], 0
+        for start, end, _ in mentions:
+            masked.append(question[last:start].rstrip())
+            masked.append(ENTITY_PLACEHOLDER)
+            last = end
+            while last < len(question) and question[last].isspace():
+                last += 1
+        masked.append(question[last:])
+        masked = "".join(masked)
+
+        for intent, pattern, labels, _, _ in self.intents:
+            if not pattern.search(masked):
+                continue
+            for _, _, candidates in mentions:
+                for label, name in candidates:
+                    if label in labels:
+                        result.update(intent=intent, entity=name, label=label, signature=(intent, label))
+                        return result
+
+        # 没有匹配的模板 (或实体标签与模板不符): 按第一个实体的标签选择默认意图
+        for _, _, candidates in mentions:
+            for label, name in candidates:
+                if label in DEFAULT_INTENTS:
+                    intent = DEFAULT_INTENTS[label]
+                    result.update(intent=intent, entity=name, label=label, signature=(intent, label))
+                    return result
+        return result
+
+    def render(self, parsed, items):
+        """按意图的回答模板生成回答"""
+        answer, empty = self.templates[parsed["intent"]]
+        if not items:
+            return empty.format(entity=parsed["entity"])
+        return answer.format(entity=parsed["entity"], items=", ".join(items))
@@ -1 +1,196 @@
-# 智能搜索 (Cypher 查询封装)
\ No newline at end of file
+# 智能搜索 (Cypher 查询封装)
+# - 全文搜索: 查询 schema.yaml 中声明的全文索引 (ft_idx_*), 合并各索引的结果后按得分排序、分页
+# - 输入提示: 进程内的前缀树, 覆盖所有节点名称 (中文和英文), 不访问数据库
+import heapq
+import re
+import time
+from kg_course_project.graph_db import csr_snapshot
+from kg_course_project.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+FULLTEXT_QUERY = """
+CALL db.index.fulltext.queryNodes($index, $query) YIELD node, score
+RETURN node.name AS name, labels(node)[0] AS label, node.description AS description, score
+ORDER BY score DESC, name
+LIMIT $limit
+"""
+
+# Lucene 查询语法中的特殊字符, 用户输入按字面搜索
+_LUCENE_SPECIAL = re.compile(r'([+\-!(){}\[\]^"~*?:\\/]|&&|\|\|)')
+
+
+def escape_lucene(text):
+    """转义 Lucene 特殊字符, 并去掉布尔运算符关键字的特殊含义"""
+    escaped = _LUCENE_SPECIAL.sub(r"\\\1", text.strip())
+    return re.sub(r"\b(AND|OR|NOT)\b", lambda m: m.group(1).lower(), escaped)
+
+
+class FulltextSearch:
+    """
+    全文搜索: 对每个节点全文索引执行 FULLTEXT_QUERY, 再按得分合并。
+
+    分页: 第 page 页需要全局前 page * size 个节点, 每个节点 (按最高得分) 一定在某个索引的前 page * size 条之中,
+    因此每个索引只取 page * size + 1 条 (多取 1 条用于判断是否还有下一页)。
+    """
+
+    def __init__(self, conn, max_page_size=50):
+        self.conn = conn
+        self.max_page_size = max_page_size
+        self.indexes = None
+
+    def fulltext_indexes(self):
+        """
+        数据库中已创建的节点全文索引 {索引名: 标签}, 第一次搜索时读取。
+        还没有索引时 (应用先于流程启动) 不缓存, 下一次搜索重新读取。
+        """
+        if self.indexes is None:
+            indexes = {record["name"]: record["labelsOrTypes"][0]
+                       for record in self.conn.run_query("SHOW INDEXES")
+                       if record.get("type") == "FULLTEXT" and record.get("entityType") == "NODE"}
+            if not indexes:
+                logger.warning("[Search] 数据库中没有节点全文索引, 请先运行 schema_manager 创建 schema.yaml 中的索引")
+                return indexes
+            self.indexes = indexes
+        return self.indexes
+
+    def search(self, text, page=1, size=10, labels=None):
+        """
+        :param text: 用户输入 (按字面搜索, Lucene 特殊字符会被转义)
+        :param page: 页码, 从 1 开始
+        :param size: 每页条数 (不超过 max_page_size)
+        :param labels: (可选) 只搜索这些标签的索引
+        :return: {"results": [{name, label, description, score}, ...], "page", "size", "has_more"}
+        """
+        page, size = max(int(page), 1), min(max(int(size), 1), self.max_page_size)
+        query = escape_lucene(text)
+        if not query:
+            return {"results": [], "page": page, "size": size, "has_more": False}
+
+        limit = page * size + 1
+        # 同一标签可能有多个全文索引 (例如旧版本的描述索引还没有删除), 同一节点只保留得分最高的一条
+        hits = {}
+        for index, label in self.fulltext_indexes().items():
+            if labels and label not in labels:
+                continue
+            for record in self.conn.read(FULLTEXT_QUERY, parameters={"index": index, "query": query, "limit": limit}):
+                key = (record["label"], record["name"])
+                if key not in hits or record["score"] > hits[key]["score"]:
+                    hits[key] = record
+        ranked = heapq.nsmallest(limit, hits.values(), key=lambda r: (-r["score"], r["name"], r["label"]))
+        start = (page - 1) * size
+        return {
+            "results": [dict(record) for record in ranked[start:start + size]],
+            "page": page,
+            "size": size,
+            "has_more": len(ranked) > start + size,
+        }
+
+
+class _TrieNode:
+    __slots__ = ("children", "entries", "top")
+
+    def __init__(self):
+        self.children = {}
+        self.entries = []  # 以该节点结尾的 (权重, 名称, 标签)
+        self.top = ()
+
+
+class PrefixTrie:
+    """
+    按字符建立的前缀树; 每个树节点预先保存该前缀下权重最高的 top_k 个补全,
+    查询只需沿前缀走 len(prefix) 步, 与名称总数无关。
+
+    - 键统一转为小写, 英文输入不区分大小写; 中文按单个汉字逐字匹配
+    - 多个词的英文名称 (例如 "Knowledge Graph") 也可以从后面的词开始匹配
+    """
+
+    def __init__(self, top_k=10):
+        self.top_k = top_k
+        self.root = _TrieNode()
+        self.size = 0
+
+    @staticmethod
+    def keys(name):
+        """名称的所有索引键: 完整名称, 以及每个英文单词开头的后缀"""
+        lowered = name.lower()
+        keys = [lowered]
+        for match in re.finditer(r"(?<=[\s_\-/])[a-z0-9]", lowered):
+            keys.append(lowered[match.start():])
+        return keys
+
+    def insert(self, name, label, weight=0):
+        entry = (weight, name, label)
+        for key in self.keys(name):
+            node = self.root
+            for char in key:
+                node = node.children.setdefault(char, _TrieNode())
+            node.entries.append(entry)
+        self.size += 1
+
+    def finalize(self):
+        """自底向上合并子树的 top_k 补全 (迭代后序遍历, 避免长名称导致递归过深)"""
+        order, stack = [], [self.root]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(node.children.values())
+        rank = lambda e: (-e[0], len(e[1]), e[1])
+        for node in reversed(order):
+            candidates = list(node.entries)
+            for child in node.children.values():
+                candidates.extend(child.top)
+            # 同一名称可能经由多个键 (完整名称和某个单词开头) 出现在同一子树中
+            node.top = tuple(heapq.nsmallest(self.top_k, set(candidates), key=rank))
+        return self
+
+    def complete(self, prefix, limit=None):
+        """:return: [(名称, 标签), ...], 按权重 (度数) 降序, 其次名称较短的优先"""
+        node = self.root
+        for char in prefix.lower():
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return [(name, label) for _, name, label in node.top[:limit or self.top_k]]
+
+
+class NameSuggester:
+    """所有节点名称的输入提示; 权重为节点的度数 (关系越多越靠前)"""
+
+    def __init__(self, nodes, degrees=None, top_k=10, version=None):
+        """
+        :param nodes: 可迭代的 (label, name)
+        :param degrees: (可选) {(label, name): 度数}
+        """
+        start = time.perf_counter()
+        self.version = version
+        self.trie = PrefixTrie(top_k)
+        degrees = degrees or {}
+        for label, name in nodes:
+            if name:
+                self.trie.insert(name, label, degrees.get((label, name), 0))
+        self.trie.finalize()
+        logger.info(f"[Search] 输入提示前缀树已构建: {self.trie.size} 个名称 "
+                    f"(图版本 {version}, 用时 {(time.perf_counter() - start) * 1000:.1f}ms)")
+
+    @classmethod
+    def from_snapshot(cls, graph, top_k=10):
+        """从 CSR 图快照 (csr_snapshot.CSRGraph) 构建, 不访问数据库"""
+        degree = (graph.out_indptr[1:] - graph.out_indptr[:-1]) + (graph.in_indptr[1:] - graph.in_indptr[:-1])
+        nodes = [(graph.label(i), graph.name(i)) for i in range(graph.num_nodes)]
+        return cls(nodes, dict(zip(nodes, degree.tolist())), top_k, graph.graph_version)
+
+    @classmethod
+    def from_connection(cls, conn, version=None, top_k=10):
+        nodes = [(r["label"], r["name"]) for r in conn.iter_query(csr_snapshot.SNAPSHOT_NODES_QUERY)]
+        degrees = {}
+        for r in conn.iter_query(csr_snapshot.SNAPSHOT_EDGES_QUERY):
+            for key in ((r["head_label"], r["head"]), (r["tail_label"], r["tail"])):
+                degrees[key] = degrees.get(key, 0) + 1
+        return cls(nodes, degrees, top_k, version)
+
+    def suggest(self, prefix, limit=10):
+        prefix = prefix.strip()
+        if not prefix:
+            return []
+        return [{"name": name, "label": label} for name, label in self.trie.complete(prefix, limit)]
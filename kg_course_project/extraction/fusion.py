@@ -2,6 +2,9 @@
 import Levenshtein
 from collections import defaultdict
 from kg_course_project.utils.logger import get_logger
+from kg_course_project.utils.file_io import read_json, save_json
+from kg_course_project.utils.sketch import CountMinSketch, HeavyHitters
+import os
 import re
 from collections import Counter
 
@@ -20,58 +23,228 @@ def normalize_entity_name(name):
     return name
 
 
-def create_canonical_map(entities, similarity_threshold=0.85):
-    """
-    对抽取的实体列表进行聚类, 生成一个“别名 -> 规范名”的映射。
+# Levenshtein 相似度阈值的默认值: 0.85 会把 RDF / RDFS 这类短名称误合并
+DEFAULT_SIMILARITY_THRESHOLD = 0.9
 
-    例如: {"bert": "bert", "bidirectionalencoder...": "bert"}
+# 参与融合的核心实体类型
+FUSION_LABELS = {"Concept", "Technology", "Algorithm", "Scholar", "Chapter",
+                 "Course", "Paper", "Application", "Metric"}
 
-    :param entities: ner.py 抽取的实体列表 (e.g., [{"name": "BERT", "label": "Algorithm"}])
-    :param similarity_threshold: Levenshtein 相似度阈值
-    :return: 规范化映射 (dict)
-    """
 
-    # 按标签分组，我们只对同一类型的实体进行融合
-    grouped_by_label = defaultdict(list)
-    for ent in entities:
-        # 我们只关心我们定义的核心实体
-        if ent['label'] in ["Concept", "Technology", "Algorithm", "Scholar", "Chapter"
-                            "Course", "Paper", "Application", "Metric"]:
-            grouped_by_label[ent['label']].append(ent['name'])
-
-    canonical_map = {}
+def _max_length_gap(length, similarity_threshold):
+    """
+    Levenshtein.ratio = 1 - dist / (l1 + l2), 且 dist >= |l1 - l2|,
+    所以相似度达到阈值的两个名称, 长度差不可能超过这个上界。
+    """
+    if similarity_threshold <= 0:
+        return None
+    return int(2 * length * (1 - similarity_threshold) / similarity_threshold + 1e-9)
 
-    for label, names in grouped_by_label.items():
-        unique_names = sorted(list(set(names)), key=len)  # 从短的开始，倾向于用短的做规范名
-        clusters = []  # 存放规范名 (每个簇的代表)
 
-        for name in unique_names:
-            norm_name = normalize_entity_name(name)
-            if norm_name in canonical_map:  # 已经被处理过
-                continue
+class CanonicalStore:
+    """
+    持久化的规范名映射: 并查集 + 簇代表。
 
-            found_cluster = False
-            for canonical_name in clusters:
-                norm_canonical = normalize_entity_name(canonical_name)
+    - parent: 规范化名称 -> 并查集父节点 (根节点就是簇代表的规范化名称)
+    - representative: 根节点 -> 规范名 (簇代表的原始写法)
+    - labels: 根节点 -> 实体类型 (只在同一类型内融合)
 
-                # 计算相似度
-                ratio = Levenshtein.ratio(norm_name, norm_canonical)
+    对外表现得像 dict ("规范化名称 -> 规范名")，因此可以直接传给
+    resolve_entities / resolve_relations。新批次的实体只会和已有的簇代表比较,
+    不会重新聚类历史数据。
+    """
 
-                if ratio >= similarity_threshold:
-                    logger.info(f"[Fusion] 实体对齐: '{name}' -> '{canonical_name}' (相似度: {ratio:.2f})")
-                    canonical_map[norm_name] = canonical_name
-                    found_cluster = True
-                    break
+    FORMAT_VERSION = 1
+
+    def __init__(self, similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD):
+        self.similarity_threshold = similarity_threshold
+        self.parent = {}
+        self.representative = {}
+        self.labels = {}
+        # label -> {规范化长度: [根节点, ...]}, 用于按长度剪枝候选簇
+        self._length_buckets = defaultdict(lambda: defaultdict(list))
+        # 根节点 -> 创建顺序, 保证和逐个比较时一样 "先建的簇优先"
+        self._order = {}
+        self._next_order = 0
+
+    # --- 并查集 ---
+    def find(self, norm_name):
+        parent = self.parent
+        root = norm_name
+        while parent[root] != root:
+            parent[root] = parent[parent[root]]  # 路径减半
+            root = parent[root]
+        return root
+
+    # --- dict 接口 (兼容旧的 canonical_map) ---
+    def __contains__(self, norm_name):
+        return norm_name in self.parent
+
+    def __getitem__(self, norm_name):
+        return self.representative[self.find(norm_name)]
+
+    def get(self, norm_name, default=None):
+        if norm_name not in self.parent:
+            return default
+        return self[norm_name]
+
+    def __len__(self):
+        return len(self.parent)
+
+    def to_dict(self):
+        return {norm_name: self[norm_name] for norm_name in self.parent}
+
+    # --- 增量融合 ---
+    def _new_cluster(self, norm_name, name, label):
+        self.parent[norm_name] = norm_name
+        self.representative[norm_name] = name
+        self.labels[norm_name] = label
+        self._length_buckets[label][len(norm_name)].append(norm_name)
+        self._order[norm_name] = self._next_order
+        self._next_order += 1
+
+    def _candidate_roots(self, norm_name, label):
+        """只取长度可能达到阈值的簇代表, 并按创建顺序排列。"""
+        buckets = self._length_buckets.get(label)
+        if not buckets:
+            return []
+        gap = _max_length_gap(len(norm_name), self.similarity_threshold)
+        if gap is None:
+            roots = [r for bucket in buckets.values() for r in bucket]
+        else:
+            roots = []
+            for length in range(max(0, len(norm_name) - gap), len(norm_name) + gap + 1):
+                roots.extend(buckets.get(length, ()))
+        roots.sort(key=self._order.__getitem__)
+        return roots
+
+    def add_entities(self, entities):
+        """
+        把一批新实体分配到已有的簇, 或者新建簇。
+        :param entities: ner.py 抽取的实体列表
+        :return: 本批新增的规范化名称数
+        """
+        grouped_by_label = defaultdict(set)
+        for ent in entities:
+            if ent['label'] in FUSION_LABELS:
+                grouped_by_label[ent['label']].add(ent['name'])
+
+        added = 0
+        for label, names in grouped_by_label.items():
+            for name in sorted(names, key=len):  # 从短的开始，倾向于用短的做规范名
+                norm_name = normalize_entity_name(name)
+                if norm_name in self.parent:  # 已经被处理过
+                    continue
+
+                matched_root = None
+                for root in self._candidate_roots(norm_name, label):
+                    ratio = Levenshtein.ratio(norm_name, root)
+                    if ratio >= self.similarity_threshold:
+                        logger.info(f"[Fusion] 实体对齐: '{name}' -> '{self.representative[root]}' (相似度: {ratio:.2f})")
+                        matched_root = root
+                        break
+
+                if matched_root is None:
+                    # 这是一个新的簇，它自己就是规范名
+                    self._new_cluster(norm_name, name, label)
+                else:
+                    self.parent[norm_name] = matched_root
+                added += 1
+
+        return added
+
+    # --- 持久化 ---
+    def save(self, file_path):
+        """把并查集和簇代表写入 JSON 文件。"""
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        roots = sorted(self._order, key=self._order.__getitem__)
+        save_json({
+            "version": self.FORMAT_VERSION,
+            "similarity_threshold": self.similarity_threshold,
+            "parent": self.parent,
+            "clusters": [[root, self.representative[root], self.labels[root]] for root in roots],
+        }, file_path)
+
+    @classmethod
+    def load(cls, file_path, similarity_threshold=None):
+        """
+        读取持久化的规范名映射; 文件不存在时返回一个空的映射。
+        文件中的簇是按当时的阈值形成的: 指定的阈值与文件中的不同时丢弃旧映射, 由调用方重新融合。
+        """
+        if not os.path.exists(file_path):
+            return cls(similarity_threshold if similarity_threshold is not None else DEFAULT_SIMILARITY_THRESHOLD)
+
+        data = read_json(file_path)
+        if data.get("version") != cls.FORMAT_VERSION:
+            raise ValueError(f"不支持的规范名映射格式版本: {data.get('version')} ({file_path})")
+        if similarity_threshold is not None and similarity_threshold != data["similarity_threshold"]:
+            logger.warning(f"[Fusion] 相似度阈值已从 {data['similarity_threshold']} 改为 {similarity_threshold}, "
+                           f"丢弃旧的规范名映射并重新融合 ({file_path})")
+            return cls(similarity_threshold)
+
+        store = cls(data["similarity_threshold"])
+        store.parent = data["parent"]
+        for root, name, label in data["clusters"]:
+            store.representative[root] = name
+            store.labels[root] = label
+            store._length_buckets[label][len(root)].append(root)
+            store._order[root] = store._next_order
+            store._next_order += 1
+        return store
+
+
+def create_canonical_map(entities, similarity_threshold=None, method="levenshtein"):
+    """
+    对抽取的实体列表进行聚类, 生成一个“别名 -> 规范名”的映射。
 
-            if not found_cluster:
-                # 这是一个新的簇，它自己就是规范名
-                clusters.append(name)
-                canonical_map[norm_name] = name
+    例如: {"bert": "bert", "bidirectionalencoder...": "bert"}
 
+    :param entities: ner.py 抽取的实体列表 (e.g., [{"name": "BERT", "label": "Algorithm"}])
+    :param similarity_threshold: 相似度阈值 (levenshtein: 编辑距离比例, 默认 DEFAULT_SIMILARITY_THRESHOLD;
+                                 tfidf: 余弦相似度, 默认 ngram_align.DEFAULT_TFIDF_THRESHOLD)
+    :param method: "levenshtein" (逐对比较) 或 "tfidf" (字符 n-gram 向量化, 见 ngram_align.py)
+    :return: 规范化映射 (dict)
+    """
+    if method == "tfidf":
+        from kg_course_project.extraction.ngram_align import create_canonical_map_tfidf, DEFAULT_TFIDF_THRESHOLD
+        return create_canonical_map_tfidf(entities, similarity_threshold=DEFAULT_TFIDF_THRESHOLD
+                                          if similarity_threshold is None else similarity_threshold)
+    if method != "levenshtein":
+        raise ValueError(f"未知的实体对齐方法: {method}")
+
+    store = CanonicalStore(DEFAULT_SIMILARITY_THRESHOLD if similarity_threshold is None else similarity_threshold)
+    store.add_entities(entities)
+    canonical_map = store.to_dict()
     logger.info(f"实体融合完成, 生成 {len(canonical_map)} 条规范化规则。")
     return canonical_map
 
+
+def update_canonical_map(entities, file_path, similarity_threshold=None):
+    """
+    (增量) 读取持久化的规范名映射, 只融合新批次的实体, 再写回磁盘。
+    代价与新实体数成正比, 而不是与历史实体总数成正比。
+
+    :param entities: 新批次的实体列表
+    :param file_path: 规范名映射文件 (JSON)
+    :param similarity_threshold: Levenshtein 相似度阈值 (默认沿用文件中的值)
+    :return: CanonicalStore, 可直接传给 resolve_entities / resolve_relations
+    """
+    store = CanonicalStore.load(file_path, similarity_threshold)
+    added = store.add_entities(entities)
+    store.save(file_path)
+    logger.info(f"增量实体融合完成, 新增 {added} 条规范化规则 (共 {len(store)} 条)。")
+    return store
+
 def resolve_entities(entities, canonical_map):
+    """
+    使用 canonical_map 把实体替换为规范名并去重。
+
+    :param entities: 原始实体列表
+    :param canonical_map: create_canonical_map() 的输出, 或持久化的 CanonicalStore
+    :return: resolved_entities
+    """
     resolved_entities = []
     seen_entities = set()
 
@@ -101,8 +274,8 @@ def resolve_relations(relations, canonical_map):
 
     :param entities: 原始实体列表
     :param relations: 原始关系列表
-    :param canonical_map: create_canonical_map() 的输出
-    :return: (resolved_entities, resolved_relations)
+    :param canonical_map: create_canonical_map() 的输出, 或持久化的 CanonicalStore
+    :return: resolved_relations
     """
 
     # resolved_entities = []
@@ -155,6 +328,18 @@ def resolve_relations(relations, canonical_map):
 
 # 常见无意义词
 STOP_WORDS = {"的", "和", "或", "方法", "系统", "任务", "模型"}
+# 合法字符: 中文、英文字母、数字以及 _ + -
+VALID_NAME_RE = re.compile(r'^[\u4e00-\u9fa5a-zA-Z0-9_+\-]+$')
+# 只保留的关键类别
+FILTER_LABELS = {"Concept", "Algorithm", "Technology", "Application", "Task"}
+
+
+def _passes_static_checks(name, label, min_len):
+    """与频次无关的过滤条件 (长度、停用词、合法字符、标签)。"""
+    return (len(name) >= min_len
+            and name not in STOP_WORDS
+            and VALID_NAME_RE.match(name) is not None
+            and label in FILTER_LABELS)
 
 
 def filter_entities(entities, min_len=2, min_freq=2):
@@ -168,33 +353,65 @@ def filter_entities(entities, min_len=2, min_freq=2):
     filtered = []
 
     for ent in entities:
-        name = ent["name"].strip()
-        label = ent["label"]
-
-        # 1. 长度过滤
-        if len(name) < min_len:
-            continue
-
-        # 2. 停用词过滤
-        if name in STOP_WORDS:
+        # 1. 长度 / 2. 停用词 / 4. 合法字符 / 5. 标签
+        if not _passes_static_checks(ent["name"].strip(), ent["label"], min_len):
             continue
 
         # 3. 频次过滤
-        if freq[name] < min_freq:
-            continue
-
-        # 4. 合法字符检查
-        if not re.match(r'^[\u4e00-\u9fa5a-zA-Z0-9_+\-]+$', name):
-            continue
-
-        # 5. 限定标签（只保留关键类别）
-        if label not in {"Concept", "Algorithm", "Technology", "Application", "Task"}:
+        if freq[ent["name"]] < min_freq:
             continue
 
         filtered.append(ent)
 
     return filtered
 
+
+def filter_entities_stream(mentions, min_len=2, min_freq=2, mode="sketch",
+                           width=1 << 20, depth=4, capacity=100000):
+    """
+    (流式) 固定内存的实体过滤, 不需要把所有 mention 放进内存。
+    频次由 Count-Min Sketch 估计 (只会偏大), 其余过滤条件与 filter_entities 相同。
+
+    - mode="two_pass": mentions 是一个可调用对象, 每次调用返回一个新的 mention 迭代器
+      (例如每次重新读取实体检查点的函数)。第一遍计数, 第二遍
+      逐条输出满足 min_freq 的 mention, 输出与 filter_entities 一致 (除非哈希冲突造成高估)。
+    - mode="sketch": mentions 是任意迭代器, 只读一遍。用高频项表跟踪候选实体,
+      读完后每个达到 min_freq 的实体只输出一条 (第一次出现的 mention)。
+      不同候选实体超过 capacity 时, 频次最低的会被淘汰。
+
+    :param mentions: mention 迭代器 (sketch) 或返回迭代器的函数 (two_pass)
+    :param width: sketch 每行的计数器个数
+    :param depth: sketch 的行数 (哈希函数个数)
+    :param capacity: 高频项表的大小 (仅 sketch 模式)
+    :return: 生成器, 逐条产出过滤后的 mention
+    """
+    sketch = CountMinSketch(width=width, depth=depth)
+
+    if mode == "two_pass":
+        if not callable(mentions):
+            raise TypeError("two_pass 模式需要一个返回 mention 迭代器的函数")
+        for ent in mentions():
+            sketch.add(ent["name"])
+        for ent in mentions():
+            if (_passes_static_checks(ent["name"].strip(), ent["label"], min_len)
+                    and sketch.estimate(ent["name"]) >= min_freq):
+                yield ent
+        return
+
+    if mode != "sketch":
+        raise ValueError(f"未知的过滤模式: {mode}")
+
+    heavy_hitters = HeavyHitters(capacity=capacity)
+    for ent in mentions:
+        estimate = sketch.add(ent["name"])
+        if _passes_static_checks(ent["name"].strip(), ent["label"], min_len):
+            heavy_hitters.update((ent["name"], ent["label"]), estimate, ent)
+
+    for (name, _), (_, ent) in heavy_hitters.items.items():
+        if sketch.estimate(name) >= min_freq:
+            yield ent
+
+
 if __name__ == "__main__":
     # --- 测试 ---
     # 模拟从 NER 来的嘈杂数据
@@ -0,0 +1,262 @@
+# 基于字符 n-gram TF-IDF 的实体对齐 (向量化, 仅 CPU)
+import re
+import time
+from collections import defaultdict
+from kg_course_project.utils.logger import get_logger
+from kg_course_project.extraction.fusion import normalize_entity_name, FUSION_LABELS
+
+try:
+    import numpy as np
+    from scipy import sparse
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+logger = get_logger(__name__)
+
+# 余弦相似度阈值的默认值 (与 Levenshtein 的 fusion.DEFAULT_SIMILARITY_THRESHOLD 含义不同)
+DEFAULT_TFIDF_THRESHOLD = 0.6
+
+_WORD_SPLIT_RE = re.compile(r"[\s\.\-,_]+")
+_LATIN_RE = re.compile(r"^[a-z]+$")
+# 缩写通常不取这些虚词的首字母 (Bidirectional Encoder Representations from Transformers -> BERT)
+_ACRONYM_STOP_WORDS = {"a", "an", "and", "for", "from", "in", "of", "on", "the", "to", "with"}
+
+
+def name_features(name, ngram_range=(2, 3)):
+    """
+    把实体名称拆成字符 n-gram 特征。
+    - 在规范化名称两端加 '#'，让词首/词尾的 n-gram 和中间的区分开
+    - 多词英文名额外生成缩写特征 (e.g. "Resource Description Framework" -> "acr:rdf")，
+      短的纯字母名称本身也生成同样的特征，这样缩写和全称之间能匹配上
+    """
+    norm_name = normalize_entity_name(name)
+    padded = f"#{norm_name}#"
+    features = []
+    for n in range(ngram_range[0], ngram_range[1] + 1):
+        features.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+
+    words = [w for w in _WORD_SPLIT_RE.split(name.lower().strip()) if w]
+    if len(words) >= 2 and all(_LATIN_RE.match(w) for w in words):
+        features.append("acr:" + "".join(w[0] for w in words))
+    elif 2 <= len(norm_name) <= 6 and _LATIN_RE.match(norm_name):
+        features.append("acr:" + norm_name)
+    return features
+
+
+def acronym_keys(name):
+    """
+    多词英文全称的缩写键: (首字母, 排序后的首字母), 去掉虚词; 不是多词英文名时返回 None。
+    排序后的键用于字母顺序与全称不一致的缩写 (Web Ontology Language -> OWL)。
+    """
+    words = [w for w in _WORD_SPLIT_RE.split(name.lower().strip()) if w]
+    if len(words) < 2 or not all(_LATIN_RE.match(w) for w in words):
+        return None
+    initials = "".join(w[0] for w in words if w not in _ACRONYM_STOP_WORDS)
+    return initials, "".join(sorted(initials))
+
+
+def acronym_pairs(names):
+    """
+    显式的缩写匹配: 短的纯字母名称 (2-6 个字母) 与首字母相同的多词英文全称配对。
+    字符 n-gram 无法对齐缩写和全称 (RDF 与 Resource Description Framework 的余弦相似度只有约 0.2),
+    所以这一步不依赖相似度。
+    :return: [(缩写下标, 全称下标), ...]
+    """
+    exact, unordered = defaultdict(list), defaultdict(list)
+    for j, name in enumerate(names):
+        keys = acronym_keys(name)
+        if keys is not None:
+            exact[keys[0]].append(j)
+            unordered[keys[1]].append(j)
+    pairs = []
+    for i, name in enumerate(names):
+        norm_name = normalize_entity_name(name)
+        if not (2 <= len(norm_name) <= 6 and _LATIN_RE.match(norm_name)):
+            continue
+        matches = exact.get(norm_name) or unordered.get("".join(sorted(norm_name)), [])
+        pairs.extend((i, j) for j in matches)
+    return pairs
+
+
+def build_tfidf_matrix(names, ngram_range=(2, 3), acronym_weight=3.0):
+    """
+    构建 L2 归一化的 TF-IDF 稀疏矩阵 (每行一个名称)。
+    :return: scipy.sparse.csr_matrix, shape = (len(names), 特征数)
+    """
+    vocabulary = {}
+    indptr = [0]
+    indices = []
+    data = []
+    for name in names:
+        counts = defaultdict(float)
+        for feature in name_features(name, ngram_range):
+            counts[feature] += acronym_weight if feature.startswith("acr:") else 1.0
+        for feature, tf in counts.items():
+            indices.append(vocabulary.setdefault(feature, len(vocabulary)))
+            data.append(tf)
+        indptr.append(len(indices))
+
+    matrix = sparse.csr_matrix(
+        (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr)),
+        shape=(len(names), len(vocabulary)))
+
+    # idf = log((1 + N) / (1 + df)) + 1 (平滑)
+    df = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    idf = np.log((1.0 + matrix.shape[0]) / (1.0 + df)).astype(np.float32) + 1.0
+    matrix.data *= idf[matrix.indices]
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    matrix = sparse.diags(1.0 / norms).dot(matrix).tocsr()
+    return matrix
+
+
+def topk_neighbors(matrix, top_k=10, threshold=0.6, batch_size=1024):
+    """
+    分批计算余弦相似度 (稀疏矩阵乘法)，每行保留相似度 >= threshold 的前 top_k 个邻居。
+    :return: (rows, cols, sims) 三个 NumPy 数组，不包含自身
+    """
+    matrix_t = matrix.T.tocsr()
+    rows, cols, sims = [], [], []
+
+    for start in range(0, matrix.shape[0], batch_size):
+        block = matrix[start:start + batch_size].dot(matrix_t).tocsr()
+        block.data[block.data < threshold] = 0
+        block.eliminate_zeros()
+
+        counts = np.diff(block.indptr)
+        for i in np.flatnonzero(counts):
+            lo, hi = block.indptr[i], block.indptr[i + 1]
+            row_sims = block.data[lo:hi]
+            row_cols = block.indices[lo:hi]
+            not_self = row_cols != start + i
+            row_sims, row_cols = row_sims[not_self], row_cols[not_self]
+            if len(row_cols) > top_k:
+                keep = np.argpartition(-row_sims, top_k - 1)[:top_k]
+                row_sims, row_cols = row_sims[keep], row_cols[keep]
+            rows.append(np.full(len(row_cols), start + i, dtype=np.int64))
+            cols.append(row_cols.astype(np.int64))
+            sims.append(row_sims)
+
+    if not rows:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float32)
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(sims)
+
+
+def create_canonical_map_tfidf(entities, similarity_threshold=DEFAULT_TFIDF_THRESHOLD, top_k=10,
+                               ngram_range=(2, 3), batch_size=1024):
+    """
+    (向量化) 用字符 n-gram TF-IDF + 余弦相似度对实体聚类，输出格式与
+    fusion.create_canonical_map 相同: {规范化名称: 规范名}。
+
+    名称从短到长依次处理: 与某个已有簇代表的相似度 >= 阈值 (只看 top-k 邻居) 时加入相似度最高的簇,
+    否则自己成为新簇的代表; 每个成员都直接和簇代表比较, 不会出现 A~B~C 把不相似的 A 和 C 连在一起。
+    缩写与全称 (acronym_pairs) 视为相似度 1。
+
+    :param entities: ner.py 抽取的实体列表
+    :param similarity_threshold: 余弦相似度阈值
+    :param top_k: 每个名称最多保留的邻居数
+    :param batch_size: 每次矩阵乘法处理的行数 (控制内存峰值)
+    :return: 规范化映射 (dict)
+    """
+    if not SCIPY_AVAILABLE:
+        raise ImportError("TF-IDF 实体对齐需要 numpy 和 scipy: pip install numpy scipy")
+
+    grouped_by_label = defaultdict(set)
+    for ent in entities:
+        if ent['label'] in FUSION_LABELS:
+            grouped_by_label[ent['label']].add(ent['name'])
+
+    canonical_map = {}
+    for label, names in grouped_by_label.items():
+        # 从短的开始，倾向于用短的做规范名; 规范化后相同的名称只保留第一个
+        unique_names = []
+        seen = set()
+        for name in sorted(names, key=lambda x: (len(x), x)):
+            norm_name = normalize_entity_name(name)
+            if norm_name not in seen and norm_name not in canonical_map:
+                seen.add(norm_name)
+                unique_names.append(name)
+        if not unique_names:
+            continue
+
+        matrix = build_tfidf_matrix(unique_names, ngram_range)
+        rows, cols, sims = topk_neighbors(matrix, top_k, similarity_threshold, batch_size)
+        neighbors = defaultdict(dict)
+        for i, j, sim in zip(rows.tolist(), cols.tolist(), sims.tolist()):
+            neighbors[i][j] = sim
+        for i, j in acronym_pairs(unique_names):
+            neighbors[i][j] = neighbors[j][i] = 1.0
+
+        representative = {}  # 下标 -> 所在簇代表的下标
+        for i in range(len(unique_names)):
+            candidates = [(sim, j) for j, sim in neighbors[i].items()
+                          if j < i and representative.get(j) == j]
+            representative[i] = max(candidates)[1] if candidates else i
+
+        for i, name in enumerate(unique_names):
+            canonical_name = unique_names[representative[i]]
+            if canonical_name != name:
+                logger.info(f"[Fusion/TF-IDF] 实体对齐: '{name}' -> '{canonical_name}'")
+            canonical_map[normalize_entity_name(name)] = canonical_name
+
+    logger.info(f"TF-IDF 实体融合完成, 生成 {len(canonical_map)} 条规范化规则。")
+    return canonical_map
+
+
+def compare_backends(entities, levenshtein_threshold=None, tfidf_threshold=DEFAULT_TFIDF_THRESHOLD, **tfidf_kwargs):
+    """
+    在同一批实体上对比 Levenshtein 与 TF-IDF 两种对齐方式的结果和耗时。
+    :return: dict, 包括两边的耗时、簇数量, 以及只在一边被合并的名称
+    """
+    from kg_course_project.extraction.fusion import create_canonical_map, DEFAULT_SIMILARITY_THRESHOLD
+
+    if levenshtein_threshold is None:
+        levenshtein_threshold = DEFAULT_SIMILARITY_THRESHOLD
+    start = time.perf_counter()
+    lev_map = create_canonical_map(entities, similarity_threshold=levenshtein_threshold)
+    lev_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tfidf_map = create_canonical_map_tfidf(entities, similarity_threshold=tfidf_threshold, **tfidf_kwargs)
+    tfidf_seconds = time.perf_counter() - start
+
+    def merged(cmap):
+        return {norm for norm, canonical in cmap.items() if normalize_entity_name(canonical) != norm}
+
+    lev_merged, tfidf_merged = merged(lev_map), merged(tfidf_map)
+    return {
+        "levenshtein_seconds": lev_seconds,
+        "tfidf_seconds": tfidf_seconds,
+        "levenshtein_clusters": len(set(lev_map.values())),
+        "tfidf_clusters": len(set(tfidf_map.values())),
+        "merged_by_both": sorted(lev_merged & tfidf_merged),
+        "only_levenshtein": sorted(lev_merged - tfidf_merged),
+        "only_tfidf": sorted(tfidf_merged - lev_merged),
+    }
+
+
+if __name__ == "__main__":
+    # --- 测试 ---
+    test_entities = [
+        {"name": "RDF", "label": "Concept"},
+        {"name": "R.D.F.", "label": "Concept"},
+        {"name": "Resource Description Framework", "label": "Concept"},
+        {"name": "Framework Resource Description", "label": "Concept"},
+        {"name": "OWL", "label": "Concept"},
+        {"name": "Web Ontology Language", "label": "Concept"},
+        {"name": "知识图谱", "label": "Concept"},
+        {"name": "知识图谱嵌入", "label": "Concept"},
+        {"name": "图谱知识", "label": "Concept"},
+        {"name": "spaCy", "label": "Technology"},
+        {"name": "张三", "label": "PERSON"}  # PER 不会被融合
+    ]
+
+    print("--- TF-IDF 规范化 Map ---")
+    print(create_canonical_map_tfidf(test_entities, similarity_threshold=0.5))
+
+    print("\n--- 与 Levenshtein 对比 ---")
+    for key, value in compare_backends(test_entities, 0.8, 0.5).items():
+        print(f"{key}: {value}")
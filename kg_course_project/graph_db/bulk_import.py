@@ -0,0 +1,276 @@
+# 离线全量导入: 生成 neo4j-admin database import 所需的 CSV
+import csv
+import os
+import time
+from collections import defaultdict
+from kg_course_project.graph_db.data_loader import entity_hash, relation_hash
+from kg_course_project.utils.file_io import read_yaml, read_json, save_json
+from kg_course_project.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# schema.yaml 中的类型 -> neo4j-admin CSV 头部类型
+TYPE_MAP = {
+    "String": "string",
+    "Integer": "long",
+    "Float": "double",
+    "Boolean": "boolean",
+    "Date": "date",
+    "DateTime": "datetime",
+}
+VALID_HEADER_TYPES = set(TYPE_MAP.values()) | {"int", "short", "byte", "float", "char", "localdatetime",
+                                               "localtime", "time", "duration", "point"}
+MANIFEST_FILE = "import_manifest.json"
+# 导入后的图版本号: 全量导入相当于在空库上的一次写入, 与 graph_version.bump_graph_version 的第一次结果一致
+IMPORT_GRAPH_VERSION = 1
+GRAPH_META_LABEL = "GraphMeta"
+GRAPH_META_FILE = "nodes_GraphMeta.csv"
+
+
+def _schema_properties(schema):
+    """label -> [(属性名, CSV 类型), ...] (不含 name, name 作为 ID 列; created_at 由导出统一写入)"""
+    props = {}
+    for node in schema.get('nodes', []):
+        props[node['label']] = [(p['name'], TYPE_MAP.get(p.get('type', 'String'), 'string'))
+                                for p in node.get('properties', []) if p['name'] not in ('name', 'created_at')]
+    return props
+
+
+def _schema_relationship_properties(schema):
+    """关系类型 -> [(属性名, CSV 类型), ...] (created_at 由导出统一写入)"""
+    props = {}
+    for rel in schema.get('relationships', []):
+        props[rel['type']] = [(p['name'], TYPE_MAP.get(p.get('type', 'String'), 'string'))
+                              for p in rel.get('properties', []) if p['name'] != 'created_at']
+    return props
+
+
+def node_header(label, properties):
+    """
+    节点文件的头部, 例如 ["name:ID(Concept)", "description:string", "content_hash:string", "created_at:long", ":LABEL"]。
+    每个标签使用独立的 ID 空间, 所以同名的 Concept 和 Technology 是两个节点。
+    content_hash 与 data_loader.load_entities 写入的一致, 导入后 compute_delta 才能增量比对。
+    """
+    return ([f"name:ID({label})"] + [f"{name}:{csv_type}" for name, csv_type in properties]
+            + ["content_hash:string", "created_at:long", ":LABEL"])
+
+
+def relationship_header(head_label, tail_label, properties, derived=False):
+    """
+    关系文件的头部。派生关系 (推理结果、闭包) 与 data_loader.load_derived_relations 一致,
+    没有 content_hash 列, 不参与 compute_delta 的比对。
+    """
+    hash_columns = [] if derived else ["content_hash:string"]
+    return ([f":START_ID({head_label})", f":END_ID({tail_label})"]
+            + [f"{name}:{csv_type}" for name, csv_type in properties]
+            + hash_columns + ["created_at:long", ":TYPE"])
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+
+def export_import_csvs(entities, relations, output_dir, schema_path="schema.yaml", derived_relations=()):
+    """
+    把融合后的实体和关系写成 neo4j-admin 的节点/关系 CSV。
+
+    - 每个标签一个节点文件, 同一标签内按 name 去重
+    - 每个 (头标签, 类型, 尾标签) 一个关系文件, 重复关系去重, 端点不存在的关系丢弃
+      (与 data_loader.load_relations 中 MATCH 不到端点时的行为一致)
+    - 头部的属性列和类型来自 schema.yaml
+    - 节点和 relations 中的关系带 content_hash; derived_relations (推理结果、闭包) 写入单独的文件, 不带 content_hash,
+      与已有关系重复时以 relations 为准
+    - 额外写入一个 GraphMeta 节点, 导入后的图版本号为 IMPORT_GRAPH_VERSION
+
+    :return: manifest (dict), 同时写入 output_dir/import_manifest.json
+    """
+    schema = read_yaml(schema_path)
+    node_props = _schema_properties(schema)
+    rel_props = _schema_relationship_properties(schema)
+    os.makedirs(output_dir, exist_ok=True)
+    now = int(time.time() * 1000)
+
+    # 1. 节点: 按标签分组并去重
+    nodes_by_label = defaultdict(dict)
+    for ent in entities:
+        nodes_by_label[ent['label']].setdefault(ent['name'], ent)
+
+    manifest = {"nodes": [], "relationships": [], "created_at": now, "graph_version": IMPORT_GRAPH_VERSION}
+    for label, nodes in sorted(nodes_by_label.items()):
+        if label not in node_props:
+            logger.warning(f"[BulkImport] 标签 '{label}' 不在 schema.yaml 中, 只导出 name 属性。")
+        properties = node_props.get(label, [])
+        file_name = f"nodes_{label}.csv"
+        with open(os.path.join(output_dir, file_name), 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(node_header(label, properties))
+            for name, ent in nodes.items():
+                writer.writerow([name] + [_csv_value(ent.get(p)) for p, _ in properties]
+                                + [entity_hash(ent), now, label])
+        manifest["nodes"].append({"file": file_name, "label": label, "rows": len(nodes)})
+
+    with open(os.path.join(output_dir, GRAPH_META_FILE), 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([f"key:ID({GRAPH_META_LABEL})", "version:long", "updated_at:long", ":LABEL"])
+        writer.writerow(["graph", IMPORT_GRAPH_VERSION, now, GRAPH_META_LABEL])
+    manifest["nodes"].append({"file": GRAPH_META_FILE, "label": GRAPH_META_LABEL, "rows": 1})
+
+    # 2. 关系: 按 (头标签, 类型, 尾标签, 是否派生) 分组, 去重并丢弃悬空关系
+    rels_by_group = defaultdict(dict)
+    seen = set()
+    dropped = 0
+    for derived, rel in [(False, r) for r in relations] + [(True, r) for r in derived_relations]:
+        if rel['head'] not in nodes_by_label.get(rel['head_label'], {}) \
+                or rel['tail'] not in nodes_by_label.get(rel['tail_label'], {}):
+            dropped += 1
+            continue
+        key = (rel['head_label'], rel['type'], rel['tail_label'], rel['head'], rel['tail'])
+        if key in seen:
+            continue
+        seen.add(key)
+        rels_by_group[key[:3] + (derived,)][(rel['head'], rel['tail'])] = rel
+    if dropped:
+        logger.warning(f"[BulkImport] 丢弃 {dropped} 条端点不存在的关系。")
+
+    for (head_label, rel_type, tail_label, derived), rels in sorted(rels_by_group.items()):
+        properties = rel_props.get(rel_type, [])
+        suffix = "_derived" if derived else ""
+        file_name = f"rels_{head_label}_{rel_type}_{tail_label}{suffix}.csv"
+        with open(os.path.join(output_dir, file_name), 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(relationship_header(head_label, tail_label, properties, derived))
+            for (head, tail), rel in rels.items():
+                hash_values = [] if derived else [relation_hash(rel)]
+                writer.writerow([head, tail] + [_csv_value(rel.get(p)) for p, _ in properties]
+                                + hash_values + [now, rel_type])
+        manifest["relationships"].append({"file": file_name, "type": rel_type, "start": head_label,
+                                          "end": tail_label, "rows": len(rels), "derived": derived})
+
+    save_json(manifest, os.path.join(output_dir, MANIFEST_FILE))
+    logger.info(f"[BulkImport] 已导出 {sum(n['rows'] for n in manifest['nodes'])} 个节点, "
+                f"{sum(r['rows'] for r in manifest['relationships'])} 条关系到 {output_dir}")
+    return manifest
+
+
+def import_command(manifest, output_dir, database="neo4j"):
+    """生成对应的 neo4j-admin 命令 (需要在数据库停止时执行)。"""
+    parts = ["neo4j-admin database import full", database, "--overwrite-destination"]
+    parts += [f"--nodes={os.path.join(output_dir, n['file'])}" for n in manifest["nodes"]]
+    parts += [f"--relationships={os.path.join(output_dir, r['file'])}" for r in manifest["relationships"]]
+    return " ".join(parts)
+
+
+def _parse_header_field(field):
+    """'name:ID(Concept)' -> ('name', 'ID', 'Concept'); ':TYPE' -> ('', 'TYPE', None)"""
+    name, _, kind = field.partition(':')
+    id_space = None
+    if '(' in kind and kind.endswith(')'):
+        kind, id_space = kind[:-1].split('(', 1)
+    return name, kind, id_space
+
+
+def validate_import_dir(output_dir, schema_path="schema.yaml"):
+    """
+    (离线) 在不连接数据库的情况下检查导出的 CSV:
+    - 头部格式和类型是否合法, 每个节点文件恰好有一个 ID 列
+    - 同一 ID 空间内没有重复 ID
+    - 每条关系的起点/终点在对应 ID 空间中存在, :TYPE 与文件一致
+    - 标签和关系类型是否在 schema.yaml 中声明 (未声明只作为警告; GraphMeta 除外)
+
+    :return: {"errors": [...], "warnings": [...], "nodes": 节点数, "relationships": 关系数}
+    """
+    schema = read_yaml(schema_path)
+    known_labels = {n['label'] for n in schema.get('nodes', [])}
+    known_types = {r['type'] for r in schema.get('relationships', [])}
+    manifest = read_json(os.path.join(output_dir, MANIFEST_FILE))
+    errors, warnings = [], []
+    ids = defaultdict(set)
+    node_count = rel_count = 0
+
+    def check_types(file_name, header):
+        for field in header:
+            name, kind, _ = _parse_header_field(field)
+            if name and kind and kind not in VALID_HEADER_TYPES and kind not in ("ID",):
+                errors.append(f"{file_name}: 非法的列类型 '{field}'")
+
+    for entry in manifest["nodes"]:
+        file_name = entry["file"]
+        with open(os.path.join(output_dir, file_name), encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            check_types(file_name, header)
+            id_cols = [i for i, field in enumerate(header) if _parse_header_field(field)[1] == "ID"]
+            label_cols = [i for i, field in enumerate(header) if field == ":LABEL"]
+            if len(id_cols) != 1 or len(label_cols) != 1:
+                errors.append(f"{file_name}: 需要恰好一个 ID 列和一个 :LABEL 列")
+                continue
+            id_col, label_col = id_cols[0], label_cols[0]
+            id_space = _parse_header_field(header[id_col])[2]
+            if entry["label"] not in known_labels and entry["label"] != GRAPH_META_LABEL:
+                warnings.append(f"{file_name}: 标签 '{entry['label']}' 未在 schema.yaml 中声明")
+            for line_no, row in enumerate(reader, start=2):
+                if len(row) != len(header):
+                    errors.append(f"{file_name}:{line_no}: 列数 {len(row)} 与头部 {len(header)} 不一致")
+                    continue
+                if row[id_col] in ids[id_space]:
+                    errors.append(f"{file_name}:{line_no}: ID 空间 {id_space} 中重复的 ID '{row[id_col]}'")
+                ids[id_space].add(row[id_col])
+                if row[label_col] != entry["label"]:
+                    errors.append(f"{file_name}:{line_no}: 标签 '{row[label_col]}' 与文件不一致")
+                node_count += 1
+
+    for entry in manifest["relationships"]:
+        file_name = entry["file"]
+        with open(os.path.join(output_dir, file_name), encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            check_types(file_name, header)
+            parsed = [_parse_header_field(field) for field in header]
+            try:
+                start_col = next(i for i, p in enumerate(parsed) if p[1] == "START_ID")
+                end_col = next(i for i, p in enumerate(parsed) if p[1] == "END_ID")
+                type_col = header.index(":TYPE")
+            except (StopIteration, ValueError):
+                errors.append(f"{file_name}: 需要 :START_ID, :END_ID 和 :TYPE 列")
+                continue
+            start_space, end_space = parsed[start_col][2], parsed[end_col][2]
+            if entry["type"] not in known_types:
+                warnings.append(f"{file_name}: 关系类型 '{entry['type']}' 未在 schema.yaml 中声明")
+            for line_no, row in enumerate(reader, start=2):
+                if len(row) != len(header):
+                    errors.append(f"{file_name}:{line_no}: 列数 {len(row)} 与头部 {len(header)} 不一致")
+                    continue
+                if row[start_col] not in ids[start_space]:
+                    errors.append(f"{file_name}:{line_no}: 起点 '{row[start_col]}' 不在 ID 空间 {start_space} 中")
+                if row[end_col] not in ids[end_space]:
+                    errors.append(f"{file_name}:{line_no}: 终点 '{row[end_col]}' 不在 ID 空间 {end_space} 中")
+                if row[type_col] != entry["type"]:
+                    errors.append(f"{file_name}:{line_no}: 类型 '{row[type_col]}' 与文件不一致")
+                rel_count += 1
+
+    return {"errors": errors, "warnings": warnings, "nodes": node_count, "relationships": rel_count}
+
+
+if __name__ == "__main__":
+    # --- 测试 (无需数据库) ---
+    test_entities = [
+        {"name": "RDF", "label": "Concept"},
+        {"name": "RDF", "label": "Concept"},  # 重复节点
+        {"name": "RDFS", "label": "Concept"},
+        {"name": "Neo4j", "label": "Technology"},
+    ]
+    test_relations = [
+        {"head": "RDFS", "head_label": "Concept", "type": "REQUIRES_PRE", "tail": "RDF", "tail_label": "Concept"},
+        {"head": "RDFS", "head_label": "Concept", "type": "USES_TECH", "tail": "Neo4j", "tail_label": "Technology"},
+        {"head": "OWL", "head_label": "Concept", "type": "REQUIRES_PRE", "tail": "RDFS", "tail_label": "Concept"},
+    ]
+
+    out_dir = "../../data/output/import"
+    manifest = export_import_csvs(test_entities, test_relations, out_dir, schema_path="../../schema.yaml")
+    print(validate_import_dir(out_dir, schema_path="../../schema.yaml"))
+    print(f"导入后的图版本号: {manifest['graph_version']}")
+    print(import_command(manifest, out_dir))
@@ -1,36 +1,155 @@
 # Neo4j 驱动连接管理
-from neo4j import GraphDatabase
+import contextlib
+from neo4j import GraphDatabase, AsyncGraphDatabase, READ_ACCESS, WRITE_ACCESS
+from kg_course_project.graph_db import graph_version
+from kg_course_project.graph_db.query_cache import QueryCache
+from kg_course_project.graph_db.memory_graph import MemoryConnection
 # 查询节点数和关系数的代码
 
+# 连接池默认参数 (可在 config.ini 的 [NEO4J] 中覆盖)
+DEFAULT_POOL_SIZE = 50
+DEFAULT_CONNECTION_TIMEOUT = 15.0
+DEFAULT_ACQUISITION_TIMEOUT = 60.0
+DEFAULT_FETCH_SIZE = 1000
+
+
+def _options_from_config(config):
+    """读取 config.ini 的 [NEO4J] 部分, 返回连接构造参数"""
+    section = config['NEO4J']
+    return {
+        "uri": section['URI'],
+        "auth": (section['USER'], section['PASSWORD']),
+        "max_connection_pool_size": section.getint('MAX_CONNECTION_POOL_SIZE', DEFAULT_POOL_SIZE),
+        "connection_timeout": section.getfloat('CONNECTION_TIMEOUT', DEFAULT_CONNECTION_TIMEOUT),
+        "connection_acquisition_timeout": section.getfloat('CONNECTION_ACQUISITION_TIMEOUT',
+                                                           DEFAULT_ACQUISITION_TIMEOUT),
+        "fetch_size": section.getint('FETCH_SIZE', DEFAULT_FETCH_SIZE),
+    }
+
+
+def create_connection(config, cache=None, metrics=None):
+    """
+    按 config.ini 的 [GRAPH] BACKEND 创建图连接 (metrics 为可选的 QueryMetrics, 记录查询耗时和慢查询):
+    - neo4j (默认): Neo4jConnection, 连接参数见 [NEO4J]
+    - memory: 进程内的 MemoryConnection, 不需要 Neo4j 服务器 (本地运行 / CI / 基准测试)
+    """
+    backend = config.get('GRAPH', 'BACKEND', fallback='neo4j').strip().lower()
+    if backend == 'neo4j':
+        return Neo4jConnection.from_config(config, cache=cache, metrics=metrics)
+    if backend == 'memory':
+        return MemoryConnection.from_config(config, cache=cache, metrics=metrics)
+    raise ValueError(f"未知的图后端: {backend} (可选 neo4j / memory)")
+
+
 class Neo4jConnection:
     """管理 Neo4j 驱动和会话"""
 
-    def __init__(self, uri, auth):
-        self.driver = GraphDatabase.driver(uri, auth=auth)
+    def __init__(self, uri, auth, max_connection_pool_size=DEFAULT_POOL_SIZE,
+                 connection_timeout=DEFAULT_CONNECTION_TIMEOUT,
+                 connection_acquisition_timeout=DEFAULT_ACQUISITION_TIMEOUT,
+                 fetch_size=DEFAULT_FETCH_SIZE, cache=None, metrics=None):
+        """
+        :param max_connection_pool_size: 连接池大小 (驱动是线程安全的, 多个线程共享同一个池)
+        :param connection_timeout: 建立 TCP 连接的超时 (秒)
+        :param connection_acquisition_timeout: 从连接池获取连接的超时 (秒)
+        :param fetch_size: 每次从服务器拉取的记录数, 决定流式读取时的内存占用
+        :param cache: 可选的 QueryCache, 缓存 read() 的结果, 图版本号变化后自动失效
+        :param metrics: 可选的 QueryMetrics, 按查询指纹记录耗时, 慢读查询以 PROFILE 重新执行并写入日志
+        """
+        self.driver = GraphDatabase.driver(
+            uri, auth=auth,
+            max_connection_pool_size=max_connection_pool_size,
+            connection_timeout=connection_timeout,
+            connection_acquisition_timeout=connection_acquisition_timeout,
+        )
+        self.fetch_size = fetch_size
+        self.cache = cache
+        self.metrics = metrics
+
+    @classmethod
+    def from_config(cls, config, cache=None, metrics=None):
+        """根据 config.ini 的 [NEO4J] 部分创建连接"""
+        return cls(**_options_from_config(config), cache=cache, metrics=metrics)
+
+    def verify_connectivity(self):
+        self.driver.verify_connectivity()
+        return True
 
     def close(self):
         self.driver.close()
+
+    def _session(self, database, access_mode=WRITE_ACCESS):
+        return self.driver.session(database=database, fetch_size=self.fetch_size,
+                                   default_access_mode=access_mode)
+
+    def _measure(self, query, parameters, operation, database="neo4j"):
+        if self.metrics is None:
+            return contextlib.nullcontext()
+        return self.metrics.measure(query, parameters, operation,
+                                    profiler=lambda q, p: self.profile(q, p, database))
+
+    def profile(self, query, parameters=None, database="neo4j"):
+        """在只读事务中以 PROFILE 执行查询, 返回执行计划 (算子树 dict); 只用于读查询"""
+        with self._session(database, READ_ACCESS) as session:
+            return session.execute_read(self._run_tx_profile, f"PROFILE {query}", parameters)
+
     # Community Edition只支持一个数据库，所以database不起作用
     def run_query(self, query, parameters=None, database="neo4j"):
-        """运行一个读/写查询并返回结果"""
-        with self.driver.session(database=database) as session:
+        """运行一个读/写查询并返回结果 (自动提交事务, 用于 SHOW / CREATE INDEX 等模式操作)"""
+        with self._measure(query, parameters, "run", database), self._session(database) as session:
             result = session.run(query, parameters)
             return [record for record in result]
-    '''
-    # await: 等待异步操作完成
-    async def run_query(self, query, parameters=None):
-        async with self.driver.session() as session:
-            result = await session.run(query, parameters)
-            return [record async for record in result]
-    '''
 
+    def iter_query(self, query, parameters=None, database="neo4j"):
+        """
+        (流式) 逐条产出查询结果, 每次只从服务器拉取 fetch_size 条记录。
+        用于大结果集导出, 不会把全部结果放进内存。
+        注意: 生成器在遍历结束 (或被关闭) 之前会一直占用一个会话。
+        """
+        with self._measure(query, parameters, "iter", database), self._session(database, READ_ACCESS) as session:
+            result = session.run(query, parameters)
+            for record in result:
+                yield record
 
+    def read(self, query, parameters=None, database="neo4j", use_cache=True):
+        """
+        在托管的读事务中执行查询并返回结果列表。
+        驱动会在瞬时错误时自动重试; 在集群中读请求会被路由到只读副本。
+        配置了 cache 时, 相同的查询和参数在图版本号不变期间直接从缓存返回。
+        :param use_cache: False 时不经过缓存 (例如读取图版本号本身)
+        """
+        if self.cache is None or not use_cache:
+            return self._read(query, parameters, database)
+
+        version = self.cache.current_version(lambda: graph_version.get_graph_version(self))
+        key = QueryCache.make_key(query, parameters, database)
+        hit, records = self.cache.get(key, version)
+        if not hit:
+            records = self._read(query, parameters, database)
+            self.cache.put(key, version, records)
+        return list(records)
+
+    def _read(self, query, parameters, database):
+        with self._measure(query, parameters, "read", database), self._session(database, READ_ACCESS) as session:
+            return session.execute_read(self._run_tx_records, query, parameters)
+
+    def bump_graph_version(self):
+        """写入完成后递增图版本号, 并让本进程的缓存立即失效"""
+        version = graph_version.bump_graph_version(self)
+        if self.cache is not None:
+            self.cache.set_version(version)
+        return version
+
+    def write(self, query, parameters=None, database="neo4j"):
+        """在托管的写事务中执行查询并返回结果列表"""
+        with self._measure(query, parameters, "write", database), self._session(database) as session:
+            return session.execute_write(self._run_tx_records, query, parameters)
 
     def execute_write(self, query, parameters=None, database="neo4j"):
         """
         在事务中执行写操作 (推荐用于所有写操作)
         """
-        with self.driver.session(database=database) as session:
+        with self._measure(query, parameters, "write", database), self._session(database) as session:
             session.execute_write(self._run_tx, query, parameters)
 
     @staticmethod
@@ -38,8 +157,98 @@ class Neo4jConnection:
         #  事务对象，由驱动自动传入
         tx.run(query, parameters)
 
+    @staticmethod
+    def _run_tx_records(tx, query, parameters=None):
+        # 结果必须在事务函数内部消费完
+        return list(tx.run(query, parameters))
+
+    @staticmethod
+    def _run_tx_profile(tx, query, parameters=None):
+        return tx.run(query, parameters).consume().profile
+
+
+class AsyncNeo4jConnection:
+    """
+    基于 asyncio 驱动的连接, 接口与 Neo4jConnection 相同 (所有方法都是协程)。
+    run_pipeline 在 [LOADER] ASYNC = true 时用它配合 data_loader.load_*_async 全量加载。
+    """
+
+    def __init__(self, uri, auth, max_connection_pool_size=DEFAULT_POOL_SIZE,
+                 connection_timeout=DEFAULT_CONNECTION_TIMEOUT,
+                 connection_acquisition_timeout=DEFAULT_ACQUISITION_TIMEOUT,
+                 fetch_size=DEFAULT_FETCH_SIZE):
+        self.driver = AsyncGraphDatabase.driver(
+            uri, auth=auth,
+            max_connection_pool_size=max_connection_pool_size,
+            connection_timeout=connection_timeout,
+            connection_acquisition_timeout=connection_acquisition_timeout,
+        )
+        self.fetch_size = fetch_size
+
+    @classmethod
+    def from_config(cls, config):
+        """根据 config.ini 的 [NEO4J] 部分创建连接"""
+        return cls(**_options_from_config(config))
+
+    async def close(self):
+        await self.driver.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _session(self, database, access_mode=WRITE_ACCESS):
+        return self.driver.session(database=database, fetch_size=self.fetch_size,
+                                   default_access_mode=access_mode)
+
+    async def run_query(self, query, parameters=None, database="neo4j"):
+        """运行一个读/写查询并返回结果 (自动提交事务)"""
+        async with self._session(database) as session:
+            result = await session.run(query, parameters)
+            return [record async for record in result]
+
+    async def iter_query(self, query, parameters=None, database="neo4j"):
+        """(流式) 异步生成器, 逐条产出查询结果: async for record in conn.iter_query(...)"""
+        async with self._session(database, READ_ACCESS) as session:
+            result = await session.run(query, parameters)
+            async for record in result:
+                yield record
+
+    async def read(self, query, parameters=None, database="neo4j"):
+        """在托管的读事务中执行查询并返回结果列表"""
+        async with self._session(database, READ_ACCESS) as session:
+            return await session.execute_read(self._run_tx_records, query, parameters)
+
+    async def write(self, query, parameters=None, database="neo4j"):
+        """在托管的写事务中执行查询并返回结果列表"""
+        async with self._session(database) as session:
+            return await session.execute_write(self._run_tx_records, query, parameters)
+
+    async def execute_write(self, query, parameters=None, database="neo4j"):
+        """在事务中执行写操作"""
+        async with self._session(database) as session:
+            await session.execute_write(self._run_tx, query, parameters)
+
+    async def bump_graph_version(self):
+        """写入完成后递增图版本号"""
+        return await graph_version.bump_graph_version_async(self)
+
+    @staticmethod
+    async def _run_tx(tx, query, parameters=None):
+        result = await tx.run(query, parameters)
+        await result.consume()
+
+    @staticmethod
+    async def _run_tx_records(tx, query, parameters=None):
+        # 结果必须在事务函数内部消费完
+        result = await tx.run(query, parameters)
+        return [record async for record in result]
+
+
 if __name__ == '__main__':
     URI = "bolt://localhost:7687"
     USER = "neo4j"
     PASSWORD = "ChenMoody"
-    connection = Neo4jConnection(uri=URI, auth=(USER, PASSWORD))
\ No newline at end of file
+    connection = Neo4jConnection(uri=URI, auth=(USER, PASSWORD))
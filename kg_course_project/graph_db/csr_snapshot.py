@@ -0,0 +1,316 @@
+# 只读图快照: 压缩稀疏行 (CSR) 格式的 NumPy 数组, 应用进程以内存映射方式加载
+import json
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from kg_course_project.graph_db import graph_version
+from kg_course_project.utils.logger import get_logger
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = get_logger(__name__)
+
+FORMAT_VERSION = 1
+META_FILE = "meta.json"
+CURRENT_FILE = "CURRENT"
+ARRAYS = ("node_label", "name_offsets", "names", "name_order",
+          "out_indptr", "out_indices", "out_types", "in_indptr", "in_indices", "in_types")
+
+SNAPSHOT_NODES_QUERY = """
+MATCH (n) WHERE NOT n:GraphMeta
+RETURN labels(n)[0] AS label, n.name AS name
+"""
+
+SNAPSHOT_EDGES_QUERY = """
+MATCH (h)-[r]->(t) WHERE NOT h:GraphMeta AND NOT t:GraphMeta
+RETURN labels(h)[0] AS head_label, h.name AS head, type(r) AS type,
+       labels(t)[0] AS tail_label, t.name AS tail
+"""
+
+
+def _require_numpy():
+    if not NUMPY_AVAILABLE:
+        raise ImportError("CSR 图快照需要 numpy: pip install numpy")
+
+
+def _csr(src, dst, types, num_nodes):
+    """按 (起点, 类型, 终点) 排序后生成 indptr / indices / types"""
+    order = np.lexsort((dst, types, src))
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=num_nodes), out=indptr[1:])
+    return indptr, dst[order].astype(np.int32), types[order].astype(np.int16)
+
+
+def build_arrays(nodes, edges):
+    """
+    把节点和关系编码成 CSR 数组。
+    :param nodes: 可迭代的 (label, name); 同一标签内重复的名称只保留一个
+    :param edges: 可迭代的 (head_label, head, type, tail_label, tail); 端点不存在的关系被丢弃
+    :return: (arrays, labels, types)
+    """
+    _require_numpy()
+    labels, types = [], []
+    label_ids, type_ids, node_ids = {}, {}, {}
+    node_label, encoded_names = [], []
+    for label, name in nodes:
+        if (label, name) in node_ids:
+            continue
+        node_ids[(label, name)] = len(node_label)
+        if label not in label_ids:
+            label_ids[label] = len(labels)
+            labels.append(label)
+        node_label.append(label_ids[label])
+        encoded_names.append((name or "").encode("utf-8"))
+
+    src, dst, typ = [], [], []
+    dropped = 0
+    for head_label, head, rel_type, tail_label, tail in edges:
+        h, t = node_ids.get((head_label, head)), node_ids.get((tail_label, tail))
+        if h is None or t is None:
+            dropped += 1
+            continue
+        if rel_type not in type_ids:
+            type_ids[rel_type] = len(types)
+            types.append(rel_type)
+        src.append(h)
+        dst.append(t)
+        typ.append(type_ids[rel_type])
+    if dropped:
+        logger.warning(f"[CSR] 丢弃 {dropped} 条端点不存在的关系。")
+
+    num_nodes = len(node_label)
+    name_offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded_names], out=name_offsets[1:])
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    typ = np.asarray(typ, dtype=np.int64)
+    out_indptr, out_indices, out_types = _csr(src, dst, typ, num_nodes)
+    in_indptr, in_indices, in_types = _csr(dst, src, typ, num_nodes)
+
+    arrays = {
+        "node_label": np.asarray(node_label, dtype=np.int16),
+        "name_offsets": name_offsets,
+        # 字符串表: 所有名称的 UTF-8 字节拼接在一起, 第 i 个名称为 names[offsets[i]:offsets[i+1]]
+        "names": np.frombuffer(b"".join(encoded_names), dtype=np.uint8),
+        # 按名称字节序排序的节点编号, 用于二分查找
+        "name_order": np.asarray(sorted(range(num_nodes), key=encoded_names.__getitem__), dtype=np.int32),
+        "out_indptr": out_indptr, "out_indices": out_indices, "out_types": out_types,
+        "in_indptr": in_indptr, "in_indices": in_indices, "in_types": in_types,
+    }
+    return arrays, labels, types
+
+
+def export_snapshot(nodes, edges, root_dir, version=None, keep=2):
+    """
+    写出一个新的快照目录 root_dir/v<图版本>-<时间戳>/ (每个数组一个 .npy 文件 + meta.json),
+    然后原子地替换 root_dir/CURRENT 指向它; 只保留最近 keep 个快照。
+    正在映射旧快照的进程不受影响 (已删除的文件在解除映射前仍然有效)。
+
+    :param version: 图版本号, 写入 meta.json, 应用据此判断快照是否过期
+    :return: 新快照目录
+    """
+    start = time.perf_counter()
+    arrays, labels, types = build_arrays(nodes, edges)
+    os.makedirs(root_dir, exist_ok=True)
+    base = f"v{version if version is not None else 0}-{int(time.time() * 1000)}"
+    name, suffix = base, 1
+    while os.path.exists(os.path.join(root_dir, name)):
+        # 同一毫秒内的多次导出 (例如测试或连续的小图) 使用不同的目录
+        name, suffix = f"{base}-{suffix}", suffix + 1
+    snapshot_dir = os.path.join(root_dir, name)
+    os.makedirs(snapshot_dir)
+    for key, array in arrays.items():
+        np.save(os.path.join(snapshot_dir, f"{key}.npy"), array)
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "graph_version": version,
+        "created_at": int(time.time() * 1000),
+        "num_nodes": int(len(arrays["node_label"])),
+        "num_edges": int(len(arrays["out_indices"])),
+        "labels": labels,
+        "types": types,
+    }
+    with open(os.path.join(snapshot_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    tmp_path = os.path.join(root_dir, f"{CURRENT_FILE}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(name)
+    os.replace(tmp_path, os.path.join(root_dir, CURRENT_FILE))
+
+    old = sorted((d for d in os.listdir(root_dir) if d.startswith("v") and d != name
+                  and os.path.isdir(os.path.join(root_dir, d))),
+                 key=lambda d: (os.path.getmtime(os.path.join(root_dir, d)), d))
+    for stale in old[:max(0, len(old) - (keep - 1))]:
+        shutil.rmtree(os.path.join(root_dir, stale), ignore_errors=True)
+
+    logger.info(f"[CSR] 已导出快照 {snapshot_dir}: {meta['num_nodes']} 个节点, {meta['num_edges']} 条关系 "
+                f"(图版本 {version}, 用时 {time.perf_counter() - start:.2f}s)")
+    return snapshot_dir
+
+
+def export_from_connection(conn, root_dir, keep=2):
+    """从数据库 (或内存后端) 流式读取全部节点和关系并导出快照"""
+    version = graph_version.get_graph_version(conn)
+    nodes = ((r["label"], r["name"]) for r in conn.iter_query(SNAPSHOT_NODES_QUERY))
+    edges = ((r["head_label"], r["head"], r["type"], r["tail_label"], r["tail"])
+             for r in conn.iter_query(SNAPSHOT_EDGES_QUERY))
+    return export_snapshot(nodes, edges, root_dir, version=version, keep=keep)
+
+
+def export_from_lists(entities, relations, root_dir, version=None, keep=2):
+    """从 run_pipeline 中的实体/关系列表导出快照 (离线导出模式, 不经过数据库)"""
+    nodes = ((e['label'], e['name']) for e in entities)
+    edges = ((r['head_label'], r['head'], r['type'], r['tail_label'], r['tail']) for r in relations)
+    return export_snapshot(nodes, edges, root_dir, version=version, keep=keep)
+
+
+class CSRGraph:
+    """
+    只读的 CSR 图。数组以 mmap_mode='r' 加载, 多个进程 (例如多个 Flask worker)
+    共享操作系统页缓存中的同一份数据, 启动时不需要解析或复制。
+    """
+
+    def __init__(self, snapshot_dir, mmap=True):
+        _require_numpy()
+        self.path = snapshot_dir
+        with open(os.path.join(snapshot_dir, META_FILE), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"不支持的 CSR 快照版本: {self.meta.get('format_version')}")
+        mmap_mode = 'r' if mmap else None
+        for key in ARRAYS:
+            setattr(self, key, np.load(os.path.join(snapshot_dir, f"{key}.npy"), mmap_mode=mmap_mode))
+        self.labels = self.meta["labels"]
+        self.types = self.meta["types"]
+        self._type_ids = {t: i for i, t in enumerate(self.types)}
+        self._label_ids = {label: i for i, label in enumerate(self.labels)}
+
+    @property
+    def graph_version(self):
+        return self.meta.get("graph_version")
+
+    @property
+    def num_nodes(self):
+        return self.meta["num_nodes"]
+
+    @property
+    def num_edges(self):
+        return self.meta["num_edges"]
+
+    def _name_bytes(self, node):
+        return self.names[self.name_offsets[node]:self.name_offsets[node + 1]].tobytes()
+
+    def name(self, node):
+        return self._name_bytes(node).decode("utf-8")
+
+    def label(self, node):
+        return self.labels[self.node_label[node]]
+
+    def find(self, name, label=None):
+        """按名称二分查找节点编号 (指定 label 时只返回该标签的节点); 不存在返回 None"""
+        key = name.encode("utf-8")
+        order = self.name_order
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name_bytes(order[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        label_id = self._label_ids.get(label) if label is not None else None
+        if label is not None and label_id is None:
+            return None
+        while lo < len(order) and self._name_bytes(order[lo]) == key:
+            node = int(order[lo])
+            if label_id is None or self.node_label[node] == label_id:
+                return node
+            lo += 1
+        return None
+
+    def _neighbors(self, indptr, indices, types, node, rel_type):
+        start, end = indptr[node], indptr[node + 1]
+        neighbors = indices[start:end]
+        if rel_type is None:
+            return neighbors
+        type_id = self._type_ids.get(rel_type)
+        if type_id is None:
+            return neighbors[:0]
+        return neighbors[types[start:end] == type_id]
+
+    def successors(self, node, rel_type=None):
+        return self._neighbors(self.out_indptr, self.out_indices, self.out_types, node, rel_type)
+
+    def predecessors(self, node, rel_type=None):
+        return self._neighbors(self.in_indptr, self.in_indices, self.in_types, node, rel_type)
+
+    def reachable(self, node, rel_type, reverse=False, max_depth=None):
+        """
+        沿 rel_type 做 BFS, 返回 {节点编号: 最短跳数} (不含起点, 按距离由近到远)。
+        :param reverse: True 时沿入边遍历
+        """
+        step = self.predecessors if reverse else self.successors
+        depths = {node: 0}
+        queue = deque([node])
+        while queue:
+            current = queue.popleft()
+            depth = depths[current] + 1
+            if max_depth is not None and depth > max_depth:
+                continue
+            for neighbor in step(current, rel_type).tolist():
+                if neighbor not in depths:
+                    depths[neighbor] = depth
+                    queue.append(neighbor)
+        del depths[node]
+        return depths
+
+
+def current_snapshot_dir(root_dir):
+    """root_dir/CURRENT 指向的快照目录; 还没有快照时返回 None"""
+    try:
+        with open(os.path.join(root_dir, CURRENT_FILE), encoding='utf-8') as f:
+            return os.path.join(root_dir, f.read().strip())
+    except FileNotFoundError:
+        return None
+
+
+def load_snapshot(root_dir, mmap=True):
+    """加载 root_dir 下的当前快照; 没有快照时返回 None"""
+    snapshot_dir = current_snapshot_dir(root_dir)
+    return CSRGraph(snapshot_dir, mmap=mmap) if snapshot_dir else None
+
+
+class SnapshotReader:
+    """
+    应用进程持有的快照句柄: get() 返回当前快照,
+    每隔 check_interval 秒检查一次 CURRENT, 流程导出了新快照时重新映射。
+    """
+
+    def __init__(self, root_dir, check_interval=5.0):
+        self.root_dir = root_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._graph = None
+        self._checked_at = float('-inf')
+
+    def get(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return self._graph
+        with self._lock:
+            self._checked_at = now
+            snapshot_dir = current_snapshot_dir(self.root_dir)
+            if snapshot_dir and (self._graph is None or self._graph.path != snapshot_dir):
+                try:
+                    self._graph = CSRGraph(snapshot_dir)
+                    logger.info(f"[CSR] 已映射快照 {snapshot_dir} (图版本 {self._graph.graph_version})")
+                except (OSError, ValueError) as e:
+                    logger.warning(f"[CSR] 无法加载快照 {snapshot_dir}: {e}")
+            return self._graph
@@ -1,50 +1,137 @@
 # 将抽取的实体和关系写入数据库
-def load_entities(conn, entities):
-    """
-    将实体批量加载到 Neo4j。
-    使用 MERGE 确保幂等性。
+import asyncio
+import hashlib
+import random
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from neo4j.exceptions import TransientError, ServiceUnavailable, SessionExpired
+from kg_course_project.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 默认分批参数 (可在 config.ini 的 [LOADER] 中覆盖)
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_RETRIES = 3
+# 可重试的错误: 瞬时错误 (包括死锁 DeadlockDetected)、连接中断
+RETRYABLE_ERRORS = (TransientError, ServiceUnavailable, SessionExpired)
+
+
+def loader_options_from_config(config):
+    """从 config.ini 的 [LOADER] 读取分批参数, 缺省时使用默认值。"""
+    return {
+        "batch_size": config.getint('LOADER', 'BATCH_SIZE', fallback=DEFAULT_BATCH_SIZE),
+        "max_workers": config.getint('LOADER', 'MAX_WORKERS', fallback=DEFAULT_MAX_WORKERS),
+        "max_retries": config.getint('LOADER', 'MAX_RETRIES', fallback=DEFAULT_MAX_RETRIES),
+    }
+
+
+def entity_hash(entity):
+    """实体的内容哈希 (标签 + 名称), 写入节点的 content_hash 属性, 用于增量加载时比对"""
+    return hashlib.sha1(f"{entity['label']}\x1f{entity['name']}".encode('utf-8')).hexdigest()
+
+
+def relation_hash(relation):
+    """关系的内容哈希 (头实体 + 类型 + 尾实体), 写入关系的 content_hash 属性"""
+    key = "\x1f".join((relation['head_label'], relation['head'], relation['type'],
+                       relation['tail_label'], relation['tail']))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _write_chunk(conn, query, chunk, max_retries, retry_backoff):
+    """写入一个分块; 遇到瞬时错误/死锁时指数退避重试。返回重试次数。"""
+    for attempt in range(max_retries + 1):
+        try:
+            conn.execute_write(query, parameters={"batch": chunk})
+            return attempt
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            delay = retry_backoff * (2 ** attempt) * (1 + random.random())
+            logger.warning(f"[Loader] 分块写入失败 ({e.__class__.__name__}), {delay:.2f}s 后重试 "
+                           f"({attempt + 1}/{max_retries})")
+            time.sleep(delay)
+
+
+def _write_group(conn, group_name, query, rows, batch_size, max_retries, retry_backoff, committed):
+    """按 batch_size 分块写入一个分组, 并统计吞吐量。每提交一个分块向 committed 追加一项。"""
+    start = time.perf_counter()
+    retries = 0
+    for i in range(0, len(rows), batch_size):
+        retries += _write_chunk(conn, query, rows[i:i + batch_size], max_retries, retry_backoff)
+        committed.append(group_name)
+    seconds = time.perf_counter() - start
+    stats = {
+        "group": group_name,
+        "rows": len(rows),
+        "seconds": seconds,
+        "rows_per_sec": len(rows) / seconds if seconds > 0 else float('inf'),
+        "retries": retries,
+    }
+    logger.info(f"[Loader] {group_name}: {stats['rows']} 行, 用时 {seconds:.2f}s "
+                f"({stats['rows_per_sec']:.0f} rows/s, 重试 {retries} 次)")
+    return stats
+
+
+def _write_groups(conn, jobs, batch_size, max_workers, max_retries, retry_backoff):
     """
-    # Neo4j 5.x+ 推荐使用 UNWIND + MERGE
-    query = """
-    UNWIND $entities AS entity
-    MERGE (n {name: entity.name})
-    ON CREATE SET n.created_at = timestamp()
-    // 动态设置标签 (需要 APOC 库，如果不用APOC会复杂些)
-    // 简化的方法：为每个标签单独执行
+    用一个小线程池并发写入互不依赖的分组 (驱动本身是线程安全的, 每个分块使用独立会话)。
+    只要有分块提交了 (即使之后某个分块失败), 就递增图版本号。
+    :param jobs: [(group_name, query, rows), ...]
+    :return: 每个分组的统计信息列表
     """
+    committed = []
+    try:
+        if max_workers <= 1 or len(jobs) <= 1:
+            return [_write_group(conn, name, query, rows, batch_size, max_retries, retry_backoff, committed)
+                    for name, query, rows in jobs]
+        # 退出 with 时等待所有分组结束, 因此 finally 中看到的是最终提交的分块
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kg-loader") as pool:
+            futures = [pool.submit(_write_group, conn, name, query, rows, batch_size, max_retries, retry_backoff,
+                                   committed)
+                       for name, query, rows in jobs]
+            return [f.result() for f in futures]
+    finally:
+        # 部分写入也改变了图, 必须递增图版本号让读缓存失效
+        if committed:
+            conn.bump_graph_version()
+
 
+def _entity_jobs(entities):
+    """按标签分组, 返回 [(分组名, query, rows), ...]"""
     # 简化版：按标签分组加载 (无需 APOC)
     grouped_by_label = {}
     for e in entities:
         label = e['label']
         if label not in grouped_by_label:
             grouped_by_label[label] = []
-        grouped_by_label[label].append(e)
+        grouped_by_label[label].append({"name": e['name'], "content_hash": entity_hash(e)})
 
+    jobs = []
     for label, entity_list in grouped_by_label.items():
         # :Label 必须是硬编码，不能作为参数
         query = f"""
         UNWIND $batch AS entity
         MERGE (n:{label} {{name: entity.name}})
         ON CREATE SET n.created_at = timestamp()
+        SET n.content_hash = entity.content_hash
         """
-        # 为了性能，可以分批 (batch)
-        conn.execute_write(query, parameters={"batch": entity_list})
+        jobs.append((f":{label}", query, entity_list))
+    return jobs
 
 
-def load_relations(conn, relations):
-    """
-    将关系批量加载到 Neo4j。
-    使用 MERGE 确保幂等性。
-    """
+def _relation_jobs(relations):
+    """按 (头标签, 类型, 尾标签) 分组, 返回 [(分组名, query, rows), ...]"""
     # 简化版：按类型分组加载 (无需 APOC)
     grouped_by_type = {}
     for r in relations:
         key = (r['head_label'], r['type'], r['tail_label'])
         if key not in grouped_by_type:
             grouped_by_type[key] = []
-        grouped_by_type[key].append(r)
+        grouped_by_type[key].append({"head": r['head'], "tail": r['tail'], "content_hash": relation_hash(r)})
 
+    jobs = []
     for (head_label, rel_type, tail_label), batch in grouped_by_type.items():
         # :Label 和 :REL_TYPE 必须是硬编码
         query = f"""
@@ -53,5 +140,330 @@ def load_relations(conn, relations):
         MATCH (t:{tail_label} {{name: rel.tail}})
         MERGE (h)-[r:{rel_type}]->(t)
         ON CREATE SET r.created_at = timestamp()
+        SET r.content_hash = rel.content_hash
         """
-        conn.execute_write(query, parameters={"batch": batch})
\ No newline at end of file
+        jobs.append((f"(:{head_label})-[:{rel_type}]->(:{tail_label})", query, batch))
+    return jobs
+
+
+def load_entities(conn, entities, batch_size=DEFAULT_BATCH_SIZE, max_workers=DEFAULT_MAX_WORKERS,
+                  max_retries=DEFAULT_MAX_RETRIES, retry_backoff=0.5):
+    """
+    将实体批量加载到 Neo4j。
+    使用 MERGE 确保幂等性。
+
+    每个标签分组按 batch_size 分块写入, 不同标签由线程池并发写入;
+    遇到瞬时错误或死锁的分块会被重试。
+
+    :return: 每个标签分组的统计信息 (行数、耗时、rows/sec、重试次数)
+    """
+    # Neo4j 5.x+ 推荐使用 UNWIND + MERGE
+    # 动态设置标签需要 APOC 库, 所以为每个标签单独执行 (见 _entity_jobs)
+    return _write_groups(conn, _entity_jobs(entities), batch_size, max_workers, max_retries, retry_backoff)
+
+
+def load_relations(conn, relations, batch_size=DEFAULT_BATCH_SIZE, max_workers=DEFAULT_MAX_WORKERS,
+                   max_retries=DEFAULT_MAX_RETRIES, retry_backoff=0.5):
+    """
+    将关系批量加载到 Neo4j。
+    使用 MERGE 确保幂等性。
+
+    不同 (头标签, 类型, 尾标签) 分组并发写入; 共享端点的分组之间可能出现死锁,
+    这类分块会自动重试。
+
+    :return: 每个关系分组的统计信息
+    """
+    return _write_groups(conn, _relation_jobs(relations), batch_size, max_workers, max_retries, retry_backoff)
+
+# --- 增量加载 (按内容哈希比对上一次加载的结果) ---
+LOADED_NODES_QUERY = """
+MATCH (n) WHERE n.content_hash IS NOT NULL
+RETURN labels(n)[0] AS label, n.name AS name, n.content_hash AS content_hash
+"""
+
+LOADED_RELATIONS_QUERY = """
+MATCH (h)-[r]->(t) WHERE r.content_hash IS NOT NULL
+RETURN labels(h)[0] AS head_label, h.name AS head, type(r) AS type,
+       labels(t)[0] AS tail_label, t.name AS tail, r.content_hash AS content_hash
+"""
+
+
+def _entity_removal_jobs(nodes):
+    grouped_by_label = {}
+    for n in nodes:
+        grouped_by_label.setdefault(n['label'], []).append({"name": n['name']})
+    return [(f"-:{label}", f"""
+        UNWIND $batch AS entity
+        MATCH (n:{label} {{name: entity.name}})
+        DETACH DELETE n
+        """, rows) for label, rows in grouped_by_label.items()]
+
+
+def _relation_removal_jobs(relations):
+    grouped_by_type = {}
+    for r in relations:
+        key = (r['head_label'], r['type'], r['tail_label'])
+        grouped_by_type.setdefault(key, []).append({"head": r['head'], "tail": r['tail']})
+    return [(f"-(:{head_label})-[:{rel_type}]->(:{tail_label})", f"""
+        UNWIND $batch AS rel
+        MATCH (h:{head_label} {{name: rel.head}})-[r:{rel_type}]->(t:{tail_label} {{name: rel.tail}})
+        DELETE r
+        """, rows) for (head_label, rel_type, tail_label), rows in grouped_by_type.items()]
+
+
+def compute_delta(conn, entities, relations):
+    """
+    对比本次的实体/关系与数据库中上一次加载的结果 (节点和关系上的 content_hash)。
+    已加载的哈希通过 iter_query 流式读取。没有 content_hash 的节点和关系
+    (例如推理生成的关系、GraphMeta) 不参与比对, 也不会被删除。
+
+    :return: dict, 包括 added_entities / removed_entities / added_relations / removed_relations
+    """
+    new_entities = {entity_hash(e): e for e in entities}
+    new_relations = {relation_hash(r): r for r in relations}
+
+    loaded_entities = set()
+    removed_entities = []
+    for record in conn.iter_query(LOADED_NODES_QUERY):
+        loaded_entities.add(record["content_hash"])
+        if record["content_hash"] not in new_entities:
+            removed_entities.append({"label": record["label"], "name": record["name"]})
+
+    loaded_relations = set()
+    removed_relations = []
+    for record in conn.iter_query(LOADED_RELATIONS_QUERY):
+        loaded_relations.add(record["content_hash"])
+        if record["content_hash"] not in new_relations:
+            removed_relations.append({key: record[key] for key in
+                                      ("head_label", "head", "type", "tail_label", "tail")})
+
+    return {
+        "added_entities": [e for h, e in new_entities.items() if h not in loaded_entities],
+        "removed_entities": removed_entities,
+        "added_relations": [r for h, r in new_relations.items() if h not in loaded_relations],
+        "removed_relations": removed_relations,
+    }
+
+
+def load_delta(conn, entities, relations, batch_size=DEFAULT_BATCH_SIZE, max_workers=DEFAULT_MAX_WORKERS,
+               max_retries=DEFAULT_MAX_RETRIES, retry_backoff=0.5, delta=None):
+    """
+    (增量) 只写入与上一次加载相比发生变化的部分, 不清空数据库, 应用在加载期间可以继续提供服务。
+    顺序: 删除旧关系 -> 删除旧节点 -> 新增节点 -> 新增关系; 每一步都按 batch_size 分块提交。
+
+    :param delta: (可选) 已经算好的 compute_delta 结果 (调用方还需要用它做增量推理时传入)
+    :return: 各部分的数量, 例如 {"added_entities": 3, "removed_entities": 1, ...}
+    """
+    if delta is None:
+        delta = compute_delta(conn, entities, relations)
+    options = (batch_size, max_workers, max_retries, retry_backoff)
+
+    if delta["removed_relations"]:
+        _write_groups(conn, _relation_removal_jobs(delta["removed_relations"]), *options)
+    if delta["removed_entities"]:
+        _write_groups(conn, _entity_removal_jobs(delta["removed_entities"]), *options)
+    if delta["added_entities"]:
+        _write_groups(conn, _entity_jobs(delta["added_entities"]), *options)
+    if delta["added_relations"]:
+        _write_groups(conn, _relation_jobs(delta["added_relations"]), *options)
+
+    summary = {key: len(value) for key, value in delta.items()}
+    logger.info(f"[Loader] 增量加载完成: 新增 {summary['added_entities']} 个节点 / "
+                f"{summary['added_relations']} 条关系, 删除 {summary['removed_entities']} 个节点 / "
+                f"{summary['removed_relations']} 条关系。")
+    return summary
+
+
+# --- 派生关系 (推理结果等): 没有 content_hash, 不参与 compute_delta 的比对 ---
+def _derived_relation_jobs(relations, properties):
+    """按 (头标签, 类型, 尾标签) 分组, MERGE 关系后写入 properties 中的属性"""
+    grouped_by_type = {}
+    for r in relations:
+        key = (r['head_label'], r['type'], r['tail_label'])
+        grouped_by_type.setdefault(key, []).append(
+            {"head": r['head'], "tail": r['tail'], **{p: r.get(p) for p in properties}})
+    sets = ", ".join(f"r.{p} = rel.{p}" for p in properties)
+    return [(f"(:{head_label})-[:{rel_type}]->(:{tail_label})", f"""
+        UNWIND $batch AS rel
+        MATCH (h:{head_label} {{name: rel.head}})
+        MATCH (t:{tail_label} {{name: rel.tail}})
+        MERGE (h)-[r:{rel_type}]->(t)
+        ON CREATE SET r.created_at = timestamp()
+        SET {sets}
+        """, rows) for (head_label, rel_type, tail_label), rows in grouped_by_type.items()]
+
+
+def load_derived_relations(conn, upserts, removed, properties, batch_size=DEFAULT_BATCH_SIZE,
+                           max_workers=DEFAULT_MAX_WORKERS, max_retries=DEFAULT_MAX_RETRIES, retry_backoff=0.5):
+    """
+    写入一批派生关系的变化: 删除 removed, MERGE upserts 并设置 properties 中的属性。
+    调用方负责保证两者不重叠 (同一对端点只会出现在其中一个列表里)。
+    :return: 每个关系分组的统计信息
+    """
+    jobs = _relation_removal_jobs(removed) if removed else []
+    if upserts:
+        jobs += _derived_relation_jobs(upserts, properties)
+    return _write_groups(conn, jobs, batch_size, max_workers, max_retries, retry_backoff)
+
+
+# --- 前置知识的传递闭包 (加载时预计算) ---
+# 每个 (概念, 直接或间接前置知识) 物化为一条 REQUIRES_PRE_CLOSURE 关系, depth 为最短跳数,
+# 查询时不再需要 REQUIRES_PRE* 变长匹配 (路径数随图的稠密程度指数增长)
+CLOSURE_TYPE = "REQUIRES_PRE_CLOSURE"
+
+PREREQUISITE_EDGES_QUERY = """
+MATCH (h:Concept)-[r:REQUIRES_PRE]->(t:Concept)
+RETURN h.name AS head, t.name AS tail
+"""
+
+CLOSURE_EDGES_QUERY = f"""
+MATCH (h:Concept)-[r:{CLOSURE_TYPE}]->(t:Concept)
+RETURN h.name AS head, t.name AS tail, r.depth AS depth
+"""
+
+CLOSURE_UPSERT_QUERY = f"""
+UNWIND $batch AS rel
+MATCH (h:Concept {{name: rel.head}})
+MATCH (t:Concept {{name: rel.tail}})
+MERGE (h)-[r:{CLOSURE_TYPE}]->(t)
+ON CREATE SET r.created_at = timestamp()
+SET r.depth = rel.depth
+"""
+
+
+def compute_closure(edges):
+    """
+    对每个起点做一次 BFS, 得到传递闭包和最短距离。环上的节点不会把自己算作前置知识。
+    :param edges: 可迭代的 (head, tail), 表示 head REQUIRES_PRE tail
+    :return: {(head, ancestor): 最短跳数}
+    """
+    adjacency = defaultdict(list)
+    for head, tail in edges:
+        adjacency[head].append(tail)
+
+    closure = {}
+    for start in list(adjacency):
+        depths = {start: 0}
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            for neighbor in adjacency.get(node, ()):
+                if neighbor not in depths:
+                    depths[neighbor] = depths[node] + 1
+                    queue.append(neighbor)
+        for ancestor, depth in depths.items():
+            if ancestor != start:
+                closure[(start, ancestor)] = depth
+    return closure
+
+
+def closure_relations(relations):
+    """由关系列表计算闭包关系 (离线导出 neo4j-admin CSV 时使用, depth 作为关系属性写入)"""
+    edges = ((r['head'], r['tail']) for r in relations
+             if r['type'] == 'REQUIRES_PRE' and r['head_label'] == 'Concept' and r['tail_label'] == 'Concept')
+    return [{"head": head, "head_label": "Concept", "type": CLOSURE_TYPE, "tail": tail, "tail_label": "Concept",
+             "depth": depth} for (head, tail), depth in compute_closure(edges).items()]
+
+
+def load_prerequisite_closure(conn, batch_size=DEFAULT_BATCH_SIZE, max_workers=DEFAULT_MAX_WORKERS,
+                              max_retries=DEFAULT_MAX_RETRIES, retry_backoff=0.5):
+    """
+    根据当前的 REQUIRES_PRE 关系重新计算闭包, 并与数据库中已物化的闭包比对:
+    只删除不再成立的闭包关系, 只写入新增或 depth 变化的闭包关系。
+
+    :return: {"closure": 闭包大小, "added": 写入数, "removed": 删除数}
+    """
+    desired = compute_closure((r["head"], r["tail"]) for r in conn.iter_query(PREREQUISITE_EDGES_QUERY))
+    existing = {(r["head"], r["tail"]): r["depth"] for r in conn.iter_query(CLOSURE_EDGES_QUERY)}
+
+    removed = [{"head_label": "Concept", "head": head, "type": CLOSURE_TYPE, "tail_label": "Concept", "tail": tail}
+               for head, tail in existing if (head, tail) not in desired]
+    upserts = [{"head": head, "tail": tail, "depth": depth}
+               for (head, tail), depth in desired.items() if existing.get((head, tail)) != depth]
+
+    jobs = _relation_removal_jobs(removed) if removed else []
+    if upserts:
+        jobs.append((f"(:Concept)-[:{CLOSURE_TYPE}]->(:Concept)", CLOSURE_UPSERT_QUERY, upserts))
+    _write_groups(conn, jobs, batch_size, max_workers, max_retries, retry_backoff)
+
+    summary = {"closure": len(desired), "added": len(upserts), "removed": len(removed)}
+    logger.info(f"[Loader] 前置知识闭包: {summary['closure']} 对, 写入 {summary['added']}, "
+                f"删除 {summary['removed']}。")
+    return summary
+
+
+# --- 异步版本 (配合 AsyncNeo4jConnection) ---
+async def _write_chunk_async(conn, query, chunk, max_retries, retry_backoff):
+    for attempt in range(max_retries + 1):
+        try:
+            await conn.execute_write(query, parameters={"batch": chunk})
+            return attempt
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            delay = retry_backoff * (2 ** attempt) * (1 + random.random())
+            logger.warning(f"[Loader] 分块写入失败 ({e.__class__.__name__}), {delay:.2f}s 后重试 "
+                           f"({attempt + 1}/{max_retries})")
+            await asyncio.sleep(delay)
+
+
+async def _gather_all(awaitables):
+    """等待全部完成后再抛出第一个异常 (asyncio.gather 默认在第一个异常时返回, 其余任务仍在运行)"""
+    results = await asyncio.gather(*awaitables, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+async def _write_groups_async(conn, jobs, batch_size, max_concurrency, max_retries, retry_backoff):
+    """
+    所有分组的所有分块一起调度, 最多 max_concurrency 个写事务同时进行。
+    与 _write_groups 一样, 只要有分块提交了就递增图版本号。
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    committed = []
+
+    async def write_chunk(query, chunk):
+        async with semaphore:
+            retries = await _write_chunk_async(conn, query, chunk, max_retries, retry_backoff)
+        committed.append(query)
+        return retries
+
+    async def write_group(group_name, query, rows):
+        start = time.perf_counter()
+        retries = await _gather_all(write_chunk(query, rows[i:i + batch_size])
+                                    for i in range(0, len(rows), batch_size))
+        seconds = time.perf_counter() - start
+        stats = {
+            "group": group_name,
+            "rows": len(rows),
+            "seconds": seconds,
+            "rows_per_sec": len(rows) / seconds if seconds > 0 else float('inf'),
+            "retries": sum(retries),
+        }
+        logger.info(f"[Loader] {group_name}: {stats['rows']} 行, 用时 {seconds:.2f}s "
+                    f"({stats['rows_per_sec']:.0f} rows/s, 重试 {stats['retries']} 次)")
+        return stats
+
+    try:
+        return await _gather_all(write_group(*job) for job in jobs)
+    finally:
+        if committed:
+            await conn.bump_graph_version()
+
+
+async def load_entities_async(conn, entities, batch_size=DEFAULT_BATCH_SIZE,
+                              max_concurrency=DEFAULT_MAX_WORKERS, max_retries=DEFAULT_MAX_RETRIES,
+                              retry_backoff=0.5):
+    """load_entities 的异步版本, conn 为 AsyncNeo4jConnection"""
+    return await _write_groups_async(conn, _entity_jobs(entities), batch_size, max_concurrency,
+                                     max_retries, retry_backoff)
+
+
+async def load_relations_async(conn, relations, batch_size=DEFAULT_BATCH_SIZE,
+                               max_concurrency=DEFAULT_MAX_WORKERS, max_retries=DEFAULT_MAX_RETRIES,
+                               retry_backoff=0.5):
+    """load_relations 的异步版本, conn 为 AsyncNeo4jConnection"""
+    return await _write_groups_async(conn, _relation_jobs(relations), batch_size, max_concurrency,
+                                     max_retries, retry_backoff)
@@ -0,0 +1,32 @@
+# 图版本号: 每次成功写入后递增, 供缓存判断数据是否过期
+# 版本号存放在数据库中的一个 GraphMeta 节点上, 因此 run_pipeline 和 run_app 即使在不同进程中也能看到同一个版本
+
+GRAPH_VERSION_QUERY = """
+MATCH (m:GraphMeta {key: 'graph'})
+RETURN m.version AS version
+"""
+
+BUMP_GRAPH_VERSION_QUERY = """
+MERGE (m:GraphMeta {key: 'graph'})
+SET m.version = coalesce(m.version, 0) + 1, m.updated_at = timestamp()
+RETURN m.version AS version
+"""
+
+
+def get_graph_version(conn):
+    """
+    读取当前图版本号 (图从未写入过时为 0)。
+    走读事务 (集群中路由到只读副本), 不经过查询缓存 (缓存本身依赖版本号判断是否过期)
+    """
+    records = conn.read(GRAPH_VERSION_QUERY, use_cache=False)
+    return records[0]["version"] if records else 0
+
+
+def bump_graph_version(conn):
+    """图版本号 +1, 返回新的版本号"""
+    return conn.write(BUMP_GRAPH_VERSION_QUERY)[0]["version"]
+
+
+async def bump_graph_version_async(conn):
+    """bump_graph_version 的异步版本, conn 为 AsyncNeo4jConnection"""
+    return (await conn.write(BUMP_GRAPH_VERSION_QUERY))[0]["version"]
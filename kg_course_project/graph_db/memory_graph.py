@@ -0,0 +1,726 @@
+# 进程内图后端: 与 Neo4jConnection 接口相同, 不需要 Neo4j 服务器 (本地运行 / CI / 基准测试)
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from kg_course_project.graph_db import graph_version, data_loader, csr_snapshot
+from kg_course_project.applications import inference, qa_system, search
+from kg_course_project.graph_db.query_cache import QueryCache
+from kg_course_project.utils.file_io import read_json, save_json
+from kg_course_project.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+class UnsupportedQueryError(ValueError):
+    """内存后端只支持项目中实际使用的 Cypher 子集, 其他查询抛出此异常"""
+
+
+def _timestamp():
+    # 与 Cypher 的 timestamp() 一致: 毫秒
+    return int(time.time() * 1000)
+
+
+class InMemoryGraph:
+    """
+    属性图的内存存储。
+
+    - 节点: id -> {"labels": set, "props": dict}; 标签索引 label -> {节点 id}
+    - (标签, name) -> 节点 id 的唯一索引, 对应 schema.yaml 中 name 的唯一约束
+    - 关系: id -> {"type", "start", "end", "props"}; 类型索引 type -> {关系 id}
+    - 邻接表: out_edges[节点][类型][终点] = 关系 id, in_edges 方向相反
+      (与 MERGE 语义一致, 同一对节点之间每种类型最多一条关系)
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.relationships = {}
+        self.label_index = defaultdict(set)
+        self.name_index = {}
+        self.type_index = defaultdict(set)
+        self.out_edges = defaultdict(lambda: defaultdict(dict))
+        self.in_edges = defaultdict(lambda: defaultdict(dict))
+        self.constraints = {}  # name -> SHOW CONSTRAINTS 记录
+        self.indexes = {}  # name -> SHOW INDEXES 记录
+        self._next_id = 0
+
+    def _new_id(self):
+        self._next_id += 1
+        return self._next_id
+
+    # --- 节点 ---
+    def create_node(self, labels, props, node_id=None):
+        node_id = self._new_id() if node_id is None else node_id
+        self._next_id = max(self._next_id, node_id)
+        self.nodes[node_id] = {"labels": set(labels), "props": dict(props)}
+        for label in labels:
+            self.label_index[label].add(node_id)
+            if "name" in props:
+                self.name_index[(label, props["name"])] = node_id
+        return node_id
+
+    def find_node(self, label, name):
+        return self.name_index.get((label, name))
+
+    def find_nodes(self, label, prop, value):
+        """按任意属性查找 (name 走唯一索引, 其他属性扫描标签索引)"""
+        if prop == "name":
+            node_id = self.find_node(label, value)
+            return [] if node_id is None else [node_id]
+        return [n for n in self.label_index.get(label, ()) if self.nodes[n]["props"].get(prop) == value]
+
+    def merge_node(self, label, name):
+        """返回 (节点 id, 是否新建)"""
+        node_id = self.find_node(label, name)
+        if node_id is not None:
+            return node_id, False
+        return self.create_node([label], {"name": name}), True
+
+    def delete_node(self, node_id):
+        """DETACH DELETE: 同时删除节点的所有关系"""
+        for edges in (self.out_edges.get(node_id, {}), self.in_edges.get(node_id, {})):
+            for rels in list(edges.values()):
+                for rel_id in list(rels.values()):
+                    self.delete_relationship(rel_id)
+        node = self.nodes.pop(node_id)
+        for label in node["labels"]:
+            self.label_index[label].discard(node_id)
+            if "name" in node["props"]:
+                self.name_index.pop((label, node["props"]["name"]), None)
+        self.out_edges.pop(node_id, None)
+        self.in_edges.pop(node_id, None)
+
+    # --- 关系 ---
+    def create_relationship(self, start, rel_type, end, props, rel_id=None):
+        rel_id = self._new_id() if rel_id is None else rel_id
+        self._next_id = max(self._next_id, rel_id)
+        self.relationships[rel_id] = {"type": rel_type, "start": start, "end": end, "props": dict(props)}
+        self.type_index[rel_type].add(rel_id)
+        self.out_edges[start][rel_type][end] = rel_id
+        self.in_edges[end][rel_type][start] = rel_id
+        return rel_id
+
+    def merge_relationship(self, start, rel_type, end):
+        """返回 (关系 id, 是否新建)"""
+        rel_id = self.out_edges.get(start, {}).get(rel_type, {}).get(end)
+        if rel_id is not None:
+            return rel_id, False
+        return self.create_relationship(start, rel_type, end, {}), True
+
+    def delete_relationship(self, rel_id):
+        rel = self.relationships.pop(rel_id)
+        self.type_index[rel["type"]].discard(rel_id)
+        self.out_edges[rel["start"]][rel["type"]].pop(rel["end"], None)
+        self.in_edges[rel["end"]][rel["type"]].pop(rel["start"], None)
+
+    def relationships_of(self, node_id):
+        """节点的所有关系 id (两个方向)"""
+        for edges in (self.out_edges.get(node_id, {}), self.in_edges.get(node_id, {})):
+            for rels in edges.values():
+                yield from rels.values()
+
+    def primary_label(self, node_id):
+        # 与 labels(n)[0] 对应; 本项目的节点只有一个标签
+        return min(self.nodes[node_id]["labels"])
+
+    # --- 快照 ---
+    def to_dict(self):
+        return {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "nodes": [{"id": n, "labels": sorted(node["labels"]), "props": node["props"]}
+                      for n, node in self.nodes.items()],
+            "relationships": [{"id": r, **rel} for r, rel in self.relationships.items()],
+            "constraints": list(self.constraints.values()),
+            "indexes": list(self.indexes.values()),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"不支持的图快照版本: {data.get('format_version')}")
+        graph = cls()
+        for node in data["nodes"]:
+            graph.create_node(node["labels"], node["props"], node_id=node["id"])
+        for rel in data["relationships"]:
+            graph.create_relationship(rel["start"], rel["type"], rel["end"], rel["props"], rel_id=rel["id"])
+        graph.constraints = {c["name"]: c for c in data.get("constraints", [])}
+        graph.indexes = {i["name"]: i for i in data.get("indexes", [])}
+        return graph
+
+
+def _label_predicate(where):
+    """
+    解析 schema_manager._label_filter 生成的条件, 例如 "(n:A OR n:B) AND NOT n:GraphMeta"。
+    :return: 判断节点标签集合是否满足条件的函数
+    """
+    excluded = set(re.findall(r"NOT n:(\w+)", where))
+    included = set(re.findall(r"(?<!NOT )n:(\w+)", where)) - excluded
+    return lambda labels: not (labels & excluded) and (not included or bool(labels & included))
+
+
+# --- 支持的查询 (空白已规范化) ---
+_Q = re.compile
+# MERGE 之后可以有 ON CREATE SET x.created_at = timestamp() 和任意个 SET x.属性 = 行.字段
+_SETS = r"(?P<on_create> ON CREATE SET {0}\.created_at = timestamp\(\))?(?P<sets>(?: SET {0}\.\w+ = \w+\.\w+(?:, {0}\.\w+ = \w+\.\w+)*)*)"
+_ASSIGNMENT = re.compile(r"\w+\.(\w+) = \w+\.(\w+)")
+MERGE_NODES = _Q(r"UNWIND \$batch AS (?P<v>\w+) MERGE \(n:(?P<label>\w+) \{name: (?P=v)\.name\}\)" + _SETS.format("n"))
+MERGE_RELATIONS = _Q(r"UNWIND \$batch AS (?P<v>\w+) MATCH \(h:(?P<head>\w+) \{name: (?P=v)\.head\}\) "
+                     r"MATCH \(t:(?P<tail>\w+) \{name: (?P=v)\.tail\}\) MERGE \(h\)-\[r:(?P<type>\w+)\]->\(t\)"
+                     + _SETS.format("r"))
+DELETE_NODES = _Q(r"UNWIND \$batch AS (?P<v>\w+) MATCH \(n:(?P<label>\w+) \{name: (?P=v)\.name\}\) DETACH DELETE n")
+DELETE_RELATIONS = _Q(r"UNWIND \$batch AS (?P<v>\w+) MATCH \(h:(?P<head>\w+) \{name: (?P=v)\.head\}\)"
+                      r"-\[r:(?P<type>\w+)\]->\(t:(?P<tail>\w+) \{name: (?P=v)\.tail\}\) DELETE r")
+LOADED_NODES = _Q(r"MATCH \(n\) WHERE n\.content_hash IS NOT NULL RETURN labels\(n\)\[0\] AS label, "
+                  r"n\.name AS name, n\.content_hash AS content_hash")
+# 按关系属性过滤的关系列表, 例如 data_loader.LOADED_RELATIONS_QUERY 和 inference.INFERRED_RELATIONS_QUERY
+_PROPERTY_CONDITION = r"r\.\w+ (?:IS NOT NULL|IS NULL|= true|= false)"
+FILTERED_RELATIONS = _Q(r"MATCH \(h\)-\[r\]->\(t\) WHERE (?P<where>{0}(?: AND {0})*) RETURN labels\(h\)\[0\] AS "
+                        r"head_label, h\.name AS head, type\(r\) AS type, labels\(t\)\[0\] AS tail_label, "
+                        r"t\.name AS tail(?P<props>(?:, r\.\w+ AS \w+)*)".format(_PROPERTY_CONDITION))
+_CONDITION_TESTS = {
+    "IS NOT NULL": lambda value: value is not None,
+    "IS NULL": lambda value: value is None,
+    "= true": lambda value: value is True,
+    "= false": lambda value: value is False,
+}
+ALL_NODES = _Q(r"MATCH \(n\) WHERE NOT n:GraphMeta RETURN labels\(n\)\[0\] AS label, n\.name AS name")
+ALL_RELATIONS = _Q(r"MATCH \(h\)-\[r\]->\(t\) WHERE NOT h:GraphMeta AND NOT t:GraphMeta RETURN labels\(h\)\[0\] AS "
+                   r"head_label, h\.name AS head, type\(r\) AS type, labels\(t\)\[0\] AS tail_label, t\.name AS tail")
+GET_VERSION = _Q(re.escape(" ".join(graph_version.GRAPH_VERSION_QUERY.split())))
+BUMP_VERSION = _Q(re.escape(" ".join(graph_version.BUMP_GRAPH_VERSION_QUERY.split())))
+# GraphMeta 节点上的其他属性, 例如 inference.INFERENCE_RULESET_QUERY
+GET_META = _Q(r"MATCH \(m:GraphMeta \{key: 'graph'\}\) RETURN m\.(?P<prop>\w+) AS (?P<column>\w+)")
+SET_META = _Q(r"MERGE \(m:GraphMeta \{key: 'graph'\}\) SET m\.(?P<prop>\w+) = \$(?P<param>\w+)")
+# 以一批命名节点为端点 (不分方向) 的指定类型的关系, 例如 inference.neighborhood_query 生成的查询
+NEIGHBORHOOD_RELATIONS = _Q(r"UNWIND \$batch AS (?P<v>\w+) MATCH \(n:(?P<label>\w+) \{name: (?P=v)\.name\}\)-\[r\]-\(\) "
+                            r"WHERE type\(r\) IN \$(?P<types>\w+) WITH DISTINCT r, startNode\(r\) AS h, endNode\(r\) AS t "
+                            r"RETURN labels\(h\)\[0\] AS head_label, h\.name AS head, type\(r\) AS type, "
+                            r"labels\(t\)\[0\] AS tail_label, t\.name AS tail(?P<props>(?:, r\.\w+ AS \w+)*)")
+TYPED_RELATIONS = _Q(r"MATCH \(h:(?P<head>\w+)\)-\[r:(?P<type>\w+)\]->\(t:(?P<tail>\w+)\) "
+                     r"RETURN h\.name AS head, t\.name AS tail(?P<props>(?:, r\.\w+ AS \w+)*)")
+# 按关系属性上限过滤的邻居, 例如 qa_system.PREREQUISITES_QUERY
+BOUNDED_NEIGHBORS = _Q(r"MATCH \((?P<a>\w+):(?P<start_label>\w+) \{name: \$(?P<param>\w+)\}\)"
+                       r"-\[r:(?P<type>\w+)\]->\((?P<b>\w+):(?P<end_label>\w+)\) "
+                       r"WHERE \$(?P<bound>\w+) IS NULL OR r\.(?P<prop>\w+) <= \$(?P=bound) "
+                       r"RETURN (?P=b)\.name AS (?P<column>\w+), r\.(?P=prop) AS (?P<prop_column>\w+) "
+                       r"ORDER BY (?P=prop_column), (?P=column)")
+# BOUNDED_NEIGHBORS 的批量形式: 对列表参数中的每个名称各执行一次, 例如 qa_system.PREREQUISITES_BATCH_QUERY
+UNWIND_BOUNDED_NEIGHBORS = _Q(r"UNWIND \$(?P<list>\w+) AS (?P<v>\w+) MATCH \((?P<a>\w+):(?P<start_label>\w+) "
+                              r"\{name: (?P=v)\}\)-\[r:(?P<type>\w+)\]->\((?P<b>\w+):(?P<end_label>\w+)\) "
+                              r"WHERE \$(?P<bound>\w+) IS NULL OR r\.(?P<prop>\w+) <= \$(?P=bound) "
+                              r"RETURN (?P=v), (?P=b)\.name AS (?P<column>\w+), r\.(?P=prop) AS (?P<prop_column>\w+) "
+                              r"ORDER BY (?P=v), (?P=prop_column), (?P=column)")
+# 以一个命名节点为端点的一跳邻居 (实体可以在关系的起点或终点), 例如 qa_system.plan_for 生成的计划
+OUT_NEIGHBORS = _Q(r"MATCH \(a:(?P<anchor_label>\w+) \{name: \$(?P<param>\w+)\}\)-\[r:(?P<type>\w+)\]->"
+                   r"\(b:(?P<other_label>\w+)\) RETURN b\.name AS (?P<column>\w+) ORDER BY (?P=column)")
+IN_NEIGHBORS = _Q(r"MATCH \(b:(?P<other_label>\w+)\)-\[r:(?P<type>\w+)\]->\(a:(?P<anchor_label>\w+) "
+                  r"\{name: \$(?P<param>\w+)\}\) RETURN b\.name AS (?P<column>\w+) ORDER BY (?P=column)")
+# 全文索引查询, 例如 search.FULLTEXT_QUERY
+FULLTEXT_NODES = _Q(r"CALL db\.index\.fulltext\.queryNodes\(\$(?P<index>\w+), \$(?P<query>\w+)\) YIELD node, score "
+                    r"RETURN (?P<returns>.+?) ORDER BY score DESC, (?P<order>\w+) LIMIT \$(?P<limit>\w+)")
+_RETURN_ITEM = re.compile(r"(?:node\.(?P<prop>\w+)|labels\(node\)\[0\]|(?P<score>score))(?: AS (?P<alias>\w+))?")
+# 与 Lucene StandardAnalyzer 相同的切分: 英文/数字按词 (小写), 汉字逐字
+_FULLTEXT_TOKEN = re.compile(r"[a-z0-9]+|[\u3400-\u9fff]")
+CLEAR_RELATIONS = _Q(r"MATCH \(n\)-\[r\]-\(\) WHERE (?P<where>.+) WITH DISTINCT r LIMIT \$batch_size "
+                     r"DELETE r RETURN count\(r\) AS deleted")
+CLEAR_NODES = _Q(r"MATCH \(n\) WHERE (?P<where>.+) WITH n LIMIT \$batch_size DETACH DELETE n "
+                 r"RETURN count\(n\) AS deleted")
+CLEAR_IN_TRANSACTIONS = _Q(r"MATCH \(n\) WHERE (?P<where>.+) CALL \{ WITH n DETACH DELETE n \} "
+                           r"IN TRANSACTIONS OF \$batch_size ROWS")
+COUNT_NODES = _Q(r"MATCH \(n\) WHERE (?P<where>.+) RETURN count\(n\) AS (?P<column>\w+)")
+SHOW_CONSTRAINTS = _Q(r"SHOW CONSTRAINTS")
+SHOW_INDEXES = _Q(r"SHOW INDEXES")
+CREATE_CONSTRAINT = _Q(r"CREATE CONSTRAINT (?P<name>\w+) IF NOT EXISTS FOR \(\w+:(?P<label>\w+)\) "
+                       r"REQUIRE \w+\.(?P<prop>\w+) IS UNIQUE")
+CREATE_INDEX = _Q(r"CREATE (?P<fulltext>FULLTEXT )?INDEX (?P<name>\w+) IF NOT EXISTS FOR "
+                  r"(?:\(\w+:(?P<label>\w+)\)|\(\)-\[\w+:(?P<type>\w+)\]-\(\)) "
+                  r"ON (?:EACH \[(?P<each>[^\]]+)\]|\((?P<fields>[^)]+)\))")
+DROP_SCHEMA = _Q(r"DROP (?P<kind>CONSTRAINT|INDEX) (?P<name>\w+)(?: IF EXISTS)?")
+AWAIT_INDEXES = _Q(r"CALL db\.awaitIndexes\((?:\$\w+|\d+)?\)")
+
+
+# 各模块的具名查询常量 -> 对应的查询形状。按规范化后的完整文本直接分派 (一次字典查找),
+# 只有运行时生成的查询 (按标签/关系类型拼接的 MERGE / DELETE、qa_system.plan_for、模式语句) 才逐个匹配正则。
+# 新增查询常量时在这里登记; 常量与形状不一致时 MemoryConnection 构造时即报错
+NAMED_QUERIES = [
+    (graph_version.GRAPH_VERSION_QUERY, GET_VERSION),
+    (graph_version.BUMP_GRAPH_VERSION_QUERY, BUMP_VERSION),
+    (data_loader.LOADED_NODES_QUERY, LOADED_NODES),
+    (data_loader.LOADED_RELATIONS_QUERY, FILTERED_RELATIONS),
+    (data_loader.PREREQUISITE_EDGES_QUERY, TYPED_RELATIONS),
+    (data_loader.CLOSURE_EDGES_QUERY, TYPED_RELATIONS),
+    (data_loader.CLOSURE_UPSERT_QUERY, MERGE_RELATIONS),
+    (csr_snapshot.SNAPSHOT_NODES_QUERY, ALL_NODES),
+    (csr_snapshot.SNAPSHOT_EDGES_QUERY, ALL_RELATIONS),
+    (inference.INFERRED_RELATIONS_QUERY, FILTERED_RELATIONS),
+    (inference.INFERENCE_RULESET_QUERY, GET_META),
+    (inference.SET_INFERENCE_RULESET_QUERY, SET_META),
+    (qa_system.PREREQUISITES_QUERY, BOUNDED_NEIGHBORS),
+    (qa_system.PREREQUISITES_BATCH_QUERY, UNWIND_BOUNDED_NEIGHBORS),
+    (search.FULLTEXT_QUERY, FULLTEXT_NODES),
+    ("SHOW CONSTRAINTS", SHOW_CONSTRAINTS),
+    ("SHOW INDEXES", SHOW_INDEXES),
+]
+
+
+def _normalize(query):
+    return " ".join(query.split())
+
+
+class MemoryConnection:
+    """
+    进程内的图连接, 与 Neo4jConnection 的 run_query / iter_query / read / write / execute_write /
+    bump_graph_version 接口相同, 可以直接传给 data_loader, schema_manager 和 qa_system。
+
+    只支持这些模块实际生成的 Cypher (按查询形状正则匹配, 见上方的查询列表);
+    每个查询在一把锁内执行, 相当于串行化的事务。
+
+    可选的 snapshot_path: 启动时从 JSON 快照加载, close() 时写回;
+    快照文件被其他进程 (例如 run_pipeline) 更新后, 下一次查询会自动重新加载,
+    因此 run_pipeline 和 run_app 可以在不同进程中共享同一个图。
+    """
+
+    def __init__(self, snapshot_path=None, cache=None, metrics=None):
+        self.snapshot_path = snapshot_path
+        self.cache = cache
+        self.metrics = metrics  # 可选的 QueryMetrics (内存后端没有 PROFILE, 慢查询日志只记录参数)
+        self.graph = InMemoryGraph()
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._snapshot_mtime = None
+        self._handlers = [
+            (MERGE_NODES, self._merge_nodes),
+            (MERGE_RELATIONS, self._merge_relations),
+            (DELETE_NODES, self._delete_nodes),
+            (DELETE_RELATIONS, self._delete_relations),
+            (LOADED_NODES, self._loaded_nodes),
+            (FILTERED_RELATIONS, self._filtered_relations),
+            (ALL_NODES, self._all_nodes),
+            (ALL_RELATIONS, self._all_relations),
+            (GET_VERSION, self._get_version),
+            (BUMP_VERSION, self._bump_version),
+            (GET_META, self._get_meta),
+            (SET_META, self._set_meta),
+            (NEIGHBORHOOD_RELATIONS, self._neighborhood_relations),
+            (TYPED_RELATIONS, self._typed_relations),
+            (BOUNDED_NEIGHBORS, self._bounded_neighbors),
+            (UNWIND_BOUNDED_NEIGHBORS, self._unwind_bounded_neighbors),
+            (OUT_NEIGHBORS, lambda match, params: self._neighbors(match, params, self.graph.out_edges)),
+            (IN_NEIGHBORS, lambda match, params: self._neighbors(match, params, self.graph.in_edges)),
+            (FULLTEXT_NODES, self._fulltext_nodes),
+            (CLEAR_RELATIONS, self._clear_relations),
+            (CLEAR_NODES, self._clear_nodes),
+            (CLEAR_IN_TRANSACTIONS, self._clear_in_transactions),
+            (COUNT_NODES, self._count_nodes),
+            (SHOW_CONSTRAINTS, self._show_constraints),
+            (SHOW_INDEXES, self._show_indexes),
+            (CREATE_CONSTRAINT, self._create_constraint),
+            (CREATE_INDEX, self._create_index),
+            (DROP_SCHEMA, self._drop_schema),
+            (AWAIT_INDEXES, lambda match, params: []),
+        ]
+        handlers = dict(self._handlers)
+        self._named = {}
+        for query, pattern in NAMED_QUERIES:
+            normalized = _normalize(query)
+            match = pattern.fullmatch(normalized)
+            if match is None:
+                raise UnsupportedQueryError(f"具名查询与登记的形状不一致: {normalized[:200]}")
+            self._named[normalized] = (handlers[pattern], match)
+        self._reload_if_changed()
+
+    @classmethod
+    def from_config(cls, config, cache=None, metrics=None):
+        """根据 config.ini 的 [GRAPH] 部分创建 (SNAPSHOT_FILE 为空时不持久化)"""
+        snapshot_path = config.get('GRAPH', 'SNAPSHOT_FILE', fallback='') or None
+        return cls(snapshot_path=snapshot_path, cache=cache, metrics=metrics)
+
+    def verify_connectivity(self):
+        return True
+
+    def close(self):
+        self.save_snapshot()
+
+    # --- 快照 ---
+    def save_snapshot(self):
+        """把有改动的图写回快照文件 (先写临时文件再替换, 读取方不会看到写了一半的文件)"""
+        with self._lock:
+            if not self.snapshot_path or not self._dirty:
+                return
+            directory = os.path.dirname(self.snapshot_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.snapshot_path}.tmp"
+            save_json(self.graph.to_dict(), tmp_path)
+            os.replace(tmp_path, self.snapshot_path)
+            self._snapshot_mtime = os.path.getmtime(self.snapshot_path)
+            self._dirty = False
+            logger.info(f"[MemoryGraph] 已保存快照: {len(self.graph.nodes)} 个节点, "
+                        f"{len(self.graph.relationships)} 条关系 -> {self.snapshot_path}")
+
+    def _reload_if_changed(self):
+        # 本进程有未保存的改动时不重新加载, 以免覆盖
+        if not self.snapshot_path or self._dirty:
+            return
+        try:
+            mtime = os.path.getmtime(self.snapshot_path)
+        except OSError:
+            return
+        if mtime != self._snapshot_mtime:
+            self.graph = InMemoryGraph.from_dict(read_json(self.snapshot_path))
+            self._snapshot_mtime = mtime
+            logger.info(f"[MemoryGraph] 已加载快照: {len(self.graph.nodes)} 个节点, "
+                        f"{len(self.graph.relationships)} 条关系 <- {self.snapshot_path}")
+
+    # --- 与 Neo4jConnection 相同的接口 ---
+    def _resolve(self, query):
+        """返回 (处理函数, 匹配结果): 具名查询直接查表, 生成的查询按形状匹配; 不支持时返回 None"""
+        normalized = _normalize(query)
+        named = self._named.get(normalized)
+        if named is not None:
+            return named
+        for pattern, handler in self._handlers:
+            match = pattern.fullmatch(normalized)
+            if match:
+                return handler, match
+        return None
+
+    def _execute(self, query, parameters=None):
+        resolved = self._resolve(query)
+        if resolved is None:
+            raise UnsupportedQueryError(f"内存图后端不支持该查询: {_normalize(query)[:200]}")
+        handler, match = resolved
+        with self._lock:
+            self._reload_if_changed()
+            return handler(match, parameters or {})
+
+    def _measured(self, query, parameters, operation):
+        if self.metrics is None:
+            return self._execute(query, parameters)
+        with self.metrics.measure(query, parameters, operation):
+            return self._execute(query, parameters)
+
+    def run_query(self, query, parameters=None, database="neo4j"):
+        return self._measured(query, parameters, "run")
+
+    def iter_query(self, query, parameters=None, database="neo4j"):
+        yield from self._measured(query, parameters, "iter")
+
+    def read(self, query, parameters=None, database="neo4j", use_cache=True):
+        """与 Neo4jConnection.read 相同, 配置了 cache 时按图版本号缓存结果"""
+        if self.cache is None or not use_cache:
+            return self._measured(query, parameters, "read")
+
+        version = self.cache.current_version(lambda: graph_version.get_graph_version(self))
+        key = QueryCache.make_key(query, parameters, database)
+        hit, records = self.cache.get(key, version)
+        if not hit:
+            records = self._measured(query, parameters, "read")
+            self.cache.put(key, version, records)
+        return list(records)
+
+    def write(self, query, parameters=None, database="neo4j"):
+        return self._measured(query, parameters, "write")
+
+    def execute_write(self, query, parameters=None, database="neo4j"):
+        self._measured(query, parameters, "write")
+
+    def bump_graph_version(self):
+        version = graph_version.bump_graph_version(self)
+        if self.cache is not None:
+            self.cache.set_version(version)
+        return version
+
+    # --- 查询实现 ---
+    @staticmethod
+    def _apply_sets(match, props, row, created, now):
+        if created and match["on_create"]:
+            props["created_at"] = now
+        for prop, field in _ASSIGNMENT.findall(match["sets"]):
+            props[prop] = row.get(field)
+
+    def _merge_nodes(self, match, params):
+        label, now = match["label"], _timestamp()
+        for row in params["batch"]:
+            node_id, created = self.graph.merge_node(label, row["name"])
+            self._apply_sets(match, self.graph.nodes[node_id]["props"], row, created, now)
+        self._dirty = True
+        return []
+
+    def _merge_relations(self, match, params):
+        now = _timestamp()
+        for row in params["batch"]:
+            head = self.graph.find_node(match["head"], row["head"])
+            tail = self.graph.find_node(match["tail"], row["tail"])
+            if head is None or tail is None:
+                continue  # 与 MATCH 不到端点时相同: 跳过
+            rel_id, created = self.graph.merge_relationship(head, match["type"], tail)
+            self._apply_sets(match, self.graph.relationships[rel_id]["props"], row, created, now)
+        self._dirty = True
+        return []
+
+    def _delete_nodes(self, match, params):
+        for row in params["batch"]:
+            node_id = self.graph.find_node(match["label"], row["name"])
+            if node_id is not None:
+                self.graph.delete_node(node_id)
+        self._dirty = True
+        return []
+
+    def _delete_relations(self, match, params):
+        for row in params["batch"]:
+            head = self.graph.find_node(match["head"], row["head"])
+            tail = self.graph.find_node(match["tail"], row["tail"])
+            rel_id = self.graph.out_edges.get(head, {}).get(match["type"], {}).get(tail)
+            if rel_id is not None:
+                self.graph.delete_relationship(rel_id)
+        self._dirty = True
+        return []
+
+    def _loaded_nodes(self, match, params):
+        graph = self.graph
+        return [{"label": graph.primary_label(n), "name": node["props"].get("name"),
+                 "content_hash": node["props"]["content_hash"]}
+                for n, node in graph.nodes.items() if node["props"].get("content_hash") is not None]
+
+    def _filtered_relations(self, match, params):
+        graph = self.graph
+        conditions = [(prop, _CONDITION_TESTS[test]) for prop, test in
+                      re.findall(r"r\.(\w+) (IS NOT NULL|IS NULL|= true|= false)", match["where"])]
+        columns = re.findall(r"r\.(\w+) AS (\w+)", match["props"])
+        records = []
+        for rel in graph.relationships.values():
+            if not all(test(rel["props"].get(prop)) for prop, test in conditions):
+                continue
+            head, tail = graph.nodes[rel["start"]], graph.nodes[rel["end"]]
+            record = {"head_label": graph.primary_label(rel["start"]), "head": head["props"].get("name"),
+                      "type": rel["type"], "tail_label": graph.primary_label(rel["end"]),
+                      "tail": tail["props"].get("name")}
+            record.update({column: rel["props"].get(prop) for prop, column in columns})
+            records.append(record)
+        return records
+
+    def _all_nodes(self, match, params):
+        graph = self.graph
+        return [{"label": graph.primary_label(n), "name": node["props"].get("name")}
+                for n, node in graph.nodes.items() if "GraphMeta" not in node["labels"]]
+
+    def _all_relations(self, match, params):
+        graph = self.graph
+        return [{"head_label": graph.primary_label(rel["start"]), "head": graph.nodes[rel["start"]]["props"].get("name"),
+                 "type": rel["type"], "tail_label": graph.primary_label(rel["end"]),
+                 "tail": graph.nodes[rel["end"]]["props"].get("name")}
+                for rel in graph.relationships.values()]
+
+    def _get_version(self, match, params):
+        return [{"version": self.graph.nodes[n]["props"].get("version")}
+                for n in self.graph.find_nodes("GraphMeta", "key", "graph")]
+
+    def _bump_version(self, match, params):
+        found = self.graph.find_nodes("GraphMeta", "key", "graph")
+        node_id = found[0] if found else self.graph.create_node(["GraphMeta"], {"key": "graph"})
+        props = self.graph.nodes[node_id]["props"]
+        props["version"] = (props.get("version") or 0) + 1
+        props["updated_at"] = _timestamp()
+        self._dirty = True
+        return [{"version": props["version"]}]
+
+    def _get_meta(self, match, params):
+        return [{match["column"]: self.graph.nodes[n]["props"].get(match["prop"])}
+                for n in self.graph.find_nodes("GraphMeta", "key", "graph")]
+
+    def _set_meta(self, match, params):
+        found = self.graph.find_nodes("GraphMeta", "key", "graph")
+        node_id = found[0] if found else self.graph.create_node(["GraphMeta"], {"key": "graph"})
+        self.graph.nodes[node_id]["props"][match["prop"]] = params[match["param"]]
+        self._dirty = True
+        return []
+
+    def _neighborhood_relations(self, match, params):
+        graph = self.graph
+        types = set(params[match["types"]])
+        columns = re.findall(r"r\.(\w+) AS (\w+)", match["props"])
+        rel_ids = set()
+        for row in params["batch"]:
+            node_id = graph.find_node(match["label"], row["name"])
+            if node_id is not None:
+                rel_ids.update(rel_id for rel_id in graph.relationships_of(node_id)
+                               if graph.relationships[rel_id]["type"] in types)
+        records = []
+        for rel_id in rel_ids:
+            rel = graph.relationships[rel_id]
+            record = {"head_label": graph.primary_label(rel["start"]),
+                      "head": graph.nodes[rel["start"]]["props"].get("name"), "type": rel["type"],
+                      "tail_label": graph.primary_label(rel["end"]),
+                      "tail": graph.nodes[rel["end"]]["props"].get("name")}
+            record.update({column: rel["props"].get(prop) for prop, column in columns})
+            records.append(record)
+        return records
+
+    def _typed_relations(self, match, params):
+        graph = self.graph
+        columns = re.findall(r"r\.(\w+) AS (\w+)", match["props"])
+        records = []
+        for rel_id in graph.type_index.get(match["type"], ()):
+            rel = graph.relationships[rel_id]
+            head, tail = graph.nodes[rel["start"]], graph.nodes[rel["end"]]
+            if match["head"] in head["labels"] and match["tail"] in tail["labels"]:
+                record = {"head": head["props"].get("name"), "tail": tail["props"].get("name")}
+                record.update({column: rel["props"].get(prop) for prop, column in columns})
+                records.append(record)
+        return records
+
+    def _bounded_neighbors(self, match, params):
+        return self._bounded_from(match, params[match["param"]], params.get(match["bound"]))
+
+    def _unwind_bounded_neighbors(self, match, params):
+        records = []
+        for name in params[match["list"]]:
+            records.extend({match["v"]: name, **record}
+                           for record in self._bounded_from(match, name, params.get(match["bound"])))
+        records.sort(key=lambda r: r[match["v"]])  # 稳定排序, 同一名称内保持 (距离, 名称) 顺序
+        return records
+
+    def _bounded_from(self, match, name, bound):
+        graph = self.graph
+        start = graph.find_node(match["start_label"], name)
+        if start is None:
+            return []
+        prop = match["prop"]
+        records = []
+        for end, rel_id in graph.out_edges.get(start, {}).get(match["type"], {}).items():
+            value = graph.relationships[rel_id]["props"].get(prop)
+            if match["end_label"] in graph.nodes[end]["labels"] and (bound is None or
+                                                                     (value is not None and value <= bound)):
+                records.append({match["column"]: graph.nodes[end]["props"].get("name"), match["prop_column"]: value})
+        records.sort(key=lambda r: (r[match["prop_column"]] is None, r[match["prop_column"]], r[match["column"]]))
+        return records
+
+    def _neighbors(self, match, params, edges):
+        graph = self.graph
+        anchor = graph.find_node(match["anchor_label"], params[match["param"]])
+        if anchor is None:
+            return []
+        names = sorted(graph.nodes[other]["props"].get("name")
+                       for other in edges.get(anchor, {}).get(match["type"], {})
+                       if match["other_label"] in graph.nodes[other]["labels"])
+        return [{match["column"]: name} for name in names]
+
+    def _fulltext_nodes(self, match, params):
+        """
+        用 TF-IDF 近似 Lucene 的打分: sum(sqrt(tf) * idf) / sqrt(文档词数), 只用于本地和测试,
+        得分的绝对值与 Neo4j 不同, 但排序的含义一致 (命中词越多、越稀有、字段越短, 得分越高)。
+        """
+        index = self.graph.indexes.get(params[match["index"]])
+        if index is None or index["type"] != "FULLTEXT" or index["entityType"] != "NODE":
+            raise ValueError(f"全文索引不存在: {params[match['index']]}")
+        terms = set(_FULLTEXT_TOKEN.findall(params[match["query"]].lower()))
+        documents = []
+        for label in index["labelsOrTypes"]:
+            for node_id in self.graph.label_index.get(label, ()):
+                props = self.graph.nodes[node_id]["props"]
+                text = " ".join(str(props[p]) for p in index["properties"] if props.get(p) is not None)
+                documents.append((node_id, _FULLTEXT_TOKEN.findall(text.lower())))
+        frequency = defaultdict(int)
+        for _, tokens in documents:
+            for term in terms.intersection(tokens):
+                frequency[term] += 1
+
+        hits = []
+        for node_id, tokens in documents:
+            matched = terms.intersection(tokens)
+            if matched:
+                score = sum(math.sqrt(tokens.count(t)) * (1 + math.log(len(documents) / (frequency[t] + 1)))
+                            for t in matched) / math.sqrt(len(tokens))
+                hits.append((node_id, score))
+
+        records = []
+        for node_id, score in hits:
+            node = self.graph.nodes[node_id]
+            record = {}
+            for item in _RETURN_ITEM.finditer(match["returns"]):
+                if item["score"]:
+                    record[item["alias"] or "score"] = score
+                elif item["prop"]:
+                    record[item["alias"]] = node["props"].get(item["prop"])
+                else:
+                    record[item["alias"]] = self.graph.primary_label(node_id)
+            records.append(record)
+        records.sort(key=lambda r: (-r["score"], r[match["order"]]))
+        return records[:params[match["limit"]]]
+
+    def _matching_nodes(self, where):
+        predicate = _label_predicate(where)
+        return [n for n, node in self.graph.nodes.items() if predicate(node["labels"])]
+
+    def _clear_relations(self, match, params):
+        limit = params["batch_size"]
+        rel_ids = set()
+        for node_id in self._matching_nodes(match["where"]):
+            for rel_id in self.graph.relationships_of(node_id):
+                rel_ids.add(rel_id)
+                if len(rel_ids) >= limit:
+                    break
+            if len(rel_ids) >= limit:
+                break
+        for rel_id in rel_ids:
+            self.graph.delete_relationship(rel_id)
+        self._dirty = self._dirty or bool(rel_ids)
+        return [{"deleted": len(rel_ids)}]
+
+    def _clear_nodes(self, match, params):
+        node_ids = self._matching_nodes(match["where"])[:params["batch_size"]]
+        for node_id in node_ids:
+            self.graph.delete_node(node_id)
+        self._dirty = self._dirty or bool(node_ids)
+        return [{"deleted": len(node_ids)}]
+
+    def _clear_in_transactions(self, match, params):
+        for node_id in self._matching_nodes(match["where"]):
+            self.graph.delete_node(node_id)
+        self._dirty = True
+        return []
+
+    def _count_nodes(self, match, params):
+        return [{match["column"]: len(self._matching_nodes(match["where"]))}]
+
+    def _show_constraints(self, match, params):
+        return [dict(record) for record in self.graph.constraints.values()]
+
+    def _show_indexes(self, match, params):
+        return [dict(record) for record in self.graph.indexes.values()]
+
+    def _create_constraint(self, match, params):
+        name = match["name"]
+        if name not in self.graph.constraints:
+            self.graph.constraints[name] = {"name": name, "type": "UNIQUENESS", "entityType": "NODE",
+                                            "labelsOrTypes": [match["label"]], "properties": [match["prop"]],
+                                            "state": "ONLINE"}
+            self._dirty = True
+        return []
+
+    def _create_index(self, match, params):
+        name = match["name"]
+        if name not in self.graph.indexes:
+            fields = match["each"] or match["fields"]
+            self.graph.indexes[name] = {
+                "name": name,
+                "type": "FULLTEXT" if match["fulltext"] else "RANGE",
+                "entityType": "NODE" if match["label"] else "RELATIONSHIP",
+                "labelsOrTypes": [match["label"] or match["type"]],
+                "properties": [field.strip().split(".", 1)[1] for field in fields.split(",")],
+                "state": "ONLINE",
+                "provider": "memory",
+            }
+            self._dirty = True
+        return []
+
+    def _drop_schema(self, match, params):
+        store = self.graph.constraints if match["kind"] == "CONSTRAINT" else self.graph.indexes
+        if store.pop(match["name"], None) is not None:
+            self._dirty = True
+        return []
@@ -0,0 +1,151 @@
+# 读查询结果缓存 (按图版本失效)
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def _estimate_size(obj):
+    """粗略估计缓存值占用的内存 (字节)"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_estimate_size(k) + _estimate_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_estimate_size(item) for item in obj)
+    return size
+
+
+class QueryCache:
+    """
+    线程安全的读查询缓存。
+
+    - 键: (database, 查询文本, 参数)
+    - 失效: 每个条目记录写入时的图版本号, 版本号变化后条目自动作废;
+      同时支持 TTL 过期和 LRU 淘汰
+    - 内存上限: 按估计大小累计, 超出 max_bytes 时从最久未使用的条目开始淘汰
+    - 统计: hits / misses / evictions
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=300, max_bytes=64 * 1024 * 1024,
+                 version_check_interval=1.0):
+        """
+        :param version_check_interval: 向数据库确认图版本号的最小间隔 (秒),
+                                       在此期间内认为版本号没有变化
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.version_check_interval = version_check_interval
+
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()  # key -> (value, size, expires_at, version)
+        self._bytes = 0
+        self._version = None
+        self._version_checked_at = float('-inf')
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_config(cls, config, section='CACHE'):
+        """根据 config.ini 的 [CACHE] (或 section 指定的) 部分创建缓存; 未启用时返回 None"""
+        if not config.getboolean(section, 'ENABLED', fallback=False):
+            return None
+        section = config[section]
+        return cls(
+            max_entries=section.getint('MAX_ENTRIES', 10000),
+            ttl_seconds=section.getfloat('TTL_SECONDS', 300),
+            max_bytes=int(section.getfloat('MAX_MB', 64) * 1024 * 1024),
+            version_check_interval=section.getfloat('VERSION_CHECK_INTERVAL', 1.0),
+        )
+
+    @staticmethod
+    def make_key(query, parameters, database):
+        params = json.dumps(parameters or {}, sort_keys=True, ensure_ascii=False, default=str)
+        return database, " ".join(query.split()), params
+
+    # --- 图版本号 ---
+    def current_version(self, fetch_version):
+        """
+        返回当前图版本号; 距离上次确认超过 version_check_interval 时调用 fetch_version() 刷新。
+        版本号变化时清空所有旧条目。
+        fetch_version() 在锁外执行, 期间其他线程可能已经 set_version 了更新的版本号,
+        所以只接受不小于当前值的版本号 (版本号单调递增), 避免回退到旧版本。
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._version_checked_at < self.version_check_interval:
+                return self._version
+        version = fetch_version()
+        with self._lock:
+            if self._version is not None and version is not None and version < self._version:
+                version = self._version
+            self._set_version(version, now)
+            return self._version
+
+    def set_version(self, version):
+        """(本进程写入后) 直接设置新版本号, 不必等下一次检查"""
+        with self._lock:
+            self._set_version(version, time.monotonic())
+
+    def _set_version(self, version, checked_at):
+        if version != self._version:
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+        self._version_checked_at = checked_at
+
+    # --- 读写 ---
+    def get(self, key, version):
+        """命中返回 (True, value), 否则返回 (False, None)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, size, expires_at, entry_version = entry
+                if entry_version == version and expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                self._remove(key)
+            self.misses += 1
+            return False, None
+
+    def put(self, key, version, value):
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if version != self._version:
+                return  # 结果对应的版本已经过期, 不缓存
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.monotonic() + self.ttl_seconds, version)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "graph_version": self._version,
+            }
@@ -0,0 +1,155 @@
+# 数据库查询耗时 (按查询指纹) 与慢查询日志, 由 Neo4jConnection / MemoryConnection 记录
+import contextlib
+import functools
+import hashlib
+import json
+import re
+import threading
+import time
+from kg_course_project.utils.logger import get_logger
+from kg_course_project.utils.metrics import REGISTRY
+
+logger = get_logger(__name__)
+
+# 只有读操作会被记入慢查询日志并重新 PROFILE (写操作重新执行会修改数据; 加载器的大批量写入本来就慢)。
+# iter_query 的耗时覆盖整个流式读取, 包括调用方处理每条记录的时间, 而且主要用于全图导出,
+# 只记入耗时直方图, 不算慢查询
+PROFILED_OPERATIONS = ("read",)
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+
+# 指纹 -> 规范化后的查询文本 (/metrics 中的 kg_db_query_info)
+_QUERY_TEXTS = {}
+
+
+@functools.lru_cache(maxsize=1024)
+def fingerprint(query):
+    """
+    查询指纹: 规范化空白并把字面量替换为 ? 之后取 SHA-1 前 12 位;
+    参数化的查询 (值都在 $参数 中) 同一形状的所有调用共用一个指纹。
+    :return: (指纹, 规范化后的查询文本)
+    """
+    normalized = _NUMBER_LITERAL.sub("?", _STRING_LITERAL.sub("?", " ".join(query.split())))
+    key = hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+    _QUERY_TEXTS[key] = normalized
+    return key, normalized
+
+
+def profile_summary(plan):
+    """
+    PROFILE 执行计划 (驱动返回的 dict, 算子树) 的汇总。
+    :return: {"db_hits": 所有算子的 db hits 之和, "rows": 根算子输出的行数, "operators": 算子类型 (先序)}
+    """
+    db_hits, operators, stack = 0, [], [plan]
+    while stack:
+        operator = stack.pop()
+        db_hits += operator.get("dbHits", 0) or 0
+        operators.append(operator.get("operatorType"))
+        stack.extend(reversed(operator.get("children", [])))
+    return {"db_hits": db_hits, "rows": plan.get("rows"), "operators": operators}
+
+
+def _format_parameters(parameters, max_chars):
+    text = json.dumps(parameters or {}, ensure_ascii=False, default=str, sort_keys=True)
+    return text if len(text) <= max_chars else f"{text[:max_chars]}... ({len(text)} 字符)"
+
+
+class QueryMetrics:
+    """
+    - kg_db_query_duration_seconds{fingerprint, operation}: 查询耗时直方图 (缓存命中不计入)
+    - kg_db_query_errors_total / kg_db_slow_queries_total: 出错次数 / 慢查询次数
+    - 慢查询日志: 超过 slow_query_ms 的读查询记录参数; 连接提供 profiler 时,
+      在后台线程中以 PROFILE 重新执行一次 (同一指纹每 profile_interval 秒最多一次), 日志中附带 db hits 和行数
+    记录一次查询只是几次加法, 不被抓取时开销可以忽略。
+    """
+
+    def __init__(self, slow_query_ms=200.0, profile_slow_queries=True, profile_interval=60.0,
+                 max_parameter_chars=500, registry=REGISTRY):
+        self.slow_query_ms = slow_query_ms
+        self.profile_slow_queries = profile_slow_queries
+        self.profile_interval = profile_interval
+        self.max_parameter_chars = max_parameter_chars
+        self.duration = registry.histogram("kg_db_query_duration_seconds", "数据库查询耗时 (秒), 按查询指纹",
+                                           ("fingerprint", "operation"))
+        self.errors = registry.counter("kg_db_query_errors_total", "出错的数据库查询", ("fingerprint", "operation"))
+        self.slow_queries = registry.counter("kg_db_slow_queries_total", "慢查询次数", ("fingerprint",))
+        self._lock = threading.Lock()
+        self._profiled_at = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """根据 config.ini 的 [METRICS] 部分创建; 未启用时返回 None"""
+        if not config.getboolean('METRICS', 'ENABLED', fallback=False):
+            return None
+        section = config['METRICS']
+        return cls(
+            slow_query_ms=section.getfloat('SLOW_QUERY_MS', 200.0),
+            profile_slow_queries=section.getboolean('PROFILE_SLOW_QUERIES', True),
+            profile_interval=section.getfloat('PROFILE_INTERVAL', 60.0),
+        )
+
+    @contextlib.contextmanager
+    def measure(self, query, parameters, operation, profiler=None):
+        """
+        with metrics.measure(query, parameters, "read", profiler): ...
+        :param profiler: 可选, profiler(query, parameters) 以 PROFILE 执行查询并返回执行计划
+        """
+        key, _ = fingerprint(query)
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errors.inc(key, operation)
+            raise
+        elapsed = time.perf_counter() - start
+        self.duration.observe(elapsed, key, operation)
+        if elapsed * 1000 >= self.slow_query_ms and operation in PROFILED_OPERATIONS:
+            self._slow_query(query, parameters, operation, elapsed, profiler)
+
+    def _slow_query(self, query, parameters, operation, elapsed, profiler):
+        key, normalized = fingerprint(query)
+        self.slow_queries.inc(key)
+        if profiler is not None and self.profile_slow_queries and self._claim_profile(key):
+            # PROFILE 会再执行一次查询, 放到后台线程, 不增加请求延迟
+            threading.Thread(target=self._profile_and_log,
+                             args=(profiler, query, parameters, operation, elapsed),
+                             name="slow-query-profile", daemon=True).start()
+        else:
+            self._log(key, normalized, parameters, operation, elapsed)
+
+    def _claim_profile(self, key):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._profiled_at.get(key, float('-inf')) < self.profile_interval:
+                return False
+            self._profiled_at[key] = now
+            return True
+
+    def _profile_and_log(self, profiler, query, parameters, operation, elapsed):
+        key, normalized = fingerprint(query)
+        try:
+            summary = profile_summary(profiler(query, parameters))
+        except Exception as e:
+            summary = {"error": str(e)}
+        self._log(key, normalized, parameters, operation, elapsed, summary)
+
+    def _log(self, key, normalized, parameters, operation, elapsed, summary=None):
+        message = (f"[SlowQuery] {key} {operation} {elapsed * 1000:.1f}ms "
+                   f"参数={_format_parameters(parameters, self.max_parameter_chars)} 查询={normalized}")
+        if summary is not None:
+            if "error" in summary:
+                message += f" PROFILE 失败: {summary['error']}"
+            else:
+                message += (f" PROFILE: db hits={summary['db_hits']}, rows={summary['rows']}, "
+                            f"算子={' > '.join(str(op) for op in summary['operators'])}")
+        logger.warning(message)
+
+
+def collect_query_texts():
+    """/metrics 的收集函数: 指纹 -> 查询文本 (前 200 个字符), 便于从指纹查到查询"""
+    return [("kg_db_query_info", "gauge", "查询指纹对应的查询文本",
+             [({"fingerprint": key, "query": text[:200]}, 1) for key, text in sorted(_QUERY_TEXTS.items())])]
+
+
+REGISTRY.register_collector(collect_query_texts)
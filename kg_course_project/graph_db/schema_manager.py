@@ -6,21 +6,102 @@ from neo4j.exceptions import ClientError
 
 logger = get_logger(__name__)
 
-def clear_database(conn, confirm=False):
+def _label_filter(labels):
+    """生成节点过滤条件; GraphMeta (图版本号) 永远保留"""
+    if labels:
+        return "(" + " OR ".join(f"n:{label}" for label in labels) + ") AND NOT n:GraphMeta"
+    return "NOT n:GraphMeta"
+
+
+# clear_database 的删除方式
+CLEAR_MODES = ("loop", "in_transactions")
+
+
+def clear_database(conn, confirm=False, batch_size=10000, labels=None, deadline_seconds=None,
+                   mode="loop"):
 
     if not confirm:
         raise ValueError('此操作会清空所有数据！请设置 confirm=True 来确认')
 
     """
-        清空所有节点和关系 (危险操作)。
-        使用 DETACH DELETE 以删除节点及其所有关系。
+        分批清空节点和关系 (危险操作)。
+        一次性 DETACH DELETE 整个图会耗尽事务内存, 所以按 batch_size 分批提交:
+
+        - mode="loop": 由 Python 循环执行有上限的删除, 先删关系再删节点,
+          每批打印进度和 rows/sec, 超过 deadline_seconds 时提前停止
+        - mode="in_transactions": 使用服务端的 CALL { ... } IN TRANSACTIONS OF n ROWS
+          (单条自动提交查询, 不支持进度和截止时间)
+
+        :param labels: 只删除这些标签的节点 (及其关系); 默认删除全部
+        :param deadline_seconds: 最长运行时间, 到时停止 (之后可以再次调用继续删除)
+        :return: {"nodes_deleted", "relationships_deleted", "seconds", "rows_per_sec", "completed"}
+        :raises: 删除过程中的数据库错误会在记录日志后重新抛出
         """
-    logger.warning("正在清空整个数据库 (所有节点和关系)...")
+    if mode not in CLEAR_MODES:
+        raise ValueError(f"未知的清空模式: {mode} (可选 {' / '.join(CLEAR_MODES)})")
+    target = f"标签 {labels}" if labels else "整个数据库"
+    logger.warning(f"正在分批清空{target} (每批 {batch_size} 行)...")
+    where = _label_filter(labels)
+    start = time.monotonic()
+    stats = {"nodes_deleted": 0, "relationships_deleted": 0, "completed": False}
+
     try:
-        conn.run_query("MATCH (n) DETACH DELETE n")
-        logger.info("数据库已清空。")
+        if mode == "in_transactions":
+            counts = conn.run_query(f"MATCH (n) WHERE {where} RETURN count(n) AS c")
+            conn.run_query(f"""
+            MATCH (n) WHERE {where}
+            CALL {{ WITH n DETACH DELETE n }} IN TRANSACTIONS OF $batch_size ROWS
+            """, parameters={"batch_size": batch_size})
+            stats["nodes_deleted"] = counts[0]["c"]
+            stats["completed"] = True
+        else:
+            steps = [
+                ("relationships_deleted", f"""
+                MATCH (n)-[r]-() WHERE {where}
+                WITH DISTINCT r LIMIT $batch_size
+                DELETE r
+                RETURN count(r) AS deleted
+                """),
+                ("nodes_deleted", f"""
+                MATCH (n) WHERE {where}
+                WITH n LIMIT $batch_size
+                DETACH DELETE n
+                RETURN count(n) AS deleted
+                """),
+            ]
+            stopped = False
+            for key, query in steps:
+                deleted = batch_size
+                while deleted == batch_size:
+                    if deadline_seconds is not None and time.monotonic() - start > deadline_seconds:
+                        logger.warning(f"已达到截止时间 ({deadline_seconds}s), 提前停止清空。")
+                        stopped = True
+                        break
+                    deleted = conn.write(query, parameters={"batch_size": batch_size})[0]["deleted"]
+                    stats[key] += deleted
+                    elapsed = time.monotonic() - start
+                    done = stats["nodes_deleted"] + stats["relationships_deleted"]
+                    logger.info(f"已删除 {stats['relationships_deleted']} 条关系, {stats['nodes_deleted']} 个节点 "
+                                f"({done / elapsed if elapsed > 0 else 0:.0f} rows/s)")
+                if stopped:
+                    break
+            # 两步都删完 (没有因截止时间提前停止) 才算清空完成
+            stats["completed"] = not stopped
+
+        if stats["completed"]:
+            logger.info(f"{target}已清空。")
     except Exception as e:
+        # 向上抛出, 调用方 (如 run_pipeline --rebuild) 不能在没清空的库上继续全量加载
         logger.error(f"清空数据库时出错: {e}")
+        raise
+    finally:
+        # 出错时已经删除的部分也改变了图, 同样递增图版本号
+        stats["seconds"] = time.monotonic() - start
+        done = stats["nodes_deleted"] + stats["relationships_deleted"]
+        stats["rows_per_sec"] = done / stats["seconds"] if stats["seconds"] > 0 else 0.0
+        if done and hasattr(conn, "bump_graph_version"):
+            conn.bump_graph_version()
+    return stats
 
 
 def drop_all_schema(conn):
@@ -55,80 +136,228 @@ def drop_all_schema(conn):
     logger.info("所有索引和约束已删除。")
 
 
-def apply_schema_from_yaml(conn, schema_path):
+def _normalize_type(schema_type):
+    """把不同 Neo4j 版本中的约束/索引类型统一: UNIQUENESS -> UNIQUE, BTREE -> RANGE"""
+    schema_type = schema_type.upper()
+    if "UNIQUE" in schema_type:
+        return "UNIQUE"
+    if schema_type == "BTREE":
+        return "RANGE"
+    return schema_type
+
+
+# schema.yaml 中的索引写法 -> SHOW INDEXES 中的类型
+INDEX_TYPES = {"simple": "RANGE", "range": "RANGE", "fulltext": "FULLTEXT"}
+# 本模块创建的全文索引的名称前缀 (见 _index_item)
+FULLTEXT_INDEX_PREFIX = "ft_idx_"
+
+
+def _index_item(entity_type, label, properties, index):
     """
-    (丰富版) 根据 schema.yaml 文件应用所有约束和索引。
-    支持: 'unique' 约束, 'simple' 索引 (B-Tree), 'fulltext' 索引。
+    生成一个 (单属性或复合) 索引项。
+    :param entity_type: "NODE" 或 "RELATIONSHIP"
+    :param label: 节点标签或关系类型
+    :param properties: 属性名列表, 复合索引的属性顺序即为索引中的顺序
+    :param index: 'simple' / 'range' (B-Tree / Range Index) 或 'fulltext'
+    :return: 索引项; 未知的索引类型返回 None
+    """
+    schema_type = INDEX_TYPES.get(index)
+    if schema_type is None:
+        logger.warning(f"未知的索引类型 '{index}' ({label} {list(properties)}), 已跳过。")
+        return None
+
+    if entity_type == "NODE":
+        var, pattern, prefix, display = "n", f"(n:{label})", "", f"(:{label})"
+    else:
+        var, pattern, prefix, display = "r", f"()-[r:{label}]-()", "rel_", f"[:{label}]"
+    fields = ", ".join(f"{var}.{p}" for p in properties)
+    suffix = "_".join(properties)
+    kind = "Composite" if len(properties) > 1 else ("Rel" if entity_type == "RELATIONSHIP" else "Simple")
+
+    if schema_type == "RANGE":
+        name = f"idx_{prefix}{label}_{suffix}"
+        description = f"[{kind} Index] ON {display} {list(properties)}"
+        query = f"CREATE INDEX {name} IF NOT EXISTS FOR {pattern} ON ({fields})"
+    else:
+        name = f"{FULLTEXT_INDEX_PREFIX}{prefix}{label}_{suffix}"
+        description = f"[Fulltext Index] ON {display} {list(properties)}"
+        query = f"CREATE FULLTEXT INDEX {name} IF NOT EXISTS FOR {pattern} ON EACH [{fields}]"
+
+    return {
+        "signature": (schema_type, entity_type, (label,), tuple(properties)),
+        "description": description,
+        "query": query,
+    }
+
+
+def _element_index_items(entity_type, label, element):
+    """节点或关系的属性索引 (properties[].index) 和复合索引 (indexes[])"""
+    items = []
+    declared = {prop['name'] for prop in element.get('properties', [])}
+
+    for prop in element.get('properties', []):
+        if prop.get('index') and not (entity_type == "NODE" and prop.get('constraint') == 'unique'):
+            items.append(_index_item(entity_type, label, [prop['name']], prop['index']))
+
+    for index in element.get('indexes', []):
+        properties = list(index['properties'])
+        undeclared = [p for p in properties if p not in declared]
+        if undeclared:
+            logger.warning(f"{label} 的复合索引 {properties} 中 {undeclared} 未在 properties 中声明。")
+        items.append(_index_item(entity_type, label, properties, index.get('index', 'simple')))
+
+    return [item for item in items if item is not None]
+
+
+def desired_schema(schema):
     """
-    schema = read_yaml(schema_path)
+    把 schema.yaml 展开成期望的约束和索引列表。
+    每一项的 signature = (类型, NODE/RELATIONSHIP, 标签或关系类型, 属性), 与 SHOW 的结果按签名比较,
+    因此旧版本创建的未命名约束也能被识别为已存在。
+
+    支持:
+    - 节点属性: 'unique' 约束, 'simple' 索引, 'fulltext' 索引
+    - 关系属性: 'simple' 索引, 'fulltext' 索引
+    - 节点/关系的复合索引: indexes: [{properties: [country, age], index: simple}]
+    """
+    items = []
 
-    # --- 1. 应用节点模式 ---
-    logger.info("开始应用节点 (Node) 模式...")
+    # --- 1. 节点模式 ---
     # schema is a dict
     for node in schema.get('nodes', []):
         label = node['label']
-        for prop in node.get('properties', []):
-            prop_name = prop['name']
 
-            # 1a. 唯一性约束 (Unique Constraint)
+        # 1a. 唯一性约束 (Unique Constraint)
+        for prop in node.get('properties', []):
             if prop.get('constraint') == 'unique':
-                query = f"""
-                CREATE CONSTRAINT IF NOT EXISTS FOR (n:{label}) 
-                REQUIRE n.{prop_name} IS UNIQUE
-                """
-                conn.run_query(query)
-                logger.info(f"已应用 [Unique Constraint] ON (:{label}) [{prop_name}]")
-
-            # 1b. 简单索引 (B-Tree Index)
-            elif prop.get('index') == 'simple':
-                index_name = f"idx_{label}_{prop_name}"
-                query = f"""
-                CREATE INDEX {index_name} IF NOT EXISTS FOR (n:{label}) 
-                ON (n.{prop_name})
-                """
-                conn.run_query(query)
-                logger.info(f"已应用 [Simple Index] ON (:{label}) [{prop_name}]")
-
-            # 1c. 全文索引 (Full-Text Index)
-            elif prop.get('index') == 'fulltext':
-                index_name = f"ft_idx_{label}_{prop_name}"
-
-                query = f"""
-                CREATE FULLTEXT INDEX {index_name} IF NOT EXISTS FOR (n:{label}) 
-                ON EACH [n.{prop_name}]
-                """
-                try:
-                    conn.run_query(query)
-                    logger.info(f"已应用 [Fulltext Index] ON (:{label}) [{prop_name}]")
-                except ClientError as e:
-                    logger.warning(f"无法创建全文索引 '{index_name}' (可能已存在或配置不支持): {e}")
-
-    # # --- 2. 应用关系模式 ---
-    # logger.info("开始应用关系 (Relationship) 模式...")
-    # for rel in schema.get('relationships', []):
-    #     rel_type = rel['type']
-    #     for prop in rel.get('properties', []):
-    #         prop_name = prop['name']
-    #
-    #         # 2a. 关系属性索引 (B-Tree Index)
-    #         if prop.get('index') == 'simple':
-    #             index_name = f"idx_rel_{rel_type}_{prop_name}"
-    #             query = f"""
-    #             CREATE INDEX {index_name} IF NOT EXISTS FOR ()-[r:{rel_type}]-()
-    #             ON (r.{prop_name})
-    #             """
-    #             conn.run_query(query)
-    #             logger.info(f"已应用 [Rel Index] ON (:{rel_type}) [{prop_name}]")
+                prop_name = prop['name']
+                name = f"uniq_{label}_{prop_name}"
+                items.append({
+                    "signature": ("UNIQUE", "NODE", (label,), (prop_name,)),
+                    "description": f"[Unique Constraint] ON (:{label}) [{prop_name}]",
+                    "query": f"CREATE CONSTRAINT {name} IF NOT EXISTS FOR (n:{label}) "
+                             f"REQUIRE n.{prop_name} IS UNIQUE",
+                })
+
+        # 1b. 简单索引 (B-Tree / Range Index), 全文索引 (Full-Text Index), 复合索引
+        items.extend(_element_index_items("NODE", label, node))
+
+    # --- 2. 关系模式 ---
+    # 关系属性索引 (created_at, confidence, source 等), 用于按时间窗口和来源过滤关系
+    for rel in schema.get('relationships', []):
+        items.extend(_element_index_items("RELATIONSHIP", rel['type'], rel))
+
+    return items
+
+
+def existing_schema(conn):
+    """一次性读取数据库中已有的约束和索引, 返回签名集合"""
+    signatures = set()
+    for record in conn.run_query("SHOW CONSTRAINTS"):
+        signatures.add((_normalize_type(record["type"]), record["entityType"],
+                        tuple(record["labelsOrTypes"] or ()), tuple(record["properties"] or ())))
+    for record in conn.run_query("SHOW INDEXES"):
+        if record["type"].upper() == "LOOKUP":
+            continue
+        signatures.add((_normalize_type(record["type"]), record["entityType"],
+                        tuple(record["labelsOrTypes"] or ()), tuple(record["properties"] or ())))
+    return signatures
+
+
+def plan_schema(conn, schema_path):
+    """计算 schema.yaml 与数据库当前模式的差异, 返回需要创建的项"""
+    existing = existing_schema(conn)
+    return [item for item in desired_schema(read_yaml(schema_path)) if item["signature"] not in existing]
+
+
+def obsolete_fulltext_indexes(conn, schema_path):
+    """
+    数据库中由本模块创建 (名称以 ft_idx_ 开头)、但 schema.yaml 中已不再声明的全文索引,
+    例如被 [name, description] 复合全文索引取代的旧 ft_idx_Concept_description。
+    它们留在库中时, 全文搜索会对同一节点返回多条结果。
+    :return: 索引名列表
+    """
+    desired = {item["signature"] for item in desired_schema(read_yaml(schema_path))}
+    return [record["name"] for record in conn.run_query("SHOW INDEXES")
+            if record["type"].upper() == "FULLTEXT" and record["name"].startswith(FULLTEXT_INDEX_PREFIX)
+            and ("FULLTEXT", record["entityType"], tuple(record["labelsOrTypes"] or ()),
+                 tuple(record["properties"] or ())) not in desired]
+
+
+def drop_obsolete_fulltext_indexes(conn, schema_path):
+    """删除 obsolete_fulltext_indexes 找到的索引, 返回删除的数量"""
+    dropped = 0
+    for name in obsolete_fulltext_indexes(conn, schema_path):
+        try:
+            conn.run_query(f"DROP INDEX {name} IF EXISTS")
+            dropped += 1
+            logger.info(f"已删除 schema.yaml 中不再声明的全文索引 {name}")
+        except ClientError as e:
+            logger.warning(f"无法删除过时的全文索引 {name}: {e}")
+    return dropped
+
+
+def apply_schema_from_yaml(conn, schema_path):
+    """
+    (丰富版) 根据 schema.yaml 文件应用所有约束和索引。
+    支持: 'unique' 约束, 'simple' 索引 (B-Tree), 'fulltext' 索引,
+    以及关系属性索引和复合索引 (见 desired_schema)。
+
+    先读取一次现有的约束和索引, 只创建缺少的项; 本模块创建过、但 schema.yaml 中已不再声明的全文索引
+    会被删除 (见 obsolete_fulltext_indexes)。已经配置好的数据库只需要三次 SHOW 查询。
+    :return: 新创建的约束/索引数量
+    """
+    drop_obsolete_fulltext_indexes(conn, schema_path)
+    missing = plan_schema(conn, schema_path)
+    if not missing:
+        logger.info("数据库模式已是最新, 无需变更。")
+        return 0
+
+    logger.info(f"需要创建 {len(missing)} 个约束/索引...")
+    created = 0
+    for item in missing:
+        try:
+            conn.run_query(item["query"])
+            created += 1
+            logger.info(f"已应用 {item['description']}")
+        except ClientError as e:
+            logger.warning(f"无法应用 {item['description']} (可能已存在或配置不支持): {e}")
 
     logger.info("模式应用完毕。")
+    return created
+
+
+def apply_schema(conn, schema_path, timeout_seconds=300):
+    """应用 schema.yaml 中缺少的约束和索引; 有新建项时等待它们上线"""
+    if apply_schema_from_yaml(conn, schema_path):
+        await_indexes_online(conn, timeout_seconds=timeout_seconds)
 
 
 def await_indexes_online(conn, timeout_seconds=300):
     """
-    (关键) 轮询数据库，等待所有索引和约束都处于 'ONLINE' 状态。
+    (关键) 等待所有索引和约束都处于 'ONLINE' 状态。
     这是在写入大量数据之前必须执行的步骤。
+
+    优先使用服务端的 db.awaitIndexes 过程 (在服务端阻塞, 不需要轮询);
+    过程不可用时退回到轮询 SHOW INDEXES / SHOW CONSTRAINTS。
     """
     logger.info("正在等待所有索引和约束变为 'ONLINE'...")
+    try:
+        conn.run_query("CALL db.awaitIndexes($timeout)", parameters={"timeout": timeout_seconds})
+        logger.info("所有索引和约束均已 'ONLINE'。")
+        return True
+    except ClientError as e:
+        if "timed out" in str(e).lower() or "timeout" in str(e).lower():
+            logger.error(f"索引在 {timeout_seconds} 秒内未能变为 'ONLINE'。流程终止。")
+            raise TimeoutError(f"索引未能在 {timeout_seconds} 秒内上线") from e
+        logger.warning(f"db.awaitIndexes 不可用, 改为轮询: {e}")
+    return _poll_indexes_online(conn, timeout_seconds)
+
+
+def _poll_indexes_online(conn, timeout_seconds=300):
+    """
+    轮询数据库，等待所有索引和约束都处于 'ONLINE' 状态 (db.awaitIndexes 不可用时使用)。
+    """
     start_time = time.time()
 
     while time.time() - start_time < timeout_seconds:
@@ -0,0 +1,124 @@
+# 流程阶段的检查点: 每个阶段的输出写成 JSONL, 并记录输入哈希, 输入未变化时可以直接复用
+import hashlib
+import json
+import os
+import time
+from kg_course_project.utils.file_io import read_json, save_json
+from kg_course_project.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+STATE_FILE = "pipeline_state.json"
+
+
+def hash_inputs(*parts):
+    """把阶段的输入 (上游输出哈希、词典、规则、阈值等) 合成一个哈希"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def file_hash(file_path, chunk_size=1 << 20):
+    """流式计算文件内容的 sha1"""
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_jsonl(file_path, records, header):
+    """
+    逐条写入 JSONL (第一行是 {"_checkpoint": header}), 先写临时文件再原子替换,
+    中途失败不会留下写了一半的检查点。
+    :return: (记录内容的 sha1, 记录数)
+    """
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha1()
+    count = 0
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({"_checkpoint": header}, ensure_ascii=False) + "\n")
+        for record in records:
+            line = json.dumps(record, ensure_ascii=False, sort_keys=True) + "\n"
+            f.write(line)
+            digest.update(line.encode('utf-8'))
+            count += 1
+    os.replace(tmp_path, file_path)
+    return digest.hexdigest(), count
+
+
+def read_jsonl(file_path):
+    """(流式) 逐条读取 write_jsonl 写出的记录, 跳过头部"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if "_checkpoint" not in record:
+                yield record
+
+
+class StageCheckpoints:
+    """
+    管理 data/processed/ 下各阶段的 JSONL 输出。
+
+    pipeline_state.json 记录每个阶段的输入哈希和每个输出文件的内容哈希;
+    下游阶段把上游的输出哈希作为自己输入的一部分, 因此任何上游变化都会沿链条传递下去。
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.state_path = os.path.join(directory, STATE_FILE)
+        try:
+            self.state = read_json(self.state_path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.state = {}
+
+    def _path(self, output_name):
+        return os.path.join(self.directory, f"{output_name}.jsonl")
+
+    def is_fresh(self, stage, input_hash):
+        """该阶段的检查点存在, 且是用相同的输入生成的"""
+        entry = self.state.get(stage)
+        if not entry or entry.get("input_hash") != input_hash:
+            return False
+        return all(os.path.exists(self._path(name)) for name in entry["outputs"])
+
+    def output_hash(self, stage):
+        entry = self.state[stage]
+        return hash_inputs(*(entry["outputs"][name]["hash"] for name in sorted(entry["outputs"])))
+
+    def load(self, stage):
+        """读取该阶段的所有输出: {输出名: [记录, ...]}"""
+        return {name: list(read_jsonl(self._path(name))) for name in self.state[stage]["outputs"]}
+
+    def save(self, stage, input_hash, outputs):
+        """
+        写出该阶段的所有输出并更新 pipeline_state.json。
+        :param outputs: {输出名: 可迭代的记录}
+        """
+        header = {"stage": stage, "input_hash": input_hash, "created_at": int(time.time() * 1000)}
+        written = {}
+        for name, records in outputs.items():
+            digest, count = write_jsonl(self._path(name), records, header)
+            written[name] = {"hash": digest, "records": count}
+        self.state[stage] = {"input_hash": input_hash, "outputs": written, "created_at": header["created_at"]}
+        tmp_path = f"{self.state_path}.tmp"
+        save_json(self.state, tmp_path)
+        os.replace(tmp_path, self.state_path)
+
+    def run(self, stage, input_hash, compute, reuse=True):
+        """
+        执行一个阶段, 或者在 reuse=True 且输入未变化时直接读取检查点。
+        :param compute: 无参函数, 返回 {输出名: [记录, ...]}
+        :return: (输出, 输出哈希)
+        """
+        if reuse and self.is_fresh(stage, input_hash):
+            outputs = self.load(stage)
+            counts = ", ".join(f"{name} {len(records)} 条" for name, records in outputs.items())
+            logger.info(f"[Checkpoint] 阶段 '{stage}' 输入未变化, 复用检查点 ({counts})")
+            return outputs, self.output_hash(stage)
+
+        outputs = compute()
+        self.save(stage, input_hash, outputs)
+        return outputs, self.output_hash(stage)
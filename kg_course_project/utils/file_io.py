@@ -15,4 +15,9 @@ def read_file(file_path):
 def save_json(data, file_path):
     """保存数据为 JSON"""
     with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+def read_json(file_path):
+    """读取 JSON 文件"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,143 @@
+# 进程内指标 (直方图 / 计数器), 以 Prometheus 文本格式导出 (run_app 的 /metrics)
+# 记录一次观测只是加锁后对几个数字做加法; 累计桶和文本格式只在被抓取时计算
+import bisect
+import threading
+
+# 延迟直方图的桶上限 (秒)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    带标签的直方图: observe(值, 标签值...)。
+    每组标签保存各桶 (非累计) 的计数、总和与次数, 导出时再转换为 Prometheus 要求的累计桶。
+    """
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}  # 标签值 -> [各桶计数 (最后一个为 +Inf), 总和, 次数]
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        """:return: {标签值: (累计桶计数, 总和, 次数)}"""
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        result = {}
+        for labels, (counts, total, count) in series.items():
+            cumulative, running = [], 0
+            for c in counts:
+                running += c
+                cumulative.append(running)
+            result[labels] = (cumulative, total, count)
+        return result
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (cumulative, total, count) in sorted(self.snapshot().items()):
+            for bound, value in zip(self.buckets + (float("inf"),), cumulative):
+                le = _format_labels(self.label_names, labels, [("le", _format_number(bound))])
+                lines.append(f"{self.name}_bucket{le} {value}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_number(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class Counter:
+    """带标签的计数器: inc(标签值..., amount=1)"""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_format_labels(self.label_names, labels)} {_format_number(value)}"
+                     for labels, value in values)
+        return lines
+
+
+class Registry:
+    """
+    指标注册表。同名指标只创建一次 (多个连接 / 模块可以共享同一个直方图);
+    collectors 为抓取时调用的函数, 返回 [(指标名, 类型, 说明, [(标签字典, 值), ...]), ...],
+    用于导出缓存统计等已经在别处计数的数值。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, label_names, buckets)
+
+    def counter(self, name, help_text, label_names=()):
+        return self._get_or_create(Counter, name, help_text, label_names)
+
+    def register_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """Prometheus 文本格式 (text/plain; version=0.0.4)"""
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+            collectors = list(self._collectors)
+        lines = []
+        for _, metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            for name, kind, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# 进程内默认的注册表
+REGISTRY = Registry()
@@ -0,0 +1,98 @@
+# 固定内存的流式计数工具 (Count-Min Sketch + 高频项跟踪)
+import hashlib
+import heapq
+import random
+from array import array
+
+# 2^61 - 1 (梅森素数), 用于行哈希的取模
+_PRIME = (1 << 61) - 1
+
+
+class CountMinSketch:
+    """
+    Count-Min Sketch: 用 depth x width 个计数器估计每个 key 的出现次数。
+    估计值只会偏大不会偏小; 误差 <= 2N/width 的概率至少为 1 - 2^-depth (N 为总计数)。
+    内存固定为 depth * width * 4 字节, 与不同 key 的数量无关。
+    """
+
+    def __init__(self, width=1 << 20, depth=4, seed=2024):
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self._rows = [array('I', bytes(4 * width)) for _ in range(depth)]
+        # 每行一组独立随机的 (a, b), 哈希为 ((a * h + b) mod p) mod width
+        rng = random.Random(seed)
+        self._params = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(depth)]
+
+    @staticmethod
+    def _hash(key):
+        # 不能用内置 hash(): str 的哈希按进程加盐 (PYTHONHASHSEED), 同一个 seed 在不同进程中的计数会不同
+        data = key if isinstance(key, bytes) else str(key).encode('utf-8')
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+    def _positions(self, key):
+        h = self._hash(key)
+        width = self.width
+        return [((a * h + b) % _PRIME) % width for a, b in self._params]
+
+    def add(self, key, count=1):
+        """计数 +count, 并返回更新后的估计值。"""
+        self.total += count
+        estimate = None
+        for row, pos in zip(self._rows, self._positions(key)):
+            value = row[pos] + count
+            row[pos] = value
+            if estimate is None or value < estimate:
+                estimate = value
+        return estimate
+
+    def estimate(self, key):
+        return min(row[pos] for row, pos in zip(self._rows, self._positions(key)))
+
+    def __getitem__(self, key):
+        return self.estimate(key)
+
+
+class HeavyHitters:
+    """
+    只保留估计频次最高的 capacity 个 key (以及它们第一次出现时的样本)。
+    配合 CountMinSketch 使用: 频次由 sketch 给出, 这里只负责固定大小的候选表。
+    """
+
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self.items = {}  # key -> [estimate, sample]
+        self._heap = []  # (estimate, key), 可能包含过期条目, 淘汰时跳过
+
+    def update(self, key, estimate, sample=None):
+        item = self.items.get(key)
+        if item is not None:
+            item[0] = estimate
+            heapq.heappush(self._heap, (estimate, key))
+        elif len(self.items) < self.capacity:
+            self.items[key] = [estimate, sample]
+            heapq.heappush(self._heap, (estimate, key))
+        else:
+            # 找到当前最小的有效条目, 只有新 key 的频次更高时才替换它
+            while self._heap:
+                min_estimate, min_key = self._heap[0]
+                current = self.items.get(min_key)
+                if current is not None and current[0] == min_estimate:
+                    break
+                heapq.heappop(self._heap)
+            if self._heap and estimate > self._heap[0][0]:
+                _, evicted = heapq.heappop(self._heap)
+                del self.items[evicted]
+                self.items[key] = [estimate, sample]
+                heapq.heappush(self._heap, (estimate, key))
+
+        # 过期条目太多时重建堆, 让堆的大小也保持有界
+        if len(self._heap) > 4 * self.capacity + 64:
+            self._heap = [(est, k) for k, (est, _) in self.items.items()]
+            heapq.heapify(self._heap)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
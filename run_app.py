@@ -1,8 +1,24 @@
 # 启动智能应用（如问答Web服务）的主脚本
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 import configparser
-from kg_course_project.graph_db.connection import Neo4jConnection
+import functools
+import gzip
+import hashlib
+import time
+from kg_course_project.graph_db.connection import create_connection
+from kg_course_project.graph_db.query_cache import QueryCache
+from kg_course_project.graph_db.query_metrics import QueryMetrics
+from kg_course_project.graph_db import csr_snapshot
+from kg_course_project.graph_db import graph_version
 from kg_course_project.applications import qa_system
+from kg_course_project.applications.prerequisite_dag import PrerequisiteIndex
+from kg_course_project.applications import recommender
+from kg_course_project.applications import search
+from kg_course_project.applications import question_parser
+from kg_course_project.utils.metrics import REGISTRY
+from kg_course_project.utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 # --- 全局初始化 ---
 app = Flask(__name__)
@@ -11,19 +27,169 @@ app = Flask(__name__)
 config = configparser.ConfigParser()
 config.read('config.ini')
 neo4j_uri = config['NEO4J']['URI']
-neo4j_auth = (config['NEO4J']['USER'], config['NEO4J']['PASSWORD'])
+graph_backend = config.get('GRAPH', 'BACKEND', fallback='neo4j')
 
 # 创建全局数据库连接
-# 注意：在生产环境中，更推荐使用连接池或在每个请求中管理会话
-# 但为简化MVP，我们创建一个长连接。
+# 驱动内部维护连接池 (大小见 config.ini)，每个请求从池中借用一个会话，
+# 读查询通过托管读事务执行; 启用 [CACHE] 后相同的读查询直接走缓存，
+# 流程重新加载数据 (图版本号变化) 后缓存自动失效。
+# 启用 [METRICS] 后按查询指纹记录耗时, 慢查询 (含 PROFILE 摘要) 写入日志, 在 /metrics 导出。
 try:
-    db_conn = Neo4jConnection(uri=neo4j_uri, auth=neo4j_auth)
-    db_conn.driver.verify_connectivity()
-    print(f"成功连接到 Neo4j 数据库: {neo4j_uri}")
+    db_conn = create_connection(config, cache=QueryCache.from_config(config), metrics=QueryMetrics.from_config(config))
+    db_conn.verify_connectivity()
+    if graph_backend == 'memory':
+        logger.info("使用进程内图后端 (memory)")
+    else:
+        logger.info(f"成功连接到 Neo4j 数据库: {neo4j_uri}")
 except Exception as e:
-    print(f"无法连接到 Neo4j，请检查 config.ini 和数据库状态: {e}")
+    logger.error(f"无法连接到 Neo4j，请检查 config.ini 和数据库状态: {e}")
     db_conn = None
 
+# 只读的 CSR 图快照 (由 run_pipeline 生成): 以内存映射方式加载, 多个 worker 进程共享同一份页缓存
+graph_snapshot = None
+if csr_snapshot.NUMPY_AVAILABLE:
+    graph_snapshot = csr_snapshot.SnapshotReader(
+        config.get('PATHS', 'CSR_SNAPSHOT_DIR', fallback='./data/processed/graph_csr'))
+
+# 进程内的前置知识 DAG: 启动时构建 (图版本一致时直接来自 CSR 快照), 之后在后台按图版本号刷新;
+# 前置知识查询在进程内完成, DAG 中没有的知识点再回退到数据库
+prerequisite_index = None
+if db_conn:
+    try:
+        prerequisite_index = PrerequisiteIndex(
+            db_conn, graph_snapshot,
+            refresh_interval=config.getfloat('APP', 'DAG_REFRESH_INTERVAL', fallback=30.0)).start()
+    except Exception as e:
+        logger.warning(f"无法构建前置知识 DAG, 将直接查询数据库: {e}")
+        prerequisite_index = None
+
+
+# 请求参数的上限 (见 config.ini 的 [APP])
+recommend_max_k = config.getint('APP', 'RECOMMEND_MAX_K', fallback=50)
+batch_max_names = config.getint('APP', 'BATCH_MAX_NAMES', fallback=200)
+
+
+def _is_name_list(value):
+    """请求体中的知识点名称列表: 元素都是字符串的 list"""
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+# 随图版本号重建的进程内索引 (学习路径推荐器、输入提示前缀树、问句解析器): 第一次使用时构建,
+# 前置知识 DAG 的图版本号变化后重建; 图版本一致时直接来自 CSR 快照
+_derived_indexes = {}
+
+
+def get_derived_index(builder):
+    version = prerequisite_index.dag.version if prerequisite_index is not None else None
+    current = _derived_indexes.get(builder)
+    if current is None or current.version != version:
+        graph = graph_snapshot.get() if graph_snapshot is not None else None
+        if graph is not None and graph.graph_version == version:
+            current = builder.from_snapshot(graph)
+        else:
+            current = builder.from_connection(db_conn, version=version)
+        _derived_indexes[builder] = current
+    return current
+
+
+fulltext_search = search.FulltextSearch(db_conn) if db_conn else None
+if db_conn:
+    try:
+        get_derived_index(search.NameSuggester)
+    except Exception as e:
+        logger.warning(f"无法构建输入提示前缀树: {e}")
+    try:
+        get_derived_index(question_parser.QuestionParser)
+    except Exception as e:
+        logger.warning(f"无法构建问句解析器, 问题将按实体名称处理: {e}")
+
+
+# HTTP 响应缓存: 回答只在流程重新加载数据 (图版本号变化) 时改变。
+# 序列化 (和压缩) 后的响应按 (路由, 参数) 缓存在 LRU 中, 图版本号变化后整体失效;
+# ETag 由图版本号和请求参数计算, 客户端带 If-None-Match 时不执行查询直接返回 304
+response_cache = QueryCache.from_config(config, section='RESPONSE_CACHE') if db_conn else None
+gzip_min_bytes = config.getint('RESPONSE_CACHE', 'GZIP_MIN_BYTES', fallback=1024)
+
+
+def cached_response(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if response_cache is None:
+            return view(*args, **kwargs)
+        version = response_cache.current_version(lambda: graph_version.get_graph_version(db_conn))
+        # 进程内 DAG 还没有刷新到当前图版本时, 回答可能来自旧版本, 不缓存也不发 ETag
+        dag = prerequisite_index.dag if prerequisite_index is not None else None
+        if dag is not None and dag.version != version:
+            return view(*args, **kwargs)
+
+        body = request.get_json(silent=True) if request.method == 'POST' else None
+        key = QueryCache.make_key(request.path, {"args": sorted(request.args.items(multi=True)), "body": body},
+                                  request.method)
+        etag = hashlib.sha1(f"{version}\0{key}".encode('utf-8')).hexdigest()
+        if request.if_none_match.contains_weak(etag):
+            return _cacheable(Response(status=304), etag)
+
+        hit, entry = response_cache.get(key, version)
+        if not hit:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response  # 错误不缓存
+            data = response.get_data()
+            entry = (data, gzip.compress(data) if len(data) >= gzip_min_bytes else None, response.mimetype)
+            response_cache.put(key, version, entry)
+
+        data, compressed, mimetype = entry
+        response = Response(data, mimetype=mimetype)
+        if compressed is not None and request.accept_encodings['gzip']:
+            response.set_data(compressed)
+            response.headers['Content-Encoding'] = 'gzip'
+        return _cacheable(response, etag)
+    return wrapper
+
+
+def _cacheable(response, etag):
+    # 弱 ETag: 同一回答的 gzip 和未压缩表示共用一个 ETag; no-cache 要求客户端每次带 If-None-Match 重新验证
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+# 请求延迟 (按路由) 和 /ask 各阶段的耗时; 只在被 /metrics 抓取时生成文本
+request_latency = REGISTRY.histogram("kg_http_request_duration_seconds", "HTTP 请求耗时 (秒), 按路由",
+                                     ("route", "method", "status"))
+qa_stage_latency = REGISTRY.histogram("kg_qa_stage_duration_seconds", "/ask 各阶段耗时 (秒): parse / answer",
+                                      ("stage", "intent"))
+
+
+def collect_cache_stats():
+    caches = [("query", db_conn.cache if db_conn else None), ("response", response_cache)]
+    stats = [({"cache": name}, cache.stats()) for name, cache in caches if cache is not None]
+    return [
+        ("kg_cache_hits_total", "counter", "缓存命中次数", [(labels, s["hits"]) for labels, s in stats]),
+        ("kg_cache_misses_total", "counter", "缓存未命中次数", [(labels, s["misses"]) for labels, s in stats]),
+        ("kg_cache_evictions_total", "counter", "缓存淘汰次数", [(labels, s["evictions"]) for labels, s in stats]),
+        ("kg_cache_entries", "gauge", "缓存条目数", [(labels, s["entries"]) for labels, s in stats]),
+        ("kg_cache_bytes", "gauge", "缓存估计占用 (字节)", [(labels, s["bytes"]) for labels, s in stats]),
+    ]
+
+
+REGISTRY.register_collector(collect_cache_stats)
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_latency(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        request_latency.observe(time.perf_counter() - start, route, request.method, str(response.status_code))
+    return response
+
 
 # --- API 路由定义 ---
 
@@ -32,7 +198,93 @@ def index():
     return "知识图谱问答系统 API 已启动。请使用 /ask"
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 文本格式的指标: 请求延迟、查询耗时 (按指纹)、慢查询次数、缓存统计"""
+    return Response(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/path', methods=['GET'])
+@cached_response
+def learning_path():
+    """学习某个知识点之前需要依次学习的知识点 (按拓扑序)"""
+    concept = request.args.get('q', '').strip()
+    if not concept:
+        return jsonify({"error": "缺少参数 'q' (知识点)"}), 400
+    path = prerequisite_index.learning_path(concept) if prerequisite_index is not None else None
+    return jsonify({"concept": concept, "path": path or []})
+
+
+@app.route('/search', methods=['GET'])
+@cached_response
+def search_nodes():
+    """全文搜索: /search?q=知识图谱&page=1&size=10[&label=Concept]"""
+    if not db_conn:
+        return jsonify({"error": "数据库未连接"}), 500
+    text = request.args.get('q', '').strip()
+    if not text:
+        return jsonify({"error": "缺少参数 'q' (搜索词)"}), 400
+    try:
+        result = fulltext_search.search(text,
+                                        page=request.args.get('page', 1, type=int),
+                                        size=request.args.get('size', 10, type=int),
+                                        labels=request.args.getlist('label') or None)
+        return jsonify({"query": text, **result})
+    except Exception as e:
+        logger.error(f"搜索时发生错误 ({text}): {e}")
+        return jsonify({"error": f"搜索时发生错误: {e}"}), 500
+
+
+@app.route('/suggest', methods=['GET'])
+@cached_response
+def suggest():
+    """输入提示: /suggest?q=知识&limit=10, 在进程内的前缀树中完成, 不访问数据库"""
+    if not db_conn:
+        return jsonify({"error": "数据库未连接"}), 500
+    prefix = request.args.get('q', '')
+    # 前缀树每个节点只保存前 10 个补全; limit <= 0 时至少返回 1 个 (0 会被前缀树当作默认值, 负数会截掉末尾)
+    limit = max(1, min(request.args.get('limit', 10, type=int), 10))
+    return jsonify({"prefix": prefix,
+                    "suggestions": get_derived_index(search.NameSuggester).suggest(prefix, limit)})
+
+
+@app.route('/recommend', methods=['POST'])
+def recommend():
+    """
+    批量学习路径推荐。
+    请求体: {"students": [{"mastered": [...], "goals": [...]}, ...], "k": 10}
+    """
+    if not db_conn:
+        return jsonify({"error": "数据库未连接"}), 500
+    if not recommender.SCIPY_AVAILABLE:
+        return jsonify({"error": "学习路径推荐需要 numpy 和 scipy"}), 501
+
+    body = request.get_json(silent=True) or {}
+    students = body.get('students')
+    if not isinstance(students, list) or not students:
+        return jsonify({"error": "缺少参数 'students' (列表)"}), 400
+    if not all(isinstance(s, dict) and _is_name_list(s.get('mastered', []))
+               and _is_name_list(s.get('goals', [])) for s in students):
+        return jsonify({"error": "'students' 的每一项必须是 {\"mastered\": [...], \"goals\": [...]}"}), 400
+    path_length = body.get('k', 10)
+    if isinstance(path_length, bool) or not isinstance(path_length, int) \
+            or not 1 <= path_length <= recommend_max_k:
+        return jsonify({"error": f"参数 'k' 必须是 1 到 {recommend_max_k} 之间的整数"}), 400
+
+    try:
+        paths = get_derived_index(recommender.LearningPathRecommender).recommend_batch(
+            [s.get('mastered', []) for s in students],
+            [s.get('goals', []) for s in students],
+            path_length=path_length)
+        return jsonify({"results": [[{"concept": name, "score": score} for name, score in path]
+                                    for path in paths]})
+    except Exception as e:
+        logger.error(f"推荐时发生错误: {e}")
+        return jsonify({"error": f"推荐时发生错误: {e}"}), 500
+
+
 @app.route('/ask', methods=['GET'])
+@cached_response
 def ask_question():
     if not db_conn:
         return jsonify({"error": "数据库未连接"}), 500
@@ -41,32 +293,108 @@ def ask_question():
     if not question:
         return jsonify({"error": "缺少参数 'q' (问题)"}), 400
 
-    # (MVP) 简化NLU，我们假设问题就是实体名称
-    # 真实项目：这里需要 NLU 来解析意图和实体
-    entity_name = question.strip()
+    # 可选: 只返回距离不超过 depth 的前置知识 (1 表示只要直接前置)
+    max_depth = request.args.get('depth', type=int)
+    if 'depth' in request.args and (max_depth is None or max_depth < 1):
+        return jsonify({"error": "参数 'depth' 必须是不小于 1 的整数"}), 400
 
-    # (MVP) 简化意图识别，我们只实现一种查询："查询前置知识"
-    # 真实项目：根据NLU的意图调用不同的 qa_system 函数
+    # 问句理解: 实体链接 (所有节点名称编译成的自动机) + 意图模板; 解析器不可用或没有识别出实体时,
+    # 按原来的方式把整个问题当作知识点名称, 查询前置知识
+    parser = None
+    start = time.perf_counter()
+    try:
+        parser = get_derived_index(question_parser.QuestionParser)
+        parsed = parser.parse(question)
+    except Exception as e:
+        logger.warning(f"问句解析失败: {e}")
+        parsed = {"entity": None}
+    if not parsed["entity"]:
+        parsed = {"intent": "prerequisites", "entity": question.strip(), "label": "Concept"}
+    intent, entity_name = parsed["intent"], parsed["entity"]
+    parsed_at = time.perf_counter()
+    qa_stage_latency.observe(parsed_at - start, "parse", intent)
 
     try:
-        prereqs = qa_system.find_prerequisites(db_conn, entity_name)
+        data = None
+        if intent in ("prerequisites", "learning_path") and prerequisite_index is not None:
+            if intent == "learning_path":
+                data = prerequisite_index.learning_path(entity_name)
+            else:
+                data = prerequisite_index.prerequisites(entity_name, max_depth=max_depth)
+        if data is None:
+            # DAG 中没有的知识点 (或其他意图): 执行意图对应的缓存 Cypher 计划;
+            # 学习路径回退为按距离从远到近的前置知识
+            plan_intent = "prerequisites" if intent == "learning_path" else intent
+            data = qa_system.execute_plan(db_conn, plan_intent, parsed["label"], entity_name, max_depth=max_depth)
+            if intent == "learning_path":
+                data = data[::-1]
+        qa_stage_latency.observe(time.perf_counter() - parsed_at, "answer", intent)
 
-        if not prereqs:
+        if parser is not None:
+            answer = parser.render(parsed, data)
+        elif not data:
             answer = f"未找到 '{entity_name}' 的前置知识，或该概念不存在。"
         else:
-            answer = f"学习 '{entity_name}' 的前置知识包括: {', '.join(prereqs)}"
+            answer = f"学习 '{entity_name}' 的前置知识包括: {', '.join(data)}"
 
         return jsonify({
             "question": question,
             "entity_detected": entity_name,
+            "intent": intent,
             "answer": answer,
-            "data": prereqs
+            "data": data
         })
 
     except Exception as e:
+        logger.error(f"回答问题时发生错误 ({question}): {e}")
+        return jsonify({"error": f"查询时发生错误: {e}"}), 500
+
+
+@app.route('/ask/batch', methods=['POST'])
+@cached_response
+def ask_batch():
+    """
+    批量查询前置知识 (例如一个页面上的所有知识点)。
+    请求体: {"names": ["OWL", "RDFS", ...], "depth": 可选}
+    DAG 中的知识点在进程内回答, 其余的合并成一次 UNWIND 查询, 页面只需要一次数据库往返。
+    """
+    if not db_conn:
+        return jsonify({"error": "数据库未连接"}), 500
+
+    body = request.get_json(silent=True) or {}
+    names = body.get('names')
+    if not isinstance(names, list) or not names or not all(isinstance(n, str) for n in names):
+        return jsonify({"error": "缺少参数 'names' (知识点名称列表)"}), 400
+    names = list(dict.fromkeys(n.strip() for n in names if n.strip()))
+    if len(names) > batch_max_names:
+        return jsonify({"error": f"'names' 最多 {batch_max_names} 个知识点"}), 400
+    max_depth = body.get('depth')
+    if max_depth is not None and (isinstance(max_depth, bool) or not isinstance(max_depth, int) or max_depth < 1):
+        return jsonify({"error": "参数 'depth' 必须是不小于 1 的整数"}), 400
+
+    try:
+        answers, missing = {}, []
+        for name in names:
+            prereqs = prerequisite_index.prerequisites(name, max_depth=max_depth) \
+                if prerequisite_index is not None else None
+            if prereqs is None:
+                missing.append(name)
+            else:
+                answers[name] = prereqs
+        answers.update(qa_system.find_prerequisites_batch(db_conn, missing, max_depth=max_depth))
+
+        return jsonify({"answers": {
+            name: {
+                "answer": (f"学习 '{name}' 的前置知识包括: {', '.join(answers[name])}" if answers[name]
+                           else f"未找到 '{name}' 的前置知识，或该概念不存在。"),
+                "data": answers[name],
+            } for name in names
+        }})
+    except Exception as e:
+        logger.error(f"批量查询前置知识时发生错误: {e}")
         return jsonify({"error": f"查询时发生错误: {e}"}), 500
 
 
 if __name__ == '__main__':
-    print("启动 Flask Web 服务器在 http://127.0.0.1:5000 ...")
+    logger.info("启动 Flask Web 服务器在 http://127.0.0.1:5000 ...")
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -1,53 +1,106 @@
 # coding=utf-8
 # 运行整个数据处理和图谱构建流程的主脚本
+import argparse
+import asyncio
 import configparser
-from kg_course_project.graph_db.connection import Neo4jConnection
-from kg_course_project.graph_db import schema_manager, data_loader
+from kg_course_project.graph_db.connection import create_connection, AsyncNeo4jConnection
+from kg_course_project.graph_db import schema_manager, data_loader, bulk_import, csr_snapshot
 from kg_course_project.data_acquisition import data_cleaner
 from kg_course_project.extraction import ner, relationship, fusion
+from kg_course_project.applications import inference
+from kg_course_project.utils import checkpoint
 import os
 import re
 
-
-def main_pipeline():
+# 可以检查点化的阶段 (按执行顺序); 加载阶段写数据库, 每次都会执行
+STAGES = ["clean", "entities", "relations", "fusion"]
+
+
+def export_graph_snapshot(config, db_conn=None, entities=None, relations=None, version=None):
+    """
+    导出只读的 CSR 图快照, 供 run_app 内存映射加载。
+    有数据库连接时从数据库读取完整的图 (包括以前加载的部分), 否则使用本次的实体和关系,
+    version 为导入后的图版本号 (run_app 只信任版本号与数据库一致的快照)。
+    """
+    if not csr_snapshot.NUMPY_AVAILABLE:
+        print("未安装 numpy, 跳过 CSR 图快照导出。")
+        return None
+    csr_dir = config.get('PATHS', 'CSR_SNAPSHOT_DIR', fallback='./data/processed/graph_csr')
+    if db_conn is not None:
+        return csr_snapshot.export_from_connection(db_conn, csr_dir)
+    return csr_snapshot.export_from_lists(entities, relations, csr_dir, version=version)
+
+
+async def load_graph_async(config, entities, relations, loader_options):
+    """全量加载的异步版本: 用 AsyncNeo4jConnection 写入实体和关系 ([LOADER] ASYNC = true)"""
+    options = dict(loader_options)
+    options["max_concurrency"] = options.pop("max_workers")
+    async with AsyncNeo4jConnection.from_config(config) as conn:
+        await data_loader.load_entities_async(conn, entities, **options)
+        await data_loader.load_relations_async(conn, relations, **options)
+
+
+def main_pipeline(bulk_export_dir=None, rebuild=False, resume=False, from_stage=None):
+    """
+    :param bulk_export_dir: 如果指定, 不写数据库, 而是把结果导出为 neo4j-admin 的 CSV
+                            (用于全量重建, 导入后再运行 schema_manager 应用约束)
+    :param rebuild: True 时清空数据库后全量加载; 默认只增量写入与上次加载相比变化的部分
+    :param resume: True 时输入未变化的阶段直接读取 data/processed/ 下的检查点, 不重新计算
+    :param from_stage: 从该阶段开始强制重新计算 (之前的阶段按 resume 的规则复用检查点)
+    """
     print("--- 知识图谱构建流程启动 ---")
 
     # 1. 加载配置
     config = configparser.ConfigParser()
     config.read('config.ini')
 
-    neo4j_uri = config['NEO4J']['URI']
-    neo4j_auth = (config['NEO4J']['USER'], config['NEO4J']['PASSWORD'])
     # schema_path = config['PATHS']['SCHEMA_FILE']
     # raw_data_dir = config['PATHS']['RAW_DATA_DIR']
     schema_path = "schema.yaml"
     raw_data_dir = ""
+    canonical_map_path = config.get('PATHS', 'CANONICAL_MAP_FILE',
+                                    fallback='./data/processed/canonical_map.json')
+    checkpoints = checkpoint.StageCheckpoints(config.get('PATHS', 'PROCESSED_DIR', fallback='./data/processed/'))
+
+    def reuse(stage):
+        # 指定了 from_stage 时, 它之前的阶段默认复用检查点
+        if from_stage is not None:
+            return STAGES.index(stage) < STAGES.index(from_stage)
+        return resume
 
-    # 2. 初始化数据库连接
-    db_conn = Neo4jConnection(uri=neo4j_uri, auth=neo4j_auth)
+    # 2. 初始化数据库连接 (离线导出模式不需要数据库; [GRAPH] BACKEND = memory 时使用进程内图)
+    db_conn = None if bulk_export_dir else create_connection(config)
 
     try:
         # 3. 清理数据库并设置模式 (约束)
-        print("\n[阶段1: 设置数据库模式]")
-        schema_manager.clear_database(db_conn)
-        print("数据库已清空。")
-        schema_manager.apply_schema(db_conn, schema_path)
-        print("模式和约束已应用。")
+        if db_conn:
+            print("\n[阶段1: 设置数据库模式]")
+            if rebuild:
+                schema_manager.clear_database(db_conn, confirm=True)
+                print("数据库已清空。")
+            schema_manager.apply_schema(db_conn, schema_path)
+            print("模式和约束已应用。")
 
         # 4. 数据获取和清洗 (MVP: 从本地txt读取)
         print("\n[阶段2.1: 数据获取与清洗]")
         # 我们在这里模拟，只读取一个文件
         mock_data_file = os.path.join(raw_data_dir, 'course_content.txt')
         try:
-            with open(mock_data_file, 'r', encoding='utf-8') as f:
-                raw_text = f.read()
+            raw_hash = checkpoint.file_hash(mock_data_file)
             print(f"成功读取模拟数据: {mock_data_file}")
         except FileNotFoundError:
             print(f"错误: 未找到模拟数据文件: {mock_data_file}")
             print("请按照 README.md 中的指示创建该文件。")
             return
 
-        cleaned_text = data_cleaner.simple_clean(raw_text)
+        def clean_stage():
+            with open(mock_data_file, 'r', encoding='utf-8') as f:
+                raw_text = f.read()
+            return {"cleaned_text": [{"source": mock_data_file, "text": data_cleaner.simple_clean(raw_text)}]}
+
+        outputs, cleaned_hash = checkpoints.run(
+            "clean", checkpoint.hash_inputs(raw_hash, "simple_clean"), clean_stage, reuse("clean"))
+        cleaned_text = "\n".join(doc["text"] for doc in outputs["cleaned_text"])
 
         # 5. 知识抽取 (MVP: 基于规则)
         print("\n[阶段2.2: 知识抽取]")
@@ -60,7 +113,11 @@ def main_pipeline():
             "Algorithm": ["BERT"],
             "Chapter": ["第一章", "第二章", "第三章"]
         }
-        entities = ner.extract_entities_by_vocab(cleaned_text, domain_vocab)
+        outputs, entities_hash = checkpoints.run(
+            "entities", checkpoint.hash_inputs(cleaned_hash, domain_vocab),
+            lambda: {"entities": ner.extract_entities_by_vocab(cleaned_text, domain_vocab)},
+            reuse("entities"))
+        entities = outputs["entities"]
         print(f"抽取到实体: {len(entities)} 个")
 
         # 5b. 关系抽取 (RE)
@@ -78,24 +135,107 @@ def main_pipeline():
             (r'([\w\s]+)：\s*本章包含的概念有：([\w\s，]+)', 'INCLUDES_CONCEPT', 1, 2)
         ]
 
-        relations = relationship.extract_relations_by_rules(cleaned_text, entities, rules)
+        outputs, relations_hash = checkpoints.run(
+            "relations", checkpoint.hash_inputs(cleaned_hash, entities_hash, rules),
+            lambda: {"relations": relationship.extract_relations_by_rules(cleaned_text, entities, rules)},
+            reuse("relations"))
+        relations = outputs["relations"]
         print(f"抽取到关系: {len(relations)} 个")
 
+        # 5c. 知识融合 (增量: 只对齐新实体, 历史簇从磁盘读取)
+        print("\n[阶段3: 知识融合]")
+        # 阈值改变后持久化的规范名映射会被丢弃并重新融合 (见 CanonicalStore.load)
+        fusion_threshold = config.getfloat('FUSION', 'SIMILARITY_THRESHOLD',
+                                           fallback=fusion.DEFAULT_SIMILARITY_THRESHOLD)
+
+        def fusion_stage():
+            canonical_map = fusion.update_canonical_map(entities, canonical_map_path, fusion_threshold)
+            return {
+                "fused_entities": fusion.resolve_entities(entities, canonical_map),
+                "fused_relations": fusion.resolve_relations(relations, canonical_map),
+                "canonical_map": [{"name": name, "canonical": canonical}
+                                  for name, canonical in canonical_map.to_dict().items()],
+            }
+
+        outputs, _ = checkpoints.run(
+            "fusion", checkpoint.hash_inputs(entities_hash, relations_hash, fusion_threshold),
+            fusion_stage, reuse("fusion"))
+        entities, relations = outputs["fused_entities"], outputs["fused_relations"]
+        print(f"融合后实体: {len(entities)} 个, 关系: {len(relations)} 个")
+
+        # 6a. (离线) 导出 neo4j-admin CSV, 不经过 Cypher
+        if bulk_export_dir:
+            print("\n[阶段4: 知识存储 (离线导出)]")
+            # 推理结果和前置知识闭包 (包括推出的 REQUIRES_PRE) 与普通关系一起导入
+            inferred = inference.infer_relations(relations)
+            closure = data_loader.closure_relations(relations + inferred)
+            manifest = bulk_import.export_import_csvs(entities, relations, bulk_export_dir, schema_path,
+                                                      derived_relations=inferred + closure)
+            report = bulk_import.validate_import_dir(bulk_export_dir, schema_path)
+            for warning in report["warnings"]:
+                print(f"警告: {warning}")
+            if report["errors"]:
+                for error in report["errors"]:
+                    print(f"错误: {error}")
+                raise ValueError(f"导出的 CSV 未通过校验 ({len(report['errors'])} 个错误)")
+            print(f"已导出 {report['nodes']} 个节点, {report['relationships']} 条关系。停止数据库后执行:")
+            print(bulk_import.import_command(manifest, bulk_export_dir))
+            export_graph_snapshot(config, entities=entities, relations=relations + inferred,
+                                  version=manifest["graph_version"])
+            print("\n--- 知识图谱构建流程完毕 ---")
+            return
+
         # 6. 知识存储 (加载到 Neo4j)
         print("\n[阶段4: 知识存储]")
-        data_loader.load_entities(db_conn, entities)
-        print(f"成功加载 {len(entities)} 个实体节点。")
-        data_loader.load_relations(db_conn, relations)
-        print(f"成功加载 {len(relations)} 个关系。")
+        loader_options = data_loader.loader_options_from_config(config)
+        use_async = (config.getboolean('LOADER', 'ASYNC', fallback=False)
+                     and config.get('GRAPH', 'BACKEND', fallback='neo4j').strip().lower() == 'neo4j')
+        if rebuild and use_async:
+            asyncio.run(load_graph_async(config, entities, relations, loader_options))
+            print(f"成功加载 {len(entities)} 个实体节点, {len(relations)} 个关系 (异步)。")
+            inference.materialize(db_conn, **loader_options)
+        elif rebuild:
+            data_loader.load_entities(db_conn, entities, **loader_options)
+            print(f"成功加载 {len(entities)} 个实体节点。")
+            data_loader.load_relations(db_conn, relations, **loader_options)
+            print(f"成功加载 {len(relations)} 个关系。")
+            inference.materialize(db_conn, **loader_options)
+        else:
+            # 增量加载: 只写入新增/删除的节点和关系, 数据库不会被清空
+            delta = data_loader.compute_delta(db_conn, entities, relations)
+            summary = data_loader.load_delta(db_conn, entities, relations, delta=delta, **loader_options)
+            print(f"增量加载完成: 新增 {summary['added_entities']} 个节点、{summary['added_relations']} 个关系, "
+                  f"删除 {summary['removed_entities']} 个节点、{summary['removed_relations']} 个关系。")
+            # 增量推理: 只重新计算受本次变化影响的推理结果
+            inference.materialize(db_conn, delta["added_relations"], delta["removed_relations"], **loader_options)
+
+        # 6b. 预计算前置知识的传递闭包 (包括推出的 REQUIRES_PRE; qa_system.find_prerequisites 直接读取)
+        data_loader.load_prerequisite_closure(db_conn, **loader_options)
+
+        # 7. 重新生成 CSR 图快照
+        print("\n[阶段5: 导出图快照]")
+        export_graph_snapshot(config, db_conn=db_conn)
 
         print("\n--- 知识图谱构建流程完毕 ---")
 
     except Exception as e:
         print(f"\n流程发生严重错误: {e}")
     finally:
-        db_conn.close()
-        print("数据库连接已关闭。")
+        if db_conn:
+            db_conn.close()
+            print("数据库连接已关闭。")
 
 
 if __name__ == "__main__":
-    main_pipeline()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="知识图谱构建流程")
+    parser.add_argument("--bulk-export", metavar="DIR", default=None,
+                        help="离线全量重建: 导出 neo4j-admin import 所需的 CSV 到 DIR, 不写数据库")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="清空数据库后全量加载 (默认只增量加载变化的部分)")
+    parser.add_argument("--resume", action="store_true",
+                        help="输入未变化的阶段直接复用 data/processed/ 下的检查点 (例如加载失败后重试)")
+    parser.add_argument("--from-stage", choices=STAGES, default=None,
+                        help="从该阶段开始重新计算, 之前的阶段复用检查点")
+    args = parser.parse_args()
+    main_pipeline(bulk_export_dir=args.bulk_export, rebuild=args.rebuild,
+                  resume=args.resume, from_stage=args.from_stage)
\ No newline at end of file
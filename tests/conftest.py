@@ -0,0 +1,8 @@
+# pytest 公共配置: 让测试可以导入项目包 (以及 ner.py 使用的 "import fusion" 形式)
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "kg_course_project", "extraction")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,77 @@
+import csv
+import os
+
+from conftest import ROOT
+from kg_course_project.graph_db import bulk_import, csr_snapshot, data_loader
+from kg_course_project.graph_db.memory_graph import MemoryConnection
+
+SCHEMA = os.path.join(ROOT, "schema.yaml")
+ENTITIES = [
+    {"name": "RDF", "label": "Concept"},
+    {"name": "RDFS", "label": "Concept"},
+    {"name": "OWL", "label": "Concept"},
+    {"name": "Neo4j", "label": "Technology"},
+]
+RELATIONS = [
+    {"head": "RDFS", "head_label": "Concept", "type": "REQUIRES_PRE", "tail": "RDF", "tail_label": "Concept"},
+    {"head": "OWL", "head_label": "Concept", "type": "REQUIRES_PRE", "tail": "RDFS", "tail_label": "Concept"},
+    {"head": "RDFS", "head_label": "Concept", "type": "USES_TECH", "tail": "Neo4j", "tail_label": "Technology"},
+]
+
+
+def _read_rows(path):
+    with open(path, encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        return [dict(zip(header, row)) for row in reader]
+
+
+def _hashes(output_dir, manifest, kind):
+    hashes = set()
+    for entry in manifest[kind]:
+        for row in _read_rows(os.path.join(output_dir, entry["file"])):
+            if "content_hash:string" in row:
+                hashes.add(row["content_hash:string"])
+    return hashes
+
+
+def test_content_hashes_match_the_incremental_loader(tmp_path):
+    closure = data_loader.closure_relations(RELATIONS)
+    manifest = bulk_import.export_import_csvs(ENTITIES, RELATIONS, str(tmp_path), SCHEMA,
+                                              derived_relations=closure)
+    assert bulk_import.validate_import_dir(str(tmp_path), SCHEMA)["errors"] == []
+
+    # 与 data_loader 写入的 content_hash 一致, 导入后的增量加载不会把任何东西当作变化
+    conn = MemoryConnection()
+    data_loader.load_entities(conn, ENTITIES, max_workers=1)
+    data_loader.load_relations(conn, RELATIONS, max_workers=1)
+    delta = data_loader.compute_delta(conn, ENTITIES, RELATIONS)
+    assert not any(delta[key] for key in delta)
+    assert _hashes(str(tmp_path), manifest, "nodes") == {data_loader.entity_hash(e) for e in ENTITIES}
+    assert _hashes(str(tmp_path), manifest, "relationships") == {data_loader.relation_hash(r) for r in RELATIONS}
+
+    # 派生关系 (闭包) 写入单独的文件, 没有 content_hash
+    derived = [entry for entry in manifest["relationships"] if entry["derived"]]
+    assert [entry["type"] for entry in derived] == [data_loader.CLOSURE_TYPE]
+    header = _read_rows(os.path.join(str(tmp_path), derived[0]["file"]))[0].keys()
+    assert "content_hash:string" not in header
+    assert derived[0]["rows"] == len(closure)
+
+
+def test_derived_duplicates_of_base_relations_are_dropped(tmp_path):
+    inferred = [dict(RELATIONS[0], rule="transitive")]
+    manifest = bulk_import.export_import_csvs(ENTITIES, RELATIONS, str(tmp_path), SCHEMA,
+                                              derived_relations=inferred)
+    assert not any(entry["derived"] for entry in manifest["relationships"])
+    assert sum(entry["rows"] for entry in manifest["relationships"]) == len(RELATIONS)
+
+
+def test_import_carries_graph_version_for_the_csr_snapshot(tmp_path):
+    manifest = bulk_import.export_import_csvs(ENTITIES, RELATIONS, str(tmp_path / "import"), SCHEMA)
+    meta_rows = _read_rows(os.path.join(str(tmp_path / "import"), bulk_import.GRAPH_META_FILE))
+    assert meta_rows[0]["key:ID(GraphMeta)"] == "graph"
+    assert int(meta_rows[0]["version:long"]) == manifest["graph_version"] == bulk_import.IMPORT_GRAPH_VERSION
+
+    snapshot_dir = csr_snapshot.export_from_lists(ENTITIES, RELATIONS, str(tmp_path / "csr"),
+                                                  version=manifest["graph_version"])
+    assert csr_snapshot.CSRGraph(snapshot_dir).graph_version == bulk_import.IMPORT_GRAPH_VERSION
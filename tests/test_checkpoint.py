@@ -0,0 +1,49 @@
+import json
+
+from kg_course_project.utils import checkpoint
+
+
+def test_stage_is_reused_only_for_the_same_input(tmp_path):
+    store = checkpoint.StageCheckpoints(str(tmp_path))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"entities": [{"name": "RDF", "label": "Concept"}]}
+
+    outputs, first_hash = store.run("entities", "in-1", compute)
+    # 新的实例从 pipeline_state.json 恢复状态
+    reused, reused_hash = checkpoint.StageCheckpoints(str(tmp_path)).run("entities", "in-1", compute)
+    assert len(calls) == 1
+    assert reused == outputs and reused_hash == first_hash
+
+    store.run("entities", "in-2", compute)
+    assert len(calls) == 2
+    store.run("entities", "in-2", compute, reuse=False)
+    assert len(calls) == 3
+
+
+def test_output_hash_changes_with_content(tmp_path):
+    store = checkpoint.StageCheckpoints(str(tmp_path))
+    _, first = store.run("relations", "in", lambda: {"relations": [{"head": "A", "tail": "B"}]})
+    _, same = store.run("relations", "in", lambda: {"relations": [{"head": "A", "tail": "B"}]}, reuse=False)
+    _, changed = store.run("relations", "in", lambda: {"relations": [{"head": "A", "tail": "C"}]}, reuse=False)
+    assert first == same != changed
+
+
+def test_missing_output_file_invalidates_checkpoint(tmp_path):
+    store = checkpoint.StageCheckpoints(str(tmp_path))
+    store.run("clean", "in", lambda: {"cleaned_text": [{"text": "RDF"}]})
+    (tmp_path / "cleaned_text.jsonl").unlink()
+    assert not store.is_fresh("clean", "in")
+
+
+def test_jsonl_has_header_and_no_partial_file(tmp_path):
+    path = str(tmp_path / "out.jsonl")
+    digest, count = checkpoint.write_jsonl(path, iter([{"a": 1}, {"a": 2}]), {"stage": "s"})
+    assert count == 2
+    with open(path, encoding="utf-8") as f:
+        assert json.loads(f.readline()) == {"_checkpoint": {"stage": "s"}}
+    assert list(checkpoint.read_jsonl(path)) == [{"a": 1}, {"a": 2}]
+    assert not (tmp_path / "out.jsonl.tmp").exists()
+    assert checkpoint.hash_inputs("a", {"x": 1}) == checkpoint.hash_inputs("a", {"x": 1})
@@ -0,0 +1,98 @@
+import configparser
+
+import pytest
+from neo4j import READ_ACCESS, WRITE_ACCESS
+
+from kg_course_project.graph_db import connection, graph_version
+from kg_course_project.graph_db.connection import Neo4jConnection, create_connection
+from kg_course_project.graph_db.memory_graph import MemoryConnection
+from kg_course_project.graph_db.query_cache import QueryCache
+
+
+def _config(**sections):
+    config = configparser.ConfigParser()
+    config.read_dict({"NEO4J": {"URI": "bolt://localhost:7687", "USER": "neo4j", "PASSWORD": "secret"},
+                      **sections})
+    return config
+
+
+def test_options_use_defaults():
+    options = connection._options_from_config(_config())
+    assert options == {
+        "uri": "bolt://localhost:7687",
+        "auth": ("neo4j", "secret"),
+        "max_connection_pool_size": connection.DEFAULT_POOL_SIZE,
+        "connection_timeout": connection.DEFAULT_CONNECTION_TIMEOUT,
+        "connection_acquisition_timeout": connection.DEFAULT_ACQUISITION_TIMEOUT,
+        "fetch_size": connection.DEFAULT_FETCH_SIZE,
+    }
+
+
+def test_options_can_be_overridden():
+    config = _config()
+    config["NEO4J"].update({"MAX_CONNECTION_POOL_SIZE": "8", "CONNECTION_TIMEOUT": "2.5",
+                            "CONNECTION_ACQUISITION_TIMEOUT": "5", "FETCH_SIZE": "100"})
+    options = connection._options_from_config(config)
+    assert (options["max_connection_pool_size"], options["connection_timeout"],
+            options["connection_acquisition_timeout"], options["fetch_size"]) == (8, 2.5, 5.0, 100)
+
+
+def test_backend_dispatch():
+    # 驱动在第一次使用时才建立连接, 这里不需要 Neo4j 服务器
+    conn = create_connection(_config())
+    try:
+        assert isinstance(conn, Neo4jConnection) and conn.fetch_size == connection.DEFAULT_FETCH_SIZE
+    finally:
+        conn.close()
+    assert isinstance(create_connection(_config(GRAPH={"BACKEND": " Memory ", "SNAPSHOT_FILE": ""})),
+                      MemoryConnection)
+    with pytest.raises(ValueError):
+        create_connection(_config(GRAPH={"BACKEND": "sqlite"}))
+
+
+class _FakeSession:
+    def __init__(self, driver, access_mode):
+        self.driver, self.access_mode = driver, access_mode
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute_read(self, work, query, parameters=None):
+        self.driver.calls.append(("read", self.access_mode, query))
+        return [{"version": 3}] if query == graph_version.GRAPH_VERSION_QUERY else [{"answer": "RDF"}]
+
+    def execute_write(self, work, query, parameters=None):
+        self.driver.calls.append(("write", self.access_mode, query))
+        return [{"version": 4}]
+
+
+class _FakeDriver:
+    """记录每个事务使用的会话访问模式"""
+
+    def __init__(self):
+        self.calls = []
+
+    def session(self, database, fetch_size, default_access_mode):
+        return _FakeSession(self, default_access_mode)
+
+    def close(self):
+        pass
+
+
+def test_version_checks_and_cached_reads_use_read_sessions():
+    conn = Neo4jConnection("bolt://localhost:7687", ("neo4j", "secret"),
+                           cache=QueryCache(version_check_interval=0))
+    conn.driver.close()
+    conn.driver = _FakeDriver()
+
+    assert conn.read("MATCH (n) RETURN n.name AS answer") == [{"answer": "RDF"}]
+    assert conn.read("MATCH (n) RETURN n.name AS answer") == [{"answer": "RDF"}]
+    assert graph_version.get_graph_version(conn) == 3
+    assert conn.bump_graph_version() == 4
+    reads = [call for call in conn.driver.calls if call[0] == "read"]
+    # 两次版本检查 + 一次实际查询 (第二次命中缓存) + 一次直接读取版本号, 全部在读会话中
+    assert len(reads) == 4 and all(mode == READ_ACCESS for _, mode, _ in reads)
+    assert [mode for kind, mode, _ in conn.driver.calls if kind == "write"] == [WRITE_ACCESS]
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from kg_course_project.graph_db import csr_snapshot, data_loader
+from kg_course_project.graph_db.memory_graph import MemoryConnection
+
+pytestmark = pytest.mark.skipif(not csr_snapshot.NUMPY_AVAILABLE, reason="需要 numpy")
+
+ENTITIES = [{"name": name, "label": "Concept"} for name in ("RDF", "RDFS", "OWL", "SPARQL")] + [
+    {"name": "RDF", "label": "Technology"}]
+RELATIONS = [
+    {"head": head, "head_label": "Concept", "type": "REQUIRES_PRE", "tail": tail, "tail_label": "Concept"}
+    for head, tail in [("RDFS", "RDF"), ("OWL", "RDFS"), ("SPARQL", "RDF")]
+] + [{"head": "OWL", "head_label": "Concept", "type": "USES_TECH", "tail": "RDF", "tail_label": "Technology"}]
+
+
+def _names(graph, nodes):
+    return sorted(graph.name(int(n)) for n in nodes)
+
+
+def test_lookup_and_neighbors_by_label_and_type(tmp_path):
+    graph = csr_snapshot.CSRGraph(csr_snapshot.export_from_lists(ENTITIES, RELATIONS, str(tmp_path)))
+    assert (graph.num_nodes, graph.num_edges) == (5, 4)
+    rdf, tech_rdf, owl = graph.find("RDF", "Concept"), graph.find("RDF", "Technology"), graph.find("OWL")
+    assert rdf != tech_rdf and graph.label(tech_rdf) == "Technology"
+    assert graph.find("RDF", "Algorithm") is None and graph.find("XML") is None
+
+    assert _names(graph, graph.successors(owl)) == ["RDF", "RDFS"]
+    assert list(graph.successors(owl, "USES_TECH")) == [tech_rdf]
+    assert _names(graph, graph.predecessors(rdf, "REQUIRES_PRE")) == ["RDFS", "SPARQL"]
+    assert len(graph.successors(owl, "UNKNOWN")) == 0
+
+    depths = graph.reachable(owl, "REQUIRES_PRE")
+    assert {graph.name(n): d for n, d in depths.items()} == {"RDFS": 1, "RDF": 2}
+    assert {graph.name(n) for n in graph.reachable(rdf, "REQUIRES_PRE", reverse=True, max_depth=1)} == {
+        "RDFS", "SPARQL"}
+
+
+def test_export_from_connection_swaps_current_and_keeps_recent(tmp_path):
+    conn = MemoryConnection()
+    data_loader.load_entities(conn, ENTITIES, max_workers=1)
+    data_loader.load_relations(conn, RELATIONS, max_workers=1)
+    root = str(tmp_path)
+
+    reader = csr_snapshot.SnapshotReader(root, check_interval=0)
+    assert reader.get() is None
+    dirs = [csr_snapshot.export_from_connection(conn, root, keep=2) for _ in range(3)]
+    assert csr_snapshot.current_snapshot_dir(root) == dirs[-1]
+    assert not os.path.exists(dirs[0])
+
+    graph = reader.get()
+    assert graph.path == dirs[-1]
+    assert graph.graph_version == 2  # 实体和关系各递增一次
+    assert graph.num_edges == len(RELATIONS)
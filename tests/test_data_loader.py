@@ -0,0 +1,158 @@
+import asyncio
+import threading
+
+import pytest
+from neo4j.exceptions import TransientError
+
+from kg_course_project.graph_db import data_loader, graph_version
+from kg_course_project.graph_db.memory_graph import MemoryConnection
+
+
+class FlakyConnection(MemoryConnection):
+    """前 failures 次 execute_write 抛出瞬时错误 (模拟死锁), 记录每次写入的分块大小"""
+
+    def __init__(self, failures=0, fail_on=None):
+        super().__init__()
+        self.failures = failures
+        self.fail_on = fail_on
+        self.chunks = []
+        self._flaky_lock = threading.Lock()
+
+    def execute_write(self, query, parameters=None, database="neo4j"):
+        with self._flaky_lock:
+            if self.failures > 0:
+                self.failures -= 1
+                raise TransientError("DeadlockDetected")
+            if self.fail_on is not None and self.fail_on(query, parameters):
+                raise ValueError("写入失败")
+            self.chunks.append(len(parameters["batch"]))
+        super().execute_write(query, parameters, database)
+
+
+class AsyncMemoryConnection:
+    """把 MemoryConnection 包装成 AsyncNeo4jConnection 的写接口, 用于测试异步加载器"""
+
+    def __init__(self):
+        self.sync = FlakyConnection()
+
+    async def execute_write(self, query, parameters=None, database="neo4j"):
+        await asyncio.sleep(0)
+        self.sync.execute_write(query, parameters, database)
+
+    async def bump_graph_version(self):
+        return self.sync.bump_graph_version()
+
+
+def _entities(n, label="Concept"):
+    return [{"name": f"{label}{i}", "label": label} for i in range(n)]
+
+
+def _relations(names):
+    return [{"head": head, "head_label": "Concept", "type": "REQUIRES_PRE", "tail": tail, "tail_label": "Concept"}
+            for head, tail in names]
+
+
+def test_chunks_are_written_in_parallel_groups():
+    conn = FlakyConnection()
+    stats = data_loader.load_entities(conn, _entities(25) + _entities(7, "Technology"), batch_size=10, max_workers=2)
+    assert sorted(s["rows"] for s in stats) == [7, 25]
+    assert sorted(conn.chunks) == [5, 7, 10, 10]
+    assert len(conn.graph.label_index["Concept"]) == 25
+    assert graph_version.get_graph_version(conn) == 1
+
+
+def test_transient_errors_are_retried():
+    conn = FlakyConnection(failures=2)
+    stats = data_loader.load_entities(conn, _entities(5), batch_size=2, max_workers=1, retry_backoff=0)
+    assert stats[0]["retries"] == 2
+    assert len(conn.graph.label_index["Concept"]) == 5
+
+
+def test_retries_are_bounded():
+    conn = FlakyConnection(failures=10)
+    with pytest.raises(TransientError):
+        data_loader.load_entities(conn, _entities(3), max_retries=2, retry_backoff=0)
+
+
+def test_async_loader_writes_the_same_graph():
+    entities = _entities(12) + _entities(3, "Technology")
+    relations = _relations([("Concept1", "Concept0"), ("Concept2", "Concept1")])
+
+    async def load(conn):
+        await data_loader.load_entities_async(conn, entities, batch_size=5, max_concurrency=2)
+        await data_loader.load_relations_async(conn, relations, batch_size=5, max_concurrency=2)
+
+    conn = AsyncMemoryConnection()
+    asyncio.run(load(conn))
+    assert sorted(conn.sync.chunks) == [2, 2, 3, 5, 5]
+    assert graph_version.get_graph_version(conn.sync) == 2
+    assert not any(data_loader.compute_delta(conn.sync, entities, relations).values())
+
+
+def test_partial_write_still_bumps_graph_version():
+    # Technology 分组失败时, 已经提交的 Concept 分块仍然让图版本号递增
+    conn = FlakyConnection(fail_on=lambda query, params: params["batch"][0]["name"].startswith("Technology"))
+    with pytest.raises(ValueError):
+        data_loader.load_entities(conn, _entities(6) + _entities(2, "Technology"), batch_size=3, max_workers=2)
+    assert len(conn.graph.label_index["Concept"]) == 6
+    assert graph_version.get_graph_version(conn) == 1
+
+
+def test_failed_write_without_commits_keeps_graph_version():
+    conn = FlakyConnection(fail_on=lambda query, params: True)
+    with pytest.raises(ValueError):
+        data_loader.load_entities(conn, _entities(3), max_workers=1)
+    assert graph_version.get_graph_version(conn) == 0
+
+
+def test_async_partial_write_bumps_after_all_chunks_finish():
+    conn = AsyncMemoryConnection()
+    conn.sync.fail_on = lambda query, params: params["batch"][0]["name"] == "Concept0"
+    with pytest.raises(ValueError):
+        asyncio.run(data_loader.load_entities_async(conn, _entities(9), batch_size=3, max_concurrency=3))
+    assert len(conn.sync.graph.label_index["Concept"]) == 6
+    assert graph_version.get_graph_version(conn.sync) == 1
+
+
+def test_delta_load_only_writes_changes():
+    conn = FlakyConnection()
+    entities = [{"name": name, "label": "Concept"} for name in ("RDF", "RDFS", "OWL")]
+    relations = _relations([("RDFS", "RDF"), ("OWL", "RDFS")])
+    data_loader.load_delta(conn, entities, relations)
+
+    conn.chunks.clear()
+    entities = entities[:2] + [{"name": "SPARQL", "label": "Concept"}]
+    relations = _relations([("RDFS", "RDF"), ("SPARQL", "RDF")])
+    summary = data_loader.load_delta(conn, entities, relations)
+    assert summary == {"added_entities": 1, "removed_entities": 1, "added_relations": 1, "removed_relations": 1}
+    assert sorted(conn.chunks) == [1, 1, 1, 1]
+    assert data_loader.compute_delta(conn, entities, relations) == {
+        "added_entities": [], "removed_entities": [], "added_relations": [], "removed_relations": []}
+
+    # 没有变化时不写入, 图版本号也不变
+    conn.chunks.clear()
+    version = graph_version.get_graph_version(conn)
+    data_loader.load_delta(conn, entities, relations)
+    assert conn.chunks == []
+    assert graph_version.get_graph_version(conn) == version
+
+
+def test_closure_is_shortest_distance_and_ignores_cycles():
+    closure = data_loader.compute_closure([("c", "b"), ("b", "a"), ("c", "a"), ("a", "c")])
+    assert closure[("c", "a")] == 1
+    assert closure[("c", "b")] == 1
+    assert closure[("b", "c")] == 2
+    assert all(head != tail for head, tail in closure)
+
+
+def test_prerequisite_closure_is_maintained_incrementally():
+    conn = FlakyConnection()
+    entities = [{"name": name, "label": "Concept"} for name in ("RDF", "RDFS", "OWL")]
+    data_loader.load_delta(conn, entities, _relations([("RDFS", "RDF"), ("OWL", "RDFS")]))
+    assert data_loader.load_prerequisite_closure(conn) == {"closure": 3, "added": 3, "removed": 0}
+    assert data_loader.load_prerequisite_closure(conn) == {"closure": 3, "added": 0, "removed": 0}
+
+    data_loader.load_delta(conn, entities, _relations([("OWL", "RDFS")]))
+    assert data_loader.load_prerequisite_closure(conn) == {"closure": 1, "added": 0, "removed": 2}
+    depths = {(r["head"], r["tail"]): r["depth"] for r in conn.iter_query(data_loader.CLOSURE_EDGES_QUERY)}
+    assert depths == {("OWL", "RDFS"): 1}
@@ -0,0 +1,45 @@
+from kg_course_project.extraction import fusion
+
+
+def _entities(*names, label="Concept"):
+    return [{"name": name, "label": label} for name in names]
+
+
+def test_default_threshold_keeps_short_names_apart():
+    cmap = fusion.create_canonical_map(_entities("RDF", "RDFS", "R.D.F."))
+    assert cmap["rdf"] == "RDF"
+    assert cmap["rdfs"] == "RDFS"
+
+
+def test_only_same_label_is_fused():
+    entities = _entities("BERT") + _entities("B.E.R.T.", label="Technology")
+    cmap = fusion.create_canonical_map(entities)
+    assert cmap["bert"] == "BERT"
+    assert fusion.resolve_entities(entities, cmap) == [{"name": "BERT", "label": "Concept"},
+                                                     {"name": "BERT", "label": "Technology"}]
+
+
+def test_incremental_update_matches_existing_clusters(tmp_path):
+    path = str(tmp_path / "canonical_map.json")
+    fusion.update_canonical_map(_entities("知识图谱", "RDF"), path)
+    store = fusion.update_canonical_map(_entities("R.D.F.", "OWL"), path)
+    assert store["rdf"] == "RDF"
+    assert store["owl"] == "OWL"
+    assert fusion.CanonicalStore.load(path).to_dict() == store.to_dict()
+
+
+def test_threshold_change_discards_persisted_map(tmp_path):
+    path = str(tmp_path / "canonical_map.json")
+    loose = fusion.update_canonical_map(_entities("RDF", "RDFS"), path, similarity_threshold=0.8)
+    assert loose["rdfs"] == "RDF"
+
+    strict = fusion.update_canonical_map(_entities("RDF", "RDFS"), path, similarity_threshold=0.9)
+    assert strict["rdfs"] == "RDFS"
+    assert fusion.CanonicalStore.load(path).similarity_threshold == 0.9
+
+
+def test_resolve_relations_deduplicates_after_fusion():
+    cmap = fusion.create_canonical_map(_entities("RDF", "R.D.F.", "知识图谱"))
+    relations = [{"head": head, "head_label": "Concept", "type": "IS_A", "tail": "知识图谱", "tail_label": "Concept"}
+                 for head in ("RDF", "R.D.F.")]
+    assert fusion.resolve_relations(relations, cmap) == [relations[0]]
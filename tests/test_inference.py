@@ -0,0 +1,94 @@
+import random
+
+from kg_course_project.applications import inference
+from kg_course_project.applications.inference import InferenceEngine
+from kg_course_project.graph_db import data_loader
+from kg_course_project.graph_db.memory_graph import MemoryConnection
+
+TYPES = ["IS_A", "PART_OF", "SUBCONCEPT", "BELONGS_TO", "REQUIRES_PRE"]
+
+
+def _random_facts(rng, n=12, m=30):
+    # 包含环 (传递性规则会在环上遇到自反事实)
+    return {(("Concept", f"c{rng.randrange(n)}"), rng.choice(TYPES), ("Concept", f"c{rng.randrange(n)}"))
+            for _ in range(m)}
+
+
+def _full(base):
+    engine = InferenceEngine()
+    engine.load(base)
+    engine.materialize()
+    return engine.derived()
+
+
+def test_dred_matches_full_recompute():
+    rng = random.Random(0)
+    for _ in range(30):
+        base = _random_facts(rng)
+        engine = InferenceEngine()
+        engine.load(base)
+        engine.materialize()
+        for _ in range(5):
+            removed = set(rng.sample(sorted(base), k=min(len(base), rng.randrange(1, 6))))
+            added = _random_facts(rng, m=rng.randrange(1, 6))
+            engine.delete(removed)
+            engine.insert(added)
+            base = (base - removed) | added
+            assert set(engine.derived()) == set(_full(base))
+
+
+def test_rederivation_does_not_restore_reflexive_facts():
+    a, b = ("Concept", "a"), ("Concept", "b")
+    engine = InferenceEngine()
+    # 被删除的自反基础事实在环上仍能 "推出", 但推理从不产生自反事实
+    engine.load({(a, "PART_OF", a), (a, "PART_OF", b), (b, "PART_OF", a)})
+    engine.materialize()
+    engine.delete({(a, "PART_OF", a)})
+    assert (a, "PART_OF", a) not in engine.derived()
+    assert engine.derived() == _full({(a, "PART_OF", b), (b, "PART_OF", a)})
+
+
+def _relations(facts):
+    return [{"head": s[1], "head_label": s[0], "type": p, "tail": o[1], "tail_label": o[0]} for s, p, o in facts]
+
+
+def _stored(conn):
+    return {inference._fact(r) for r in conn.iter_query(inference.INFERRED_RELATIONS_QUERY)}
+
+
+def test_incremental_materialize_matches_full_on_the_memory_graph():
+    rng = random.Random(1)
+    conn = MemoryConnection()
+    entities = [{"name": f"c{i}", "label": "Concept"} for i in range(12)]
+    # 两组不相连的事实: 只改动第一组时, 增量推理不需要读出第二组
+    base = _random_facts(rng) | {(("Concept", "x"), "IS_A", ("Concept", "y")),
+                                 (("Concept", "y"), "IS_A", ("Concept", "z"))}
+    entities += [{"name": name, "label": "Concept"} for name in "xyz"]
+    data_loader.load_delta(conn, entities, _relations(base), max_workers=1)
+    assert inference.materialize(conn, max_workers=1)["mode"] == "full"
+    assert _stored(conn) == set(_full(base))
+
+    queries, iter_query = [], conn.iter_query
+    conn.iter_query = lambda query, parameters=None: queries.append((query, parameters)) or iter_query(query, parameters)
+    for _ in range(5):
+        removed = set(rng.sample(sorted(f for f in base if f[0][1] not in "xyz"), k=3))
+        new_base = (base - removed) | _random_facts(rng, m=4)
+        delta = data_loader.compute_delta(conn, entities, _relations(new_base))
+        data_loader.load_delta(conn, entities, _relations(new_base), delta=delta, max_workers=1)
+        summary = inference.materialize(conn, delta["added_relations"], delta["removed_relations"], max_workers=1)
+        assert summary["mode"] == "incremental"
+        assert _stored(conn) == set(_full(new_base))
+        base = new_base
+    read = {row["name"] for query, parameters in queries if "UNWIND $batch" in query for row in parameters["batch"]}
+    assert read and not read & set("xyz")
+
+
+def test_materialize_falls_back_to_full_when_the_ruleset_changes():
+    conn = MemoryConnection()
+    entities = [{"name": name, "label": "Concept"} for name in "abc"]
+    relations = _relations({(("Concept", "a"), "IS_A", ("Concept", "b")), (("Concept", "b"), "IS_A", ("Concept", "c"))})
+    data_loader.load_delta(conn, entities, relations, max_workers=1)
+    inference.materialize(conn, max_workers=1)
+    rules = inference.RULES[:1]
+    assert inference.materialize(conn, [], [], rules=rules, max_workers=1)["mode"] == "full"
+    assert inference.materialize(conn, [], [], rules=rules, max_workers=1)["mode"] == "incremental"
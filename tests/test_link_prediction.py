@@ -0,0 +1,72 @@
+import pytest
+
+from kg_course_project.applications import link_prediction
+from kg_course_project.applications.link_prediction import KGEmbedding, TripleIndex
+
+pytestmark = pytest.mark.skipif(not link_prediction.NUMPY_AVAILABLE, reason="需要 numpy")
+
+CHAIN = [f"c{i}" for i in range(8)]
+RELATIONS = [{"head": head, "head_label": "Concept", "type": "REQUIRES_PRE", "tail": tail, "tail_label": "Concept"}
+             for head, tail in zip(CHAIN[1:], CHAIN)]
+RELATIONS += [{"head": name, "head_label": "Concept", "type": "BELONGS_TO", "tail": "第一章", "tail_label": "Chapter"}
+              for name in CHAIN[:4]]
+
+
+def _brute_force(model, test, all_triples, hits_at=10):
+    """逐个三元组、逐个候选实体计算过滤式排名"""
+    known = {tuple(triple) for triple in all_triples.tolist()}
+    entities = range(len(model.entity))
+    ranks = []
+    for h, r, t in test.tolist():
+        target = model.score([h], [r], [t])[0]
+        for corrupt in ([(h, r, e) for e in entities], [(e, r, t) for e in entities]):
+            better = sum(1 for triple in corrupt if triple not in known
+                         and model.score([triple[0]], [triple[1]], [triple[2]])[0] > target)
+            ranks.append(1 + better)
+    return {"mrr": sum(1.0 / rank for rank in ranks) / len(ranks),
+            f"hits@{hits_at}": sum(rank <= hits_at for rank in ranks) / len(ranks)}
+
+
+@pytest.mark.parametrize("model_name", link_prediction.MODELS)
+def test_filtered_metrics_match_brute_force(model_name):
+    index = TripleIndex(RELATIONS)
+    model = KGEmbedding(len(index.entities), len(index.relations), dim=8, model=model_name, seed=1)
+    model.fit(index.triples, epochs=5, batch_size=4)
+    test = index.triples[::3]
+    result = link_prediction.evaluate(model, test, index.triples, batch_size=2, hits_at=3)
+    expected = _brute_force(model, test, index.triples, hits_at=3)
+    assert result["triples"] == len(test)
+    assert result["mrr"] == pytest.approx(expected["mrr"], rel=1e-5)
+    assert result["hits@3"] == pytest.approx(expected["hits@3"])
+
+
+@pytest.mark.parametrize("model_name", link_prediction.MODELS)
+def test_batched_scores_match_single_scores(model_name):
+    index = TripleIndex(RELATIONS)
+    model = KGEmbedding(len(index.entities), len(index.relations), dim=8, model=model_name, seed=2)
+    h, r, t = index.triples[:, 0], index.triples[:, 1], index.triples[:, 2]
+    tails, heads = model.score_tails(h, r), model.score_heads(r, t)
+    for row, (head, rel, tail) in enumerate(index.triples.tolist()):
+        assert tails[row, tail] == pytest.approx(model.score([head], [rel], [tail])[0], abs=1e-4)
+        assert heads[row, head] == pytest.approx(model.score([head], [rel], [tail])[0], abs=1e-4)
+
+
+def test_split_keeps_test_entities_in_training():
+    index = TripleIndex(RELATIONS)
+    train, test = index.split(test_ratio=0.5, seed=3)
+    assert len(train) + len(test) == len(index.triples)
+    seen = set(train[:, 0].tolist()) | set(train[:, 2].tolist())
+    assert all(h in seen and t in seen for h, _, t in test.tolist())
+
+
+def test_suggestions_skip_known_reverse_and_excluded_pairs():
+    index = TripleIndex(RELATIONS)
+    model = KGEmbedding(len(index.entities), len(index.relations), dim=8, seed=4)
+    exclude = [("c2", "c0")]
+    suggestions = link_prediction.suggest_relations(model, index, top_k=3, exclude=exclude)
+    pairs = {(s["head"], s["tail"]) for s in suggestions}
+    blocked = {(r["head"], r["tail"]) for r in RELATIONS if r["type"] == "REQUIRES_PRE"} | set(exclude)
+    assert pairs and not pairs & (blocked | {(t, h) for h, t in blocked})
+    assert all(s["head"] != s["tail"] and s["tail_label"] == "Concept" for s in suggestions)
+    assert [s["score"] for s in suggestions] == sorted((s["score"] for s in suggestions), reverse=True)
+    assert all(0.0 <= s["confidence"] <= 1.0 for s in suggestions)
@@ -0,0 +1,73 @@
+import importlib
+import os
+import pkgutil
+
+import pytest
+
+import kg_course_project
+from conftest import ROOT
+from kg_course_project.applications import inference, qa_system
+from kg_course_project.graph_db import data_loader, schema_manager
+from kg_course_project.graph_db.memory_graph import MemoryConnection, UnsupportedQueryError, _normalize
+from kg_course_project.utils.file_io import read_yaml
+
+RELATION = {"head": "RDFS", "head_label": "Concept", "type": "REQUIRES_PRE", "tail": "RDF", "tail_label": "Concept"}
+
+
+def _query_constants():
+    """项目中所有模块级的 *_QUERY 字符串常量"""
+    constants = {}
+    for package in ("graph_db", "applications"):
+        path = os.path.join(os.path.dirname(kg_course_project.__file__), package)
+        for module_info in pkgutil.iter_modules([path]):
+            module = importlib.import_module(f"kg_course_project.{package}.{module_info.name}")
+            for name, value in vars(module).items():
+                if name.endswith("_QUERY") and isinstance(value, str):
+                    constants[f"{module.__name__}.{name}"] = value
+    return constants
+
+
+def _generated_queries():
+    """按标签/关系类型生成的查询"""
+    queries = [query for _, query, _ in data_loader._entity_jobs([{"name": "RDF", "label": "Concept"}])]
+    queries += [query for _, query, _ in data_loader._relation_jobs([RELATION])]
+    queries += [query for _, query, _ in data_loader._entity_removal_jobs([{"name": "RDF", "label": "Concept"}])]
+    queries += [query for _, query, _ in data_loader._relation_removal_jobs([RELATION])]
+    queries += [query for _, query, _ in data_loader._derived_relation_jobs([RELATION], inference.DERIVED_PROPERTIES)]
+    queries.append(inference.neighborhood_query("Concept"))
+    queries += [qa_system.plan_for(intent, label)
+                for intent, (_, _, label) in qa_system.INTENT_PLANS.items()]
+    queries += [item["query"] for item in schema_manager.desired_schema(read_yaml(os.path.join(ROOT, "schema.yaml")))]
+    queries += ["CALL db.awaitIndexes($timeout)", "DROP INDEX idx_Concept_name", "DROP CONSTRAINT uniq_Concept_name"]
+    return queries
+
+
+def test_every_named_query_is_dispatched_by_name():
+    conn = MemoryConnection()
+    constants = _query_constants()
+    assert constants
+    unregistered = [name for name, query in constants.items() if _normalize(query) not in conn._named]
+    assert unregistered == []
+
+
+@pytest.mark.parametrize("query", _generated_queries())
+def test_every_generated_query_has_a_handler(query):
+    assert MemoryConnection()._resolve(query) is not None
+
+
+def test_unknown_queries_are_rejected():
+    with pytest.raises(UnsupportedQueryError):
+        MemoryConnection().run_query("MATCH (n) DETACH DELETE n")
+
+
+def test_prerequisite_queries_on_the_memory_graph():
+    conn = MemoryConnection()
+    entities = [{"name": name, "label": "Concept"} for name in ("RDF", "RDFS", "OWL")]
+    relations = [RELATION, dict(RELATION, head="OWL", tail="RDFS")]
+    data_loader.load_entities(conn, entities, max_workers=1)
+    data_loader.load_relations(conn, relations, max_workers=1)
+    data_loader.load_prerequisite_closure(conn, max_workers=1)
+
+    assert qa_system.find_prerequisites(conn, "OWL", with_depth=True) == [("RDFS", 1), ("RDF", 2)]
+    assert qa_system.find_prerequisites(conn, "OWL", max_depth=1) == ["RDFS"]
+    assert qa_system.execute_plan(conn, "dependents", "Concept", "RDF") == ["RDFS"]
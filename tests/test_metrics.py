@@ -0,0 +1,106 @@
+import logging
+import threading
+
+from kg_course_project.graph_db import query_metrics
+from kg_course_project.graph_db.memory_graph import MemoryConnection
+from kg_course_project.graph_db.query_metrics import QueryMetrics, fingerprint, profile_summary
+from kg_course_project.utils.metrics import Registry
+
+
+def _wait_for_profiles():
+    for thread in threading.enumerate():
+        if thread.name == "slow-query-profile":
+            thread.join(timeout=5)
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram("latency_seconds", "延迟", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "/ask")
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP latency_seconds 延迟", "# TYPE latency_seconds histogram"]
+    assert 'latency_seconds_bucket{route="/ask",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/ask",le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{route="/ask",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{route="/ask"} 3.65' in lines
+    assert 'latency_seconds_count{route="/ask"} 4' in lines
+
+
+def test_counters_are_shared_by_name_and_labels_are_escaped():
+    registry = Registry()
+    counter = registry.counter("errors_total", "错误", ("query",))
+    assert registry.counter("errors_total", "错误", ("query",)) is counter
+    counter.inc('a "b"\n')
+    counter.inc('a "b"\n', amount=2)
+    assert 'errors_total{query="a \\"b\\"\\n"} 3' in registry.render().splitlines()
+
+
+def test_collectors_are_rendered_at_scrape_time():
+    registry, calls = Registry(), []
+    registry.register_collector(lambda: calls.append(1) or [("entries", "gauge", "条目数", [({"cache": "q"}, 5)])])
+    assert not calls
+    assert registry.render().splitlines() == ["# HELP entries 条目数", "# TYPE entries gauge", 'entries{cache="q"} 5']
+
+
+def test_fingerprints_ignore_literals_and_whitespace():
+    assert fingerprint("MATCH (n {name: 'RDF'})\n RETURN n LIMIT 5")[0] == \
+        fingerprint("MATCH  (n {name: \"OWL\"}) RETURN n LIMIT 10")[0]
+    assert fingerprint("MATCH (n) RETURN n")[0] != fingerprint("MATCH (m) RETURN m")[0]
+
+
+def test_profile_summary_sums_db_hits():
+    plan = {"operatorType": "ProduceResults", "dbHits": 0, "rows": 3,
+            "children": [{"operatorType": "Expand", "dbHits": 7,
+                          "children": [{"operatorType": "NodeIndexSeek", "dbHits": 4}]}]}
+    assert profile_summary(plan) == {"db_hits": 11, "rows": 3,
+                                     "operators": ["ProduceResults", "Expand", "NodeIndexSeek"]}
+
+
+def test_only_slow_reads_are_logged_and_profiled(caplog):
+    metrics = QueryMetrics(slow_query_ms=0, registry=Registry())
+    profiled = []
+    profiler = lambda query, parameters: profiled.append(query) or {"operatorType": "ProduceResults", "rows": 1}
+    with caplog.at_level(logging.WARNING, logger=query_metrics.__name__):
+        for operation in ("read", "iter", "write"):
+            with metrics.measure(f"MATCH (n) RETURN n.{operation}", {"name": "RDF"}, operation, profiler):
+                pass
+        _wait_for_profiles()
+    slow = [record.getMessage() for record in caplog.records if "[SlowQuery]" in record.getMessage()]
+    assert len(slow) == 1 and " read " in slow[0] and '"name": "RDF"' in slow[0] and "rows=1" in slow[0]
+    assert profiled == ["MATCH (n) RETURN n.read"]
+    lines = metrics.duration.render()
+    assert sum(line.startswith("kg_db_query_duration_seconds_count") for line in lines) == 3
+
+
+def test_profiles_are_rate_limited_per_fingerprint(caplog):
+    metrics = QueryMetrics(slow_query_ms=0, profile_interval=60, registry=Registry())
+    profiled = []
+    profiler = lambda query, parameters: profiled.append(query) or {"operatorType": "ProduceResults"}
+    with caplog.at_level(logging.WARNING, logger=query_metrics.__name__):
+        for _ in range(3):
+            with metrics.measure("MATCH (n) RETURN n", None, "read", profiler):
+                pass
+        _wait_for_profiles()
+    assert len(profiled) == 1
+    assert sum("[SlowQuery]" in record.getMessage() for record in caplog.records) == 3
+
+
+def test_errors_are_counted_and_reraised():
+    metrics = QueryMetrics(registry=Registry())
+    try:
+        with metrics.measure("MATCH (n) RETURN n", None, "read"):
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    key, _ = fingerprint("MATCH (n) RETURN n")
+    assert f'kg_db_query_errors_total{{fingerprint="{key}",operation="read"}} 1' in metrics.errors.render()
+
+
+def test_memory_connection_records_queries():
+    metrics = QueryMetrics(slow_query_ms=10 ** 6, registry=Registry())
+    conn = MemoryConnection(metrics=metrics)
+    conn.bump_graph_version()
+    assert list(conn.iter_query("MATCH (m:GraphMeta {key: 'graph'}) RETURN m.version AS version"))
+    operations = {labels[1] for labels in metrics.duration.snapshot()}
+    assert operations == {"write", "iter"}
@@ -0,0 +1,60 @@
+import itertools
+import random
+
+import pytest
+
+from kg_course_project.extraction import fusion, ngram_align
+
+pytestmark = pytest.mark.skipif(not ngram_align.SCIPY_AVAILABLE, reason="需要 numpy 和 scipy")
+
+
+def _entities(*names, label="Concept"):
+    return [{"name": name, "label": label} for name in names]
+
+
+@pytest.mark.parametrize("acronym, expansion", [
+    ("RDF", "Resource Description Framework"),
+    ("OWL", "Web Ontology Language"),
+    ("BERT", "Bidirectional Encoder Representations from Transformers"),
+])
+def test_acronyms_align_with_expansions(acronym, expansion):
+    cmap = ngram_align.create_canonical_map_tfidf(_entities(acronym, expansion, "知识图谱"))
+    assert cmap[fusion.normalize_entity_name(expansion)] == acronym
+    assert cmap["知识图谱"] == "知识图谱"
+
+
+def test_acronym_does_not_match_other_initials():
+    cmap = ngram_align.create_canonical_map_tfidf(_entities("RDF", "Knowledge Graph Embedding"))
+    assert cmap["knowledgegraphembedding"] == "Knowledge Graph Embedding"
+
+
+def test_members_are_similar_to_their_representative():
+    rng = random.Random(7)
+    words = ["knowledge", "graph", "entity", "relation", "embedding", "extraction", "linking"]
+    names = sorted({" ".join(rng.sample(words, rng.randint(1, 3))) for _ in range(200)}, key=lambda x: (len(x), x))
+    threshold = 0.5
+    cmap = ngram_align.create_canonical_map_tfidf(_entities(*names), similarity_threshold=threshold)
+
+    matrix = ngram_align.build_tfidf_matrix(names)
+    index = {fusion.normalize_entity_name(name): i for i, name in enumerate(names)}
+    for norm_name, canonical in cmap.items():
+        i, j = index[norm_name], index[fusion.normalize_entity_name(canonical)]
+        if i != j:
+            assert matrix[i].multiply(matrix[j]).sum() >= threshold - 1e-6
+
+
+def test_each_method_has_its_own_default_threshold(monkeypatch):
+    seen = {}
+    monkeypatch.setattr(ngram_align, "create_canonical_map_tfidf",
+                        lambda entities, similarity_threshold: seen.setdefault("tfidf", similarity_threshold))
+    fusion.create_canonical_map(_entities("RDF"), method="tfidf")
+    assert seen["tfidf"] == ngram_align.DEFAULT_TFIDF_THRESHOLD
+    # levenshtein 使用 fusion 的默认阈值: RDF / RDFS 不会被合并
+    assert fusion.create_canonical_map(_entities("RDF", "RDFS"))["rdfs"] == "RDFS"
+
+
+def test_matches_levenshtein_on_exact_variants():
+    variants = ["R.D.F.", "RDF", "rdf"]
+    for names in itertools.permutations(variants):
+        cmap = ngram_align.create_canonical_map_tfidf(_entities(*names))
+        assert set(cmap) == {"rdf"}
@@ -0,0 +1,50 @@
+import random
+
+from kg_course_project.applications import qa_system
+from kg_course_project.applications.prerequisite_dag import PrerequisiteDAG, PrerequisiteIndex
+from kg_course_project.graph_db import data_loader
+from kg_course_project.graph_db.memory_graph import MemoryConnection
+
+
+def _random_edges(seed, n=40, m=80):
+    rng = random.Random(seed)
+    return {(f"c{rng.randrange(n)}", f"c{rng.randrange(n)}") for _ in range(m)}
+
+
+def test_bitsets_and_bfs_match_the_closure():
+    for seed in range(5):
+        # 包含环和自环, 环上的节点走 BFS 兜底
+        edges = _random_edges(seed)
+        dag = PrerequisiteDAG(edges)
+        closure = data_loader.compute_closure(edges)
+        for name in dag.names:
+            expected = sorted((d, tail) for (head, tail), d in closure.items() if head == name)
+            assert dag.prerequisites(name, with_depth=True) == [(t, d) for d, t in expected]
+            for other in dag.names:
+                assert dag.is_prerequisite(name, other) == ((name, other) in closure)
+
+
+def test_learning_path_is_topological():
+    dag = PrerequisiteDAG([("OWL", "RDFS"), ("RDFS", "RDF"), ("SPARQL", "RDF"), ("OWL", "SPARQL")])
+    path = dag.learning_path("OWL")
+    assert set(path) == {"RDFS", "RDF", "SPARQL"} and path[0] == "RDF"
+    assert dag.prerequisites("OWL", max_depth=1) == ["RDFS", "SPARQL"]
+    assert dag.prerequisites("XML") is None and dag.learning_path("XML") is None
+
+
+def test_index_rebuilds_on_version_change_and_matches_qa():
+    conn = MemoryConnection()
+    entities = [{"name": name, "label": "Concept"} for name in ("RDF", "RDFS", "OWL")]
+    relations = [{"head": head, "head_label": "Concept", "type": "REQUIRES_PRE", "tail": tail,
+                  "tail_label": "Concept"} for head, tail in [("RDFS", "RDF"), ("OWL", "RDFS")]]
+    data_loader.load_delta(conn, entities, relations, max_workers=1)
+    data_loader.load_prerequisite_closure(conn, max_workers=1)
+
+    index = PrerequisiteIndex(conn, refresh_interval=0).start()
+    assert index.prerequisites("OWL", with_depth=True) == qa_system.find_prerequisites(conn, "OWL", with_depth=True)
+    assert index.refresh() is False
+
+    data_loader.load_delta(conn, entities, relations[:1], max_workers=1)
+    assert index.refresh() is True
+    assert index.prerequisites("OWL") is None
+    assert index.prerequisites("RDFS") == ["RDF"]
@@ -0,0 +1,39 @@
+from kg_course_project.graph_db.query_cache import QueryCache
+
+
+def test_entries_are_invalidated_by_graph_version():
+    cache = QueryCache(version_check_interval=0)
+    key = QueryCache.make_key("MATCH (n) RETURN n", {"name": "RDF"}, "neo4j")
+    version = cache.current_version(lambda: 1)
+    cache.put(key, version, ["RDF"])
+    assert cache.get(key, version) == (True, ["RDF"])
+
+    version = cache.current_version(lambda: 2)
+    assert cache.get(key, version) == (False, None)
+    assert cache.stats()["entries"] == 0
+
+
+def test_stale_fetch_does_not_roll_back_version():
+    cache = QueryCache(version_check_interval=0)
+
+    def slow_fetch():
+        # 读线程取到旧版本号之前, 写线程已经 set_version 了新的版本号
+        cache.set_version(5)
+        return 4
+
+    assert cache.current_version(slow_fetch) == 5
+    key = QueryCache.make_key("RETURN 1", None, "neo4j")
+    cache.put(key, 5, [1])
+    assert cache.current_version(lambda: 4) == 5
+    assert cache.get(key, 5) == (True, [1])
+
+
+def test_lru_eviction_respects_max_entries():
+    cache = QueryCache(max_entries=2, version_check_interval=0)
+    version = cache.current_version(lambda: 1)
+    keys = [QueryCache.make_key("RETURN $i", {"i": i}, "neo4j") for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, version, [i])
+    assert cache.get(keys[0], version) == (False, None)
+    assert cache.get(keys[2], version) == (True, [2])
+    assert cache.evictions == 1
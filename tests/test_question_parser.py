@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+from kg_course_project.applications import qa_system
+from kg_course_project.applications.question_parser import AhoCorasick, QuestionParser
+from kg_course_project.graph_db import data_loader
+from kg_course_project.graph_db.memory_graph import MemoryConnection
+
+NODES = [("Concept", "RDF"), ("Concept", "RDFS"), ("Concept", "OWL"), ("Concept", "知识图谱"),
+         ("Concept", "知识"), ("Chapter", "第一章"), ("Algorithm", "TransE")]
+
+
+def test_automaton_matches_brute_force():
+    rng = random.Random(0)
+    for _ in range(50):
+        # 小字母表, 模式之间大量重叠 (互为前缀/后缀/子串)
+        patterns = {"".join(rng.choice("abc") for _ in range(rng.randint(1, 4))) for _ in range(8)}
+        text = "".join(rng.choice("abcd") for _ in range(40))
+        automaton = AhoCorasick((pattern, pattern) for pattern in patterns)
+        expected = sorted((i, i + len(p), p) for p in patterns for i in range(len(text)) if text.startswith(p, i))
+        assert sorted(automaton.iter_matches(text)) == expected
+
+
+def test_empty_patterns_are_ignored():
+    automaton = AhoCorasick([("", "empty"), ("a", "a")])
+    assert list(automaton.iter_matches("aa")) == [(0, 1, "a"), (1, 2, "a")]
+
+
+def test_linking_prefers_leftmost_longest_whole_words():
+    parser = QuestionParser(NODES)
+    names = lambda question: [c[0][1] for _, _, c in parser.link_entities(question)]
+    assert names("RDFS 和 rdf 的区别") == ["RDFS", "RDF"]
+    assert names("RDFXML 是什么") == []
+    assert names("知识图谱的基础") == ["知识图谱"]
+    assert names("学习OWL") == ["OWL"]
+
+
+@pytest.mark.parametrize("question, intent, entity", [
+    ("学习 OWL 需要哪些前置知识?", "prerequisites", "OWL"),
+    ("学完 RDF 之后学什么", "dependents", "RDF"),
+    ("学完RDF之后学什么", "dependents", "RDF"),
+    ("RDFS 的学习路径", "learning_path", "RDFS"),
+    ("知识图谱在哪一章", "concept_chapter", "知识图谱"),
+    ("第一章讲了什么", "chapter_concepts", "第一章"),
+    ("OWL 用到哪些算法", "algorithms", "OWL"),
+    ("RDF", "prerequisites", "RDF"),
+    ("第一章", "chapter_concepts", "第一章"),
+])
+def test_intents(question, intent, entity):
+    parsed = QuestionParser(NODES).parse(question)
+    assert (parsed["intent"], parsed["entity"]) == (intent, entity)
+    assert parsed["signature"] == (intent, parsed["label"])
+    if intent in qa_system.INTENT_PLANS:
+        assert qa_system.plan_for(*parsed["signature"])
+
+
+def test_entity_names_do_not_trigger_intents():
+    # "基础" 是前置知识的触发词, 但它出现在实体名中时不算
+    parser = QuestionParser(NODES + [("Chapter", "基础篇")])
+    assert parser.parse("基础篇包含哪些内容")["intent"] == "chapter_concepts"
+
+
+def test_unparsed_questions_and_rendering():
+    parser = QuestionParser(NODES)
+    assert parser.parse("今天天气怎么样") == {"intent": None, "entity": None, "label": None,
+                                            "mentions": [], "signature": None}
+    # 只有不能作为任何意图实体的标签
+    assert parser.parse("TransE")["intent"] is None
+    parsed = parser.parse("OWL 的前置知识")
+    assert parser.render(parsed, ["RDFS", "RDF"]) == "学习 'OWL' 的前置知识包括: RDFS, RDF"
+    assert parser.render(parsed, []) == "未找到 'OWL' 的前置知识，或该概念不存在。"
+
+
+def test_parser_from_the_memory_graph():
+    conn = MemoryConnection()
+    data_loader.load_entities(conn, [{"name": name, "label": label} for label, name in NODES], max_workers=1)
+    parser = QuestionParser.from_connection(conn, version=3)
+    assert parser.version == 3
+    assert parser.parse("TransE 属于哪一章")["mentions"] == ["TransE"]
@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from kg_course_project.applications import recommender
+
+pytestmark = pytest.mark.skipif(not recommender.SCIPY_AVAILABLE, reason="需要 numpy 和 scipy")
+np = pytest.importorskip("numpy")
+
+
+def _random_graph(seed, n=30):
+    """随机的无环前置关系 (编号大的依赖编号小的) 和一个章节"""
+    rng = random.Random(seed)
+    nodes = [("Concept", f"c{i}") for i in range(n)] + [("Chapter", "ch")]
+    edges = {("Concept", f"c{i}", "REQUIRES_PRE", "Concept", f"c{rng.randrange(i)}")
+             for i in range(1, n) for _ in range(rng.randrange(3))}
+    edges |= {("Chapter", "ch", "INCLUDES_CONCEPT", "Concept", f"c{i}") for i in range(0, n, 5)}
+    return nodes, sorted(edges)
+
+
+def _power_iteration(model, seed_column, iterations=500):
+    """逐列的幂迭代 (参照实现)"""
+    restart = seed_column / seed_column.sum()
+    rank = restart.copy()
+    for _ in range(iterations):
+        rank = model.alpha * (model.transition @ rank)
+        rank += (1.0 - rank.sum()) * restart
+    return rank
+
+
+def test_batched_pagerank_matches_per_student_iteration():
+    nodes, edges = _random_graph(0)
+    model = recommender.LearningPathRecommender(nodes, edges, tol=1e-9, max_iter=500)
+    seeds = model._indicator([["c0"], ["c3", "c7"], ["ch"]], 3)
+    ranks = model.personalized_pagerank(seeds)
+    np.testing.assert_allclose(ranks.sum(axis=0), 1.0, atol=1e-4)
+    for col in range(3):
+        np.testing.assert_allclose(ranks[:, col], _power_iteration(model, seeds[:, col].astype(np.float64)),
+                                   atol=1e-4)
+
+
+def test_paths_never_skip_prerequisites():
+    for seed in range(5):
+        nodes, edges = _random_graph(seed)
+        model = recommender.LearningPathRecommender(nodes, edges)
+        prereqs = {}
+        for _, head, rel_type, _, tail in edges:
+            if rel_type == "REQUIRES_PRE":
+                prereqs.setdefault(head, set()).add(tail)
+        mastered_lists = [["c0"], ["c0", "c1", "c2"], []]
+        for mastered, path in zip(mastered_lists, model.recommend_batch(mastered_lists, path_length=8)):
+            known = set(mastered)
+            for name, _ in path:
+                assert name not in known
+                assert prereqs.get(name, set()) <= known
+                known.add(name)
+
+
+def test_batch_equals_single_recommendations():
+    nodes, edges = _random_graph(1)
+    model = recommender.LearningPathRecommender(nodes, edges)
+    batch = model.recommend_batch([["c0"], ["c0", "c5"]], [["ch"], []], path_length=5, batch_size=1)
+    assert batch[0] == model.recommend(["c0"], ["ch"], path_length=5)
+    assert batch[1] == model.recommend(["c0", "c5"], path_length=5)
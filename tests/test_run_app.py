@@ -0,0 +1,185 @@
+import configparser
+import gzip
+import os
+import runpy
+
+import pytest
+
+from conftest import ROOT
+from kg_course_project.applications import recommender
+from kg_course_project.graph_db import data_loader
+
+CONCEPTS = ["RDF", "RDFS", "OWL", "SPARQL", "知识表示", "知识抽取"]
+PREREQUISITES = [("RDFS", "RDF"), ("OWL", "RDFS"), ("SPARQL", "RDF"), ("知识抽取", "知识表示")]
+
+
+@pytest.fixture(scope="module")
+def app_globals(tmp_path_factory):
+    """在临时目录中以内存图后端启动 run_app, 并加载一个小图"""
+    directory = tmp_path_factory.mktemp("app")
+    config = configparser.ConfigParser()
+    config.read(os.path.join(ROOT, "config.ini"), encoding="utf-8")
+    config["GRAPH"]["BACKEND"] = "memory"
+    config["GRAPH"]["SNAPSHOT_FILE"] = ""
+    config["PATHS"]["CSR_SNAPSHOT_DIR"] = str(directory / "graph_csr")
+    config["APP"]["DAG_REFRESH_INTERVAL"] = "0"
+    for section in ("CACHE", "RESPONSE_CACHE"):
+        config[section]["VERSION_CHECK_INTERVAL"] = "0"
+    with open(directory / "config.ini", "w", encoding="utf-8") as f:
+        config.write(f)
+
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        module = runpy.run_path(os.path.join(ROOT, "run_app.py"), run_name="run_app")
+    finally:
+        os.chdir(cwd)
+
+    conn = module["db_conn"]
+    entities = [{"name": name, "label": "Concept"} for name in CONCEPTS] + [{"name": "第一章", "label": "Chapter"}]
+    relations = [{"head": head, "head_label": "Concept", "type": "REQUIRES_PRE", "tail": tail,
+                  "tail_label": "Concept"} for head, tail in PREREQUISITES]
+    relations.append({"head": "第一章", "head_label": "Chapter", "type": "INCLUDES_CONCEPT", "tail": "RDF",
+                      "tail_label": "Concept"})
+    data_loader.load_delta(conn, entities, relations, max_workers=1)
+    data_loader.load_prerequisite_closure(conn, max_workers=1)
+    module["prerequisite_index"].refresh()
+    return module
+
+
+@pytest.fixture
+def client(app_globals):
+    return app_globals["app"].test_client()
+
+
+@pytest.mark.skipif(not recommender.SCIPY_AVAILABLE, reason="需要 numpy 和 scipy")
+def test_recommend_respects_prerequisites(client):
+    response = client.post("/recommend", json={"students": [{"mastered": ["RDF"]}, {"mastered": []}], "k": 3})
+    assert response.status_code == 200
+    first, second = response.get_json()["results"]
+    concepts = [item["concept"] for item in first]
+    assert "RDF" not in concepts and "OWL" not in concepts[:1]
+    # 什么都没掌握的学生只能从没有前置知识的知识点开始
+    assert second[0]["concept"] in {"RDF", "知识表示"}
+
+
+@pytest.mark.parametrize("body", [
+    {"students": [{"mastered": ["RDF"]}], "k": 0},
+    {"students": [{"mastered": ["RDF"]}], "k": 10 ** 6},
+    {"students": [{"mastered": ["RDF"]}], "k": "3"},
+    {"students": [{"mastered": ["RDF"]}], "k": True},
+    {"students": ["RDF"]},
+    {"students": [{"mastered": "RDF"}]},
+    {"students": [{"mastered": ["RDF"], "goals": [1]}]},
+    {"students": []},
+])
+def test_recommend_rejects_invalid_requests(client, body):
+    assert client.post("/recommend", json=body).status_code == 400
+
+
+def test_suggest_clamps_limit(client):
+    for limit, expected in [(0, 1), (-5, 1), (1, 1), (100, 2)]:
+        response = client.get("/suggest", query_string={"q": "RDF", "limit": limit})
+        assert response.status_code == 200
+        assert len(response.get_json()["suggestions"]) == expected
+
+
+def test_ask_batch_answers_with_depth(client):
+    response = client.post("/ask/batch", json={"names": ["OWL", "OWL", "RDF"], "depth": 1})
+    assert response.status_code == 200
+    answers = response.get_json()["answers"]
+    assert list(answers) == ["OWL", "RDF"]
+    assert answers["OWL"]["data"] == ["RDFS"] and answers["RDF"]["data"] == []
+
+
+@pytest.mark.parametrize("body", [
+    {"names": ["OWL"], "depth": 0},
+    {"names": ["OWL"], "depth": "2"},
+    {"names": ["OWL"], "depth": True},
+    {"names": ["OWL"], "depth": 1.5},
+    {"names": []},
+    {"names": [1]},
+])
+def test_ask_batch_rejects_invalid_requests(client, body):
+    assert client.post("/ask/batch", json=body).status_code == 400
+
+
+def test_ask_batch_caps_the_number_of_names(client, app_globals):
+    limit = app_globals["batch_max_names"]
+    names = [f"c{i}" for i in range(limit)]
+    assert client.post("/ask/batch", json={"names": names + names[:1]}).status_code == 200
+    assert client.post("/ask/batch", json={"names": names + ["extra"]}).status_code == 400
+
+
+def test_conditional_requests_return_304(client):
+    first = client.get("/ask", query_string={"q": "OWL 的前置知识"})
+    assert first.status_code == 200
+    etag, weak = first.get_etag()
+    assert etag and weak
+    assert first.headers["Cache-Control"] == "no-cache" and "Accept-Encoding" in first.headers["Vary"]
+
+    cached = client.get("/ask", query_string={"q": "OWL 的前置知识"}, headers={"If-None-Match": f'W/"{etag}"'})
+    assert cached.status_code == 304 and cached.get_data() == b""
+    assert cached.get_etag() == (etag, True)
+    # 不同的参数是不同的 ETag
+    other = client.get("/ask", query_string={"q": "OWL 的前置知识", "depth": 1})
+    assert other.get_etag()[0] != etag
+
+
+def test_large_responses_are_gzipped_for_clients_that_accept_it(client, app_globals):
+    body = {"names": [f"不存在的知识点{i}" for i in range(60)]}
+    plain = client.post("/ask/batch", json=body)
+    assert len(plain.get_data()) >= app_globals["gzip_min_bytes"]
+    assert "Content-Encoding" not in plain.headers
+
+    compressed = client.post("/ask/batch", json=body, headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+    assert compressed.get_etag() == plain.get_etag()
+
+    small = client.get("/suggest", query_string={"q": "RDF"}, headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in small.headers
+
+
+def test_errors_are_not_cached(client):
+    response = client.get("/ask")
+    assert response.status_code == 400 and response.get_etag() == (None, None)
+
+
+def test_graph_writes_invalidate_cached_responses(client, app_globals):
+    question = {"q": "SHACL 的前置知识"}
+    before = client.get("/ask", query_string=question)
+    etag = before.get_etag()[0]
+
+    conn = app_globals["db_conn"]
+    data_loader.load_entities(conn, [{"name": "SHACL", "label": "Concept"}], max_workers=1)
+    data_loader.load_relations(conn, [{"head": "SHACL", "head_label": "Concept", "type": "REQUIRES_PRE",
+                                       "tail": "RDF", "tail_label": "Concept"}], max_workers=1)
+    data_loader.load_prerequisite_closure(conn, max_workers=1)
+    app_globals["prerequisite_index"].refresh()
+
+    after = client.get("/ask", query_string=question, headers={"If-None-Match": f'W/"{etag}"'})
+    assert after.status_code == 200
+    assert after.get_etag()[0] != etag
+    assert after.get_json()["data"] == ["RDF"] and before.get_json()["data"] != ["RDF"]
+
+
+def test_metrics_endpoint(client):
+    client.get("/ask", query_string={"q": "RDFS 的前置知识"})
+    response = client.get("/metrics")
+    assert response.status_code == 200 and response.mimetype == "text/plain"
+    text = response.get_data(as_text=True)
+    assert 'kg_http_request_duration_seconds_count{route="/ask",method="GET",status="200"}' in text
+    assert "# TYPE kg_db_query_duration_seconds histogram" in text
+    assert 'kg_cache_entries{cache="response"}' in text
+    assert "kg_db_query_info{" in text
+
+
+@pytest.mark.parametrize("depth", ["0", "-1", "x", ""])
+def test_ask_rejects_invalid_depth(client, depth):
+    assert client.get("/ask", query_string={"q": "OWL 的前置知识", "depth": depth}).status_code == 400
+
+
+def test_ask_depth_limits_prerequisites(client):
+    response = client.get("/ask", query_string={"q": "OWL 的前置知识", "depth": 1})
+    assert response.status_code == 200 and response.get_json()["data"] == ["RDFS"]
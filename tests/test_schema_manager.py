@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+from conftest import ROOT
+from kg_course_project.graph_db import data_loader, graph_version, schema_manager
+from kg_course_project.graph_db.memory_graph import MemoryConnection
+from kg_course_project.utils.file_io import read_yaml
+
+SCHEMA = os.path.join(ROOT, "schema.yaml")
+
+
+class FailingConnection(MemoryConnection):
+    """成功删除 fail_after 批之后, 下一批删除抛出错误 (模拟清空过程中连接中断)"""
+
+    def __init__(self, fail_after):
+        super().__init__()
+        self.fail_after = fail_after
+
+    def write(self, query, parameters=None, database="neo4j"):
+        if "DELETE" in query:
+            if self.fail_after == 0:
+                raise RuntimeError("连接中断")
+            self.fail_after -= 1
+        return super().write(query, parameters, database)
+
+
+def _populate(conn, n=10):
+    entities = [{"name": f"C{i}", "label": "Concept"} for i in range(n)]
+    relations = [{"head": f"C{i + 1}", "head_label": "Concept", "type": "REQUIRES_PRE",
+                  "tail": f"C{i}", "tail_label": "Concept"} for i in range(n - 1)]
+    data_loader.load_entities(conn, entities, max_workers=1)
+    data_loader.load_relations(conn, relations, max_workers=1)
+    return graph_version.get_graph_version(conn)
+
+
+def test_loop_mode_clears_in_batches_and_keeps_graph_meta():
+    conn = MemoryConnection()
+    version = _populate(conn)
+    stats = schema_manager.clear_database(conn, confirm=True, batch_size=3)
+    assert stats["completed"] is True
+    assert (stats["nodes_deleted"], stats["relationships_deleted"]) == (10, 9)
+    assert not conn.graph.label_index.get("Concept")
+    assert graph_version.get_graph_version(conn) == version + 1
+
+
+def test_deadline_leaves_clear_incomplete():
+    conn = MemoryConnection()
+    _populate(conn)
+    stats = schema_manager.clear_database(conn, confirm=True, batch_size=3, deadline_seconds=0)
+    assert stats["completed"] is False
+
+
+def test_errors_are_raised_after_bumping_graph_version():
+    conn = FailingConnection(fail_after=2)
+    version = _populate(conn)
+    with pytest.raises(RuntimeError):
+        schema_manager.clear_database(conn, confirm=True, batch_size=3)
+    # 已删除的两批关系改变了图
+    assert graph_version.get_graph_version(conn) == version + 1
+
+
+def test_clear_requires_confirmation():
+    with pytest.raises(ValueError):
+        schema_manager.clear_database(MemoryConnection())
+
+
+def test_unknown_mode_is_rejected_before_deleting(caplog):
+    conn = MemoryConnection()
+    version = _populate(conn)
+    with pytest.raises(ValueError):
+        schema_manager.clear_database(conn, confirm=True, mode="truncate")
+    assert graph_version.get_graph_version(conn) == version
+    assert len(conn.graph.nodes) > 1
+    assert "清空数据库时出错" not in caplog.text
+
+
+def test_apply_schema_only_creates_missing_items():
+    conn = MemoryConnection()
+    # 旧版本创建的约束名称不同, 按签名识别为已存在
+    conn.run_query("CREATE CONSTRAINT legacy_concept_name IF NOT EXISTS FOR (c:Concept) REQUIRE c.name IS UNIQUE")
+    desired = schema_manager.desired_schema(read_yaml(SCHEMA))
+
+    created = schema_manager.apply_schema_from_yaml(conn, SCHEMA)
+    assert created == len(desired) - 1
+    assert "uniq_Concept_name" not in {r["name"] for r in conn.run_query("SHOW CONSTRAINTS")}
+    assert schema_manager.plan_schema(conn, SCHEMA) == []
+    assert schema_manager.apply_schema_from_yaml(conn, SCHEMA) == 0
+
+
+def test_relationship_and_composite_indexes():
+    schema = {
+        "nodes": [{"label": "Student", "properties": [{"name": "country"}, {"name": "age"}],
+                   "indexes": [{"properties": ["country", "age"]}]}],
+        "relationships": [{"type": "REQUIRES_PRE", "properties": [
+            {"name": "created_at", "index": "simple"}, {"name": "evidence", "index": "fulltext"},
+            {"name": "source"}], "indexes": [{"properties": ["source", "created_at"]}]}],
+    }
+    items = {item["signature"]: item for item in schema_manager.desired_schema(schema)}
+    assert set(items) == {
+        ("RANGE", "NODE", ("Student",), ("country", "age")),
+        ("RANGE", "RELATIONSHIP", ("REQUIRES_PRE",), ("created_at",)),
+        ("FULLTEXT", "RELATIONSHIP", ("REQUIRES_PRE",), ("evidence",)),
+        ("RANGE", "RELATIONSHIP", ("REQUIRES_PRE",), ("source", "created_at")),
+    }
+
+    # 生成的 CREATE 语句创建的索引与签名一致 (复合索引保持属性顺序)
+    conn = MemoryConnection()
+    for item in items.values():
+        conn.run_query(item["query"])
+    assert schema_manager.existing_schema(conn) == set(items)
+
+
+def test_unknown_index_type_is_skipped():
+    schema = {"nodes": [{"label": "Concept", "properties": [{"name": "name", "index": "hash"}]}]}
+    assert schema_manager.desired_schema(schema) == []
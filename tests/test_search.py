@@ -0,0 +1,82 @@
+import os
+import random
+
+from conftest import ROOT
+from kg_course_project.applications.search import FulltextSearch, NameSuggester, PrefixTrie, escape_lucene
+from kg_course_project.graph_db import data_loader, schema_manager
+from kg_course_project.graph_db.memory_graph import MemoryConnection
+
+SCHEMA = os.path.join(ROOT, "schema.yaml")
+LEGACY_INDEX = "CREATE FULLTEXT INDEX ft_idx_Concept_description IF NOT EXISTS FOR (n:Concept) ON EACH [n.description]"
+
+
+def test_trie_matches_brute_force_ranking():
+    rng = random.Random(0)
+    alphabet = "abc 知识"
+    names = {"".join(rng.choice(alphabet) for _ in range(rng.randint(1, 6))).strip() or "a" for _ in range(300)}
+    weights = {name: rng.randrange(5) for name in names}
+    trie = PrefixTrie(top_k=5)
+    for name in names:
+        trie.insert(name, "Concept", weights[name])
+    trie.finalize()
+
+    for prefix in ["a", "ab", "知", "知识", "c a", "zz"]:
+        matching = {name for name in names if any(key.startswith(prefix) for key in PrefixTrie.keys(name))}
+        expected = sorted(matching, key=lambda n: (-weights[n], len(n), n))[:5]
+        assert [name for name, _ in trie.complete(prefix)] == expected
+
+
+def test_suggestions_are_case_insensitive_and_match_later_words():
+    suggester = NameSuggester([("Concept", "Knowledge Graph"), ("Concept", "knowledge base"),
+                               ("Technology", "Neo4j")], degrees={("Concept", "Knowledge Graph"): 3})
+    assert suggester.suggest("KNOW") == [{"name": "Knowledge Graph", "label": "Concept"},
+                                         {"name": "knowledge base", "label": "Concept"}]
+    assert suggester.suggest("gra") == [{"name": "Knowledge Graph", "label": "Concept"}]
+    assert suggester.suggest("know", limit=1) == [{"name": "Knowledge Graph", "label": "Concept"}]
+    assert suggester.suggest("  ") == []
+
+
+def test_lucene_input_is_escaped():
+    assert escape_lucene('RDF AND (OWL)') == r"RDF and \(OWL\)"
+    assert escape_lucene("a:b*") == r"a\:b\*"
+
+
+def _concepts(conn, n=5):
+    data_loader.load_entities(conn, [{"name": f"图谱{i}", "label": "Concept"} for i in range(n)], max_workers=1)
+    # 加载器不写入描述, 直接设置在内存图上
+    for i in range(n):
+        conn.graph.nodes[conn.graph.find_node("Concept", f"图谱{i}")]["props"]["description"] = "知识图谱的一个概念"
+
+
+def test_search_deduplicates_nodes_found_by_several_indexes():
+    conn = MemoryConnection()
+    schema_manager.apply_schema_from_yaml(conn, SCHEMA)
+    conn.run_query(LEGACY_INDEX)  # 旧版本留下的描述索引
+    _concepts(conn)
+    search = FulltextSearch(conn)
+    first = search.search("图谱", page=1, size=3)
+    second = search.search("图谱", page=2, size=3)
+    names = [r["name"] for r in first["results"] + second["results"]]
+    assert sorted(names) == [f"图谱{i}" for i in range(5)]
+    assert first["has_more"] and not second["has_more"]
+
+
+def test_apply_schema_drops_obsolete_fulltext_indexes():
+    conn = MemoryConnection()
+    conn.run_query(LEGACY_INDEX)
+    conn.run_query("CREATE INDEX idx_Concept_level IF NOT EXISTS FOR (n:Concept) ON (n.level)")
+    assert schema_manager.obsolete_fulltext_indexes(conn, SCHEMA) == ["ft_idx_Concept_description"]
+    schema_manager.apply_schema_from_yaml(conn, SCHEMA)
+    names = {r["name"] for r in conn.run_query("SHOW INDEXES")}
+    assert "ft_idx_Concept_description" not in names and "idx_Concept_level" in names
+    assert schema_manager.obsolete_fulltext_indexes(conn, SCHEMA) == []
+
+
+def test_missing_indexes_are_not_cached():
+    conn = MemoryConnection()
+    _concepts(conn, n=1)
+    search = FulltextSearch(conn)
+    assert search.search("图谱")["results"] == []
+    # 应用先于流程启动: 流程创建索引之后, 不需要重启就能搜到
+    schema_manager.apply_schema_from_yaml(conn, SCHEMA)
+    assert [r["name"] for r in search.search("图谱")["results"]] == ["图谱0"]
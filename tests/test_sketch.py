@@ -0,0 +1,51 @@
+import os
+import random
+import subprocess
+import sys
+from collections import Counter
+
+from kg_course_project.extraction import fusion
+from kg_course_project.utils.sketch import CountMinSketch, HeavyHitters
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_count_min_never_underestimates():
+    rng = random.Random(0)
+    keys = [f"实体{rng.randint(0, 500)}" for _ in range(5000)]
+    sketch = CountMinSketch(width=256, depth=4)
+    for key in keys:
+        sketch.add(key)
+    for key, count in Counter(keys).items():
+        assert sketch.estimate(key) >= count
+    assert sketch.total == len(keys)
+
+
+def test_count_min_is_reproducible_across_processes():
+    script = ("from kg_course_project.utils.sketch import CountMinSketch; s = CountMinSketch(width=64, depth=3); "
+              "print(s._positions('知识图谱'), s._positions('RDF'))")
+    outputs = set()
+    for seed in ("1", "2"):
+        env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=ROOT)
+        outputs.add(subprocess.run([sys.executable, "-c", script], env=env, cwd=ROOT,
+                                   capture_output=True, text=True, check=True).stdout)
+    assert len(outputs) == 1
+
+
+def test_heavy_hitters_keeps_most_frequent():
+    hitters = HeavyHitters(capacity=3)
+    counts = Counter()
+    for key in ["a"] * 5 + ["b"] * 4 + ["c"] * 3 + ["d", "e", "a", "f", "b"]:
+        counts[key] += 1
+        hitters.update(key, counts[key], sample=key)
+    assert set(hitters.items) == {"a", "b", "c"}
+
+
+def test_filter_entities_stream_matches_in_memory_filter():
+    entities = ([{"name": "RDF", "label": "Concept"}] * 3 + [{"name": "OWL", "label": "Concept"}]
+                + [{"name": "BERT", "label": "Algorithm"}] * 2 + [{"name": "的", "label": "Concept"}] * 4)
+    expected = fusion.filter_entities(entities)
+    two_pass = list(fusion.filter_entities_stream(lambda: iter(entities), mode="two_pass", width=1024))
+    assert two_pass == expected
+    sketch = list(fusion.filter_entities_stream(iter(entities), width=1024))
+    assert sorted(e["name"] for e in sketch) == ["BERT", "RDF"]